@@ -1,12 +1,54 @@
-from flask import Flask, request, jsonify, render_template
-# Προσθήκη του run_sparql στα imports για να εκτελούμε queries εδώ
-from enovation_recommender import build_ui_payload, run_sparql
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
+from enovation_recommender import (
+    DETAILS_PREFETCH_TOP_K,
+    RECOMMEND_BATCH_MAX_PAIRS,
+    build_ui_page_swr,
+    build_ui_payload_batch_swr,
+    build_ui_payload_swr,
+    get_explanations_for_uris,
+    get_justification_graph_for_uris,
+    get_option_labels,
+    get_uri_for_label,
+    limit_details,
+    ranking_id,
+    stream_ui_payload,
+)
+from precompute import get_precomputed
+from feedback_writer import submit_feedback
+from scoring_profiles import PROFILES, get_profile, rerank
+from instrumentation import INSTRUMENTATION, current_trace, finish_request, render_metrics, start_request
+from warmup import STATE as WARMUP_STATE, start_warmup
+from sparql_client import sync_shared_cache
+import base64
 import json
+import os
 from datetime import datetime
-from pathlib import Path
 
 app = Flask(__name__)
-FEEDBACK_FILE = Path("feedback_log.jsonl")
+
+@app.before_request
+def _start_trace():
+    # Με INSTRUMENTATION=1 κάθε request έχει το δικό του trace (spans, πλήθος queries)
+    if INSTRUMENTATION:
+        start_request(request.url_rule.rule if request.url_rule else "unmatched")
+
+@app.before_request
+def _sync_shared_cache():
+    # Με SHARED_CACHE (πολλοί workers): αν άλλη διεργασία καθάρισε την cache
+    # (π.χ. precompute.py --incremental), πετάμε και τα αποτελέσματα στη μνήμη αυτού του worker
+    sync_shared_cache()
+
+@app.after_request
+def _finish_trace(response):
+    trace = current_trace()
+    if trace is not None:
+        # Για τα streaming responses τα headers δείχνουν μόνο ό,τι έγινε πριν την αποστολή τους·
+        # η συνολική διάρκεια καταγράφεται όταν κλείσει το response
+        response.headers["X-SPARQL-Queries"] = str(trace.queries)
+        response.headers["Server-Timing"] = trace.server_timing()
+        status = response.status_code
+        response.call_on_close(lambda: finish_request(trace, status))
+    return response
 
 @app.route("/")
 def index():
@@ -19,43 +61,11 @@ def api_options():
     Χρησιμοποιούμε φίλτρο για owl:NamedIndividual ώστε να μην φέρνει Κλάσεις (π.χ. DIM Technology)
     αλλά μόνο συγκεκριμένα αντικείμενα.
     """
-    
-    # Query για Τεχνολογίες (μόνο Individuals)
-    q_tech = """
-    PREFIX en: <http://www.semanticweb.org/eNOVATION-ontology#>
-    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-    PREFIX owl: <http://www.w3.org/2002/07/owl#>
-
-    SELECT DISTINCT ?label WHERE {
-      ?s a ?type .
-      ?type rdfs:subClassOf* en:Technology .
-      ?s a owl:NamedIndividual .
-      ?s rdfs:label ?label .
-    } ORDER BY ?label
-    """
 
-    # Query για Σενάρια (μόνο Individuals)
-    q_scen = """
-    PREFIX en: <http://www.semanticweb.org/eNOVATION-ontology#>
-    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-    PREFIX owl: <http://www.w3.org/2002/07/owl#>
-
-    SELECT DISTINCT ?label WHERE {
-      ?s a ?type .
-      ?type rdfs:subClassOf* en:Scenario .
-      ?s a owl:NamedIndividual .
-      ?s rdfs:label ?label .
-    } ORDER BY ?label
-    """
-
-    # Εκτέλεση queries
+    # Τα δύο queries (Τεχνολογίες / Σενάρια) εκτελούνται παράλληλα.
     # Αν αποτύχει η βάση, επιστρέφουμε κενές λίστες για να μην κρασάρει το app
     try:
-        tech_data = run_sparql(q_tech)
-        scen_data = run_sparql(q_scen)
-
-        tech_labels = [b["label"]["value"] for b in tech_data.get("results", {}).get("bindings", [])]
-        scen_labels = [b["label"]["value"] for b in scen_data.get("results", {}).get("bindings", [])]
+        tech_labels, scen_labels = get_option_labels()
     except Exception as e:
         print(f"Error fetching dynamic options: {e}")
         tech_labels = []
@@ -63,19 +73,308 @@ def api_options():
 
     return jsonify({"technologies": tech_labels, "scenarios": scen_labels})
 
+def _top_k_arg(raw=None):
+    """
+    Πόσα κέντρα (από την κορυφή της κατάταξης) επιστρέφονται με επεξηγήσεις / paths.
+    ?top_k=all -> όλα, χωρίς παράμετρο -> DETAILS_PREFETCH_TOP_K.
+    Το raw (π.χ. από JSON body) αντικαθιστά το ?top_k.
+    """
+    if raw is None:
+        raw = request.args.get("top_k")
+    if raw is None or raw == "":
+        return DETAILS_PREFETCH_TOP_K
+    if str(raw).lower() == "all":
+        return None
+    return max(int(raw), 0)
+
+def _profile_arg():
+    """Όνομα του scoring profile (?profile=...), ή None για το default. KeyError αν δεν υπάρχει."""
+    name = request.args.get("profile") or None
+    get_profile(name)
+    return name
+
+def _page_args():
+    """
+    Σελιδοποίηση του /api/recommend: dict με tech, scen, profile, offset, limit, ranking,
+    από τα ?limit= / ?offset= ή από το ?cursor= (next_cursor της προηγούμενης σελίδας).
+    None αν δεν ζητήθηκε σελίδα. ValueError / KeyError / TypeError για άκυρες τιμές.
+    """
+    cursor = request.args.get("cursor")
+    if cursor:
+        # Ο cursor κρατά το ζεύγος, το profile και το id της κατάταξης, ώστε όλες οι σελίδες
+        # να προέρχονται από την ίδια βαθμολογημένη κατάταξη
+        page = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        page = {k: page[k] for k in ("tech", "scen", "profile", "offset", "limit", "ranking")}
+    else:
+        raw_limit = request.args.get("limit")
+        raw_offset = request.args.get("offset")
+        if not raw_limit and not raw_offset:
+            return None
+        page = {
+            "tech": request.args.get("tech"),
+            "scen": request.args.get("scen"),
+            "profile": request.args.get("profile") or None,
+            "offset": int(raw_offset) if raw_offset else 0,
+            "limit": int(raw_limit) if raw_limit else DETAILS_PREFETCH_TOP_K,
+            "ranking": None,
+        }
+    if not isinstance(page["offset"], int) or not isinstance(page["limit"], int) or page["offset"] < 0 or page["limit"] < 1:
+        raise ValueError("invalid page")
+    return page
+
+def _encode_cursor(page, offset, ranking):
+    state = dict(page, offset=offset, ranking=ranking)
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+def _recommend_page(page):
+    """
+    Μία σελίδα της κατάταξης: μόνο τα κέντρα offset .. offset + limit, με επεξηγήσεις / paths.
+    Μαζί total, next_cursor (None στην τελευταία σελίδα) και ranking_id.
+    """
+    tech, scen, profile = page["tech"], page["scen"], page["profile"]
+    offset, limit = page["offset"], page["limit"]
+    stored = get_precomputed(tech, scen)
+    if stored is not None:
+        ranked = rerank(stored, profile)
+        out = {
+            "ranking_id": ranking_id(ranked, get_profile(profile).rank_by),
+            "total": len(ranked),
+            "offset": offset,
+            "results": ranked[offset:offset + limit],
+        }
+    else:
+        # Η σελίδα μοιράζεται με άλλα requests (stale-while-revalidate): αντίγραφο πριν αλλάξει
+        out, stale = build_ui_page_swr(tech, scen, offset=offset, limit=limit, profile=profile)
+        out = dict(out, stale=True) if stale else dict(out)
+    if page["ranking"] and out["ranking_id"] != page["ranking"]:
+        return None
+    out["limit"] = limit
+    next_offset = offset + len(out["results"])
+    out["next_cursor"] = _encode_cursor(page, next_offset, out["ranking_id"]) if next_offset < out["total"] else None
+    return out
+
+@app.route("/api/profiles", methods=["GET"])
+def api_profiles():
+    profiles = []
+    for name in PROFILES.names():
+        try:
+            profiles.append(get_profile(name).describe())
+        except KeyError:
+            continue
+    return jsonify({"default": get_profile().name, "profiles": profiles})
+
 @app.route("/api/recommend", methods=["GET"])
 def api_recommend():
+    """
+    Κατάταξη των κέντρων για το ζεύγος tech / scen.
+    Με ?limit= (και ?offset=) επιστρέφεται μόνο μία σελίδα, με next_cursor για την επόμενη
+    (?cursor=...)· χωρίς αυτά, όλα τα κέντρα με επεξηγήσεις για τα πρώτα top_k.
+    """
+    try:
+        page = _page_args()
+    except (ValueError, KeyError, TypeError):
+        return jsonify({"error": "Invalid 'limit', 'offset' or 'cursor' parameter"}), 400
+    if page is not None:
+        if not page["tech"] or not page["scen"]:
+            return jsonify({"error": "Missing 'tech' or 'scen' parameter"}), 400
+        try:
+            get_profile(page["profile"])
+        except KeyError:
+            return jsonify({"error": "Unknown scoring profile"}), 400
+        try:
+            out = _recommend_page(page)
+        except Exception as e:
+            print("[/api/recommend] ERROR:", e)
+            return jsonify({"error": "Internal error in recommender"}), 500
+        if out is None:
+            # Τα δεδομένα άλλαξαν μετά την πρώτη σελίδα: ο client ξεκινά από την αρχή
+            return jsonify({"error": "Ranking changed since the first page, request it again without 'cursor'"}), 409
+        return jsonify(out)
+
     tech = request.args.get("tech")
     scen = request.args.get("scen")
     if not tech or not scen:
         return jsonify({"error": "Missing 'tech' or 'scen' parameter"}), 400
     try:
-        results = build_ui_payload(tech, scen)
+        top_k = _top_k_arg()
+    except ValueError:
+        return jsonify({"error": "Invalid 'top_k' parameter"}), 400
+    try:
+        profile = _profile_arg()
+    except KeyError:
+        return jsonify({"error": "Unknown scoring profile"}), 400
+    try:
+        # Προϋπολογισμένα αποτελέσματα (precompute.py), αν το store είναι ενημερωμένο.
+        # Βαθμολογούνται ξανά από τα raw counts με το ζητούμενο profile, χωρίς queries.
+        results = get_precomputed(tech, scen)
+        if results is not None:
+            return jsonify({"results": limit_details(rerank(results, profile), top_k)})
+        # Τελευταίο καλό αποτέλεσμα (stale-while-revalidate): αν έχει λήξει, επιστρέφεται
+        # με "stale": true όσο υπολογίζεται ξανά στο background, π.χ. όταν το Fuseki δεν απαντά
+        results, stale = build_ui_payload_swr(tech, scen, top_k=top_k, profile=profile)
+        if stale:
+            return jsonify({"results": results, "stale": True})
         return jsonify({"results": results})
     except Exception as e:
         print("[/api/recommend] ERROR:", e)
         return jsonify({"error": "Internal error in recommender"}), 500
 
+@app.route("/api/recommend/batch", methods=["POST"])
+def api_recommend_batch():
+    """
+    Πολλά ζεύγη σε ένα request:
+    {"pairs": [{"tech": ..., "scen": ...}, ...], "top_k": ..., "profile": ...}
+    Απάντηση: {"results": [{"tech", "scen", "results": [...]}, ...]} με τη σειρά των pairs
+    ("stale": true στα ζεύγη που σερβίρονται από παλιό αποτέλεσμα, όπως στο /api/recommend).
+    Κάθε label επιλύεται μία φορά, τα διπλά ζεύγη υπολογίζονται μία φορά και τα counts
+    όλων των ζευγών προκύπτουν από κοινά queries (VALUES ?selTech / ?scenario).
+    """
+    try:
+        data = request.get_json(force=True) or {}
+    except Exception:
+        return jsonify({"error": "Invalid JSON"}), 400
+    pairs = data.get("pairs") if isinstance(data, dict) else None
+    if not isinstance(pairs, list) or not pairs:
+        return jsonify({"error": "Missing 'pairs' list"}), 400
+    if len(pairs) > RECOMMEND_BATCH_MAX_PAIRS:
+        return jsonify({"error": f"At most {RECOMMEND_BATCH_MAX_PAIRS} pairs per batch"}), 400
+    label_pairs = []
+    for pair in pairs:
+        tech = pair.get("tech") if isinstance(pair, dict) else None
+        scen = pair.get("scen") if isinstance(pair, dict) else None
+        if not isinstance(tech, str) or not isinstance(scen, str) or not tech or not scen:
+            return jsonify({"error": "Every pair needs 'tech' and 'scen'"}), 400
+        label_pairs.append((tech, scen))
+    try:
+        top_k = _top_k_arg(data.get("top_k"))
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid 'top_k' parameter"}), 400
+    profile = data.get("profile") or None
+    try:
+        get_profile(profile)
+    except (KeyError, TypeError):
+        return jsonify({"error": "Unknown scoring profile"}), 400
+    try:
+        # Ζεύγη που υπάρχουν στο precomputed store δεν χρειάζονται queries· τα υπόλοιπα
+        # περνούν από την ίδια stale-while-revalidate cache με το /api/recommend
+        results = {}
+        for pair in dict.fromkeys(label_pairs):
+            stored = get_precomputed(*pair)
+            if stored is not None:
+                results[pair] = limit_details(rerank(stored, profile), top_k), False
+        live = [pair for pair in dict.fromkeys(label_pairs) if pair not in results]
+        if live:
+            results.update(build_ui_payload_batch_swr(live, top_k=top_k, profile=profile))
+        out = []
+        for t, s in label_pairs:
+            items, stale = results[(t, s)]
+            entry = {"tech": t, "scen": s, "results": items}
+            if stale:
+                entry["stale"] = True
+            out.append(entry)
+        return jsonify({"results": out})
+    except Exception as e:
+        print("[/api/recommend/batch] ERROR:", e)
+        return jsonify({"error": "Internal error in recommender"}), 500
+
+@app.route("/api/recommend/stream", methods=["GET"])
+def api_recommend_stream():
+    """
+    Ίδια αποτελέσματα με το /api/recommend, ως NDJSON (ένα JSON μήνυμα ανά γραμμή):
+    πρώτα η κατάταξη με τα scores και μετά οι επεξηγήσεις / justification paths
+    κάθε ομάδας κέντρων μόλις ολοκληρωθεί το αντίστοιχο query. Αν υπάρχει ήδη
+    αποτέλεσμα στην cache του /api/recommend, στέλνεται ολόκληρο στο μήνυμα της κατάταξης.
+    """
+    tech = request.args.get("tech")
+    scen = request.args.get("scen")
+    if not tech or not scen:
+        return jsonify({"error": "Missing 'tech' or 'scen' parameter"}), 400
+    try:
+        top_k = _top_k_arg()
+    except ValueError:
+        return jsonify({"error": "Invalid 'top_k' parameter"}), 400
+    try:
+        profile = _profile_arg()
+    except KeyError:
+        return jsonify({"error": "Unknown scoring profile"}), 400
+
+    def generate():
+        try:
+            results = get_precomputed(tech, scen)
+            if results is not None:
+                results = limit_details(rerank(results, profile), top_k)
+                head = sum(1 for r in results if r.get("details_loaded", True))
+                messages = [{"type": "ranking", "results": results, "top_k": head}, {"type": "done"}]
+            else:
+                messages = stream_ui_payload(tech, scen, top_k=top_k, profile=profile)
+            for msg in messages:
+                yield json.dumps(msg, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print("[/api/recommend/stream] ERROR:", e)
+            yield json.dumps({"type": "error", "error": "Internal error in recommender"}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+def _center_args():
+    """(tech_uri, scen_uri, center_uri, error_response) από τα tech / scen / center_uri του request."""
+    tech = request.args.get("tech")
+    scen = request.args.get("scen")
+    center_uri = request.args.get("center_uri")
+    if not tech or not scen or not center_uri:
+        return None, None, None, (jsonify({"error": "Missing 'tech', 'scen' or 'center_uri' parameter"}), 400)
+    tech_uri = get_uri_for_label(tech)
+    scen_uri = get_uri_for_label(scen)
+    if not tech_uri or not scen_uri:
+        return None, None, None, (jsonify({"error": "Unknown technology or scenario"}), 404)
+    return tech_uri, scen_uri, center_uri, None
+
+@app.route("/api/explain", methods=["GET"])
+def api_explain():
+    """Επεξηγήσεις ενός κέντρου, κατ' απαίτηση (όταν ο χρήστης ανοίξει την κάρτα)."""
+    tech_uri, scen_uri, center_uri, error = _center_args()
+    if error:
+        return error
+    try:
+        explanations = get_explanations_for_uris(tech_uri, scen_uri, center_uri)
+        return jsonify({"center_uri": center_uri, "explanations_simple": explanations})
+    except Exception as e:
+        print("[/api/explain] ERROR:", e)
+        return jsonify({"error": "Internal error in recommender"}), 500
+
+@app.route("/api/justification", methods=["GET"])
+def api_justification():
+    """Justification graph (edges + paths) ενός κέντρου, κατ' απαίτηση."""
+    tech_uri, scen_uri, center_uri, error = _center_args()
+    if error:
+        return error
+    try:
+        graph = get_justification_graph_for_uris(tech_uri, scen_uri, center_uri)
+        return jsonify({"center_uri": center_uri, "edges": graph["edges"], "graph_paths": graph["paths"]})
+    except Exception as e:
+        print("[/api/justification] ERROR:", e)
+        return jsonify({"error": "Internal error in recommender"}), 500
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics (latency histograms ανά endpoint / query template, cache hit rate)."""
+    if not INSTRUMENTATION:
+        return jsonify({"error": "Instrumentation is disabled (set INSTRUMENTATION=1)"}), 404
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """
+    Readiness για τον load balancer: 200 όταν τελειώσει το warm-up (warmup.py), αλλιώς 503
+    (και όταν έληξε "degraded", π.χ. χωρίς label index ή επιλογές).
+    Το σώμα δείχνει την πρόοδο κάθε βήματος.
+    """
+    if WARMUP_STATE.status in ("pending", "degraded"):
+        # π.χ. υπό WSGI server, όπου δεν εκτελείται το __main__ παρακάτω· μετά από
+        # "degraded" το start_warmup ξαναδοκιμάζει κάθε WARMUP_RETRY_AFTER δευτερόλεπτα
+        start_warmup()
+    state = WARMUP_STATE.describe()
+    return jsonify(state), 200 if state["ready"] else 503
+
 @app.route("/api/feedback", methods=["POST"])
 def api_feedback():
     try:
@@ -101,14 +400,21 @@ def api_feedback():
         "scores": scores,
     }
 
+    # Η εγγραφή στο αρχείο γίνεται από το background thread του feedback_writer
     try:
-        with FEEDBACK_FILE.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        submit_feedback(record)
     except Exception as e:
-        print("[/api/feedback] ERROR writing file:", e)
+        print("[/api/feedback] ERROR queueing feedback:", e)
         return jsonify({"error": "Could not save feedback"}), 500
 
     return jsonify({"status": "ok"})
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    # Server ανάπτυξης μόνο· σε production: gunicorn -c gunicorn.conf.py wsgi:app.
+    # Debug / reloader μόνο με FLASK_DEBUG=1.
+    debug = os.getenv("FLASK_DEBUG", "0") == "1"
+    # Με τον reloader το script τρέχει δύο φορές (επιτηρητής + server)· warm-up μόνο στον server
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        # Warm-up (label index, επιλογές, URIs, συχνά ζεύγη) πριν / παράλληλα με τα πρώτα requests
+        start_warmup()
+    app.run(host=os.getenv("WEB_HOST", "0.0.0.0"), port=int(os.getenv("WEB_PORT", "5000")), debug=debug)
\ No newline at end of file
@@ -0,0 +1,217 @@
+"""
+Benchmark: engine query strategies as per-centre fan-out grows.
+
+``ENGINE_QUERY_TEMPLATE`` (strategy ``single``) joins the eight criteria as
+OPTIONALs of one group, so before ``COUNT(DISTINCT ...)`` each centre has
+as many rows as the product of its matches per criterion.  ``subquery`` and
+``split`` count every criterion on its own (see ``ENGINE_QUERY_STRATEGY``).
+
+For every value of ``--fanouts`` a synthetic graph is generated with all
+per-centre link counts multiplied by it (``synthetic_ontology.py
+--fanout``) and served in-process (``SPARQL_BACKEND=local``, result cache
+off), one interpreter per graph.  Per strategy it reports:
+
+* p50 / p95 latency of ``engine_rows`` for random technology/scenario pairs
+* ``server_ms``: time spent evaluating the queries (summed over the
+  queries of a call, so parallel ``split`` queries add up)
+* queries per call
+* ``intermediate_rows``: rows the query has to produce before grouping,
+  i.e. the OPTIONAL product for ``single`` and the sum over the
+  per-criterion patterns for ``subquery`` / ``split``
+
+and first checks that ``subquery`` and ``split`` return exactly the counts
+of ``single`` for every pair measured (``check_engine_parity``).
+
+Usage:  python benchmarks/bench_engine_fanout.py --fanouts 1,2,4 --out fanout.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, HERE)
+
+from bench_recommend import git_commit, percentile  # noqa: E402
+from synthetic_ontology import write_turtle  # noqa: E402
+
+STRATEGIES = ("single", "subquery", "split")
+
+
+def graph_params(centres, fanout, seed):
+    return {
+        "centres": centres,
+        "technologies": 12,
+        "tech_depth": 3,
+        "courses": 3,
+        "incidents": 8 * fanout,
+        "threats": 6,
+        "facilities": 2,
+        "scenarios": 4,
+        "disciplines": 4 * fanout,
+        "networks": 3 * fanout,
+        "fanout": fanout,
+        "seed": seed,
+    }
+
+
+class BackendTimer:
+    """
+    Counts queries and the time the local backend spends evaluating them.
+
+    Queries are evaluated one at a time under the backend's query lock, so
+    the time is taken while the lock is held (waiting for it is not counted).
+    """
+
+    def __init__(self, backend):
+        self.queries = 0
+        self.seconds = 0.0
+        self._lock = backend._query_lock
+        self._held = threading.local()
+        backend._query_lock = self
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._held.since = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds += time.perf_counter() - self._held.since
+        self.queries += 1
+        self._lock.release()
+        return False
+
+
+def _count_rows(query):
+    from sparql_client import run_sparql_table
+
+    table = run_sparql_table(query, cache=False, name="bench_rows", int_vars=("rows",))
+    return sum(table.column("rows"))
+
+
+def intermediate_rows(strategy, tech_uri, scen_uri):
+    """Rows produced before GROUP BY for one pair."""
+    from enovation_recommender import (
+        ENGINE_COUNT_VARS,
+        ENGINE_QUERY_TEMPLATE,
+        ENGINE_SPLIT_CENTERS_TEMPLATE,
+        ENGINE_SPLIT_TEMPLATES,
+        _fill_engine_template,
+    )
+
+    if strategy == "single":
+        query = _fill_engine_template(ENGINE_QUERY_TEMPLATE, tech_uri, scen_uri, None)
+        # same WHERE clause, counted instead of grouped
+        query = re.sub(r"SELECT DISTINCT.*?WHERE \{", "SELECT (COUNT(*) AS ?rows) WHERE {", query, count=1, flags=re.S)
+        return _count_rows(query[:query.index("GROUP BY")])
+    total = 0
+    for template in [ENGINE_SPLIT_CENTERS_TEMPLATE] + [ENGINE_SPLIT_TEMPLATES[v] for v in ENGINE_COUNT_VARS]:
+        query = _fill_engine_template(template, tech_uri, scen_uri, None)
+        query = re.sub(r"SELECT .*?WHERE \{", "SELECT (COUNT(*) AS ?rows) WHERE {", query, count=1, flags=re.S)
+        end = query.find("GROUP BY")
+        total += _count_rows(query if end < 0 else query[:end])
+    return total
+
+
+def run_graph(params, iterations, seed):
+    """Benchmark one graph; runs in a fresh interpreter (see ``main``)."""
+    import sparql_client
+    from enovation_recommender import check_engine_parity, engine_rows, get_option_labels, get_uri_for_label
+    from label_index import LABEL_INDEX
+
+    backend = sparql_client.get_backend()
+    backend.graph()
+    LABEL_INDEX.refresh()
+    tech_labels, scen_labels = get_option_labels()
+    rnd = random.Random(seed)
+    pairs = [(get_uri_for_label(rnd.choice(tech_labels)), get_uri_for_label(rnd.choice(scen_labels)))
+             for _ in range(iterations)]
+
+    parity = []
+    for tech_uri, scen_uri in dict.fromkeys(pairs):
+        parity.extend(check_engine_parity(tech_uri, scen_uri))
+
+    timer = BackendTimer(backend)
+    strategies = {}
+    for strategy in STRATEGIES:
+        samples = []
+        queries, seconds = timer.queries, timer.seconds
+        for tech_uri, scen_uri in pairs:
+            t0 = time.perf_counter()
+            engine_rows(tech_uri, scen_uri, strategy=strategy)
+            samples.append(time.perf_counter() - t0)
+        calls = len(pairs)
+        server = (timer.seconds - seconds) / calls
+        samples.sort()
+        strategies[strategy] = {
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "server_ms": server * 1000,
+            "queries_per_call": (timer.queries - queries) / calls,
+            "intermediate_rows": intermediate_rows(strategy, *pairs[0]),
+        }
+    return {
+        "params": params,
+        "triples": len(backend.graph()),
+        "parity_problems": parity[:20],
+        "parity_ok": not parity,
+        "strategies": strategies,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--fanouts", default="1,2,4", help="comma-separated per-centre fan-out multipliers")
+    ap.add_argument("--centres", type=int, default=20)
+    ap.add_argument("--iterations", type=int, default=10, help="pairs per strategy and graph")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="write the results to this JSON file")
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_graph(json.loads(args.worker), args.iterations, args.seed)))
+        return
+
+    graphs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for fanout in (int(s) for s in args.fanouts.split(",") if s.strip()):
+            params = graph_params(args.centres, fanout, args.seed)
+            path = os.path.join(tmp, f"fanout_{fanout}.ttl")
+            write_turtle(path, **params)
+            env = dict(os.environ, SPARQL_BACKEND="local", ONTOLOGY_FILE=path, ONTOLOGY_FORMAT="turtle",
+                       SPARQL_CACHE_SIZE="0", PRECOMPUTED_STORE="", WARMUP="off")
+            cmd = [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(params),
+                   "--iterations", str(args.iterations), "--seed", str(args.seed)]
+            proc = subprocess.run(cmd, cwd=APP_DIR, env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                sys.stderr.write(proc.stderr)
+                raise SystemExit(f"benchmark for fanout {fanout} failed")
+            graphs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    result = {
+        "benchmark": "bench_engine_fanout",
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "iterations": args.iterations,
+        "env": {k: os.environ[k] for k in ("SUBCLASS_INDEX",) if k in os.environ},
+        "graphs": graphs,
+    }
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if not all(g["parity_ok"] for g in graphs):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Benchmark: the recommend pipeline over synthetic ontologies of growing size.
+
+For every size in ``--sizes`` (number of training centres; technologies,
+incidents, threats and scenarios grow with it) a graph is generated with
+``synthetic_ontology.py`` and served in-process (``SPARQL_BACKEND=local``).
+Each size runs in its own interpreter so graphs, caches and peak memory do
+not leak between sizes.  Measured per size:
+
+* ``get_uri_for_label``, ``get_recommendations``, ``get_explanations`` and
+  ``get_justification_graph`` on random technology / scenario / centre labels
+* ``score_items``: normalization + profile scoring of one pair's counts
+  (what ``_normalize_scores`` used to do)
+* ``/api/recommend`` end to end through the Flask test client, with the
+  default ``top_k``, with ``top_k=all``, as a first page of ``--page-size``
+  centres (``limit``) and as the page after it (``cursor``, served from the
+  cached ranking)
+
+and reported as p50/p95/p99 latency, SPARQL queries per call and the
+tracemalloc peak of one call, plus the response size of each
+``/api/recommend`` variant (``payload_kb``).  The result cache is off unless ``--cache`` is
+given, so every call pays for its queries.  Other settings
+(``RECOMMENDER_ENGINE``, ``SUBCLASS_INDEX``, ...) are taken from the
+environment as usual.
+
+Results are printed as JSON and written to ``--out``; ``--compare old.json``
+prints the p50 ratio against an earlier run and exits with 1 if any
+operation got slower than ``--threshold``.
+
+Usage:  python benchmarks/bench_recommend.py --sizes 10,40,100 --out bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, HERE)
+
+from synthetic_ontology import write_turtle  # noqa: E402
+
+
+def size_params(centres, seed):
+    return {
+        "centres": centres,
+        "technologies": max(5, centres // 2),
+        "tech_depth": 3,
+        "courses": 3,
+        "incidents": max(6, centres // 2),
+        "threats": max(4, centres // 5),
+        "facilities": 2,
+        "scenarios": max(3, centres // 10),
+        "disciplines": 5,
+        "networks": max(3, centres // 10),
+        "seed": seed,
+    }
+
+
+def percentile(sorted_samples, q):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_samples:
+        return None
+    k = max(int(round(q / 100.0 * len(sorted_samples) + 0.5)) - 1, 0)
+    return sorted_samples[min(k, len(sorted_samples) - 1)]
+
+
+class QueryCounter:
+    """Counts the queries that reach the backend (i.e. not answered from the cache)."""
+
+    def __init__(self, backend):
+        self.count = 0
+        fetch, fetch_table = backend.fetch, backend.fetch_table
+
+        def counted_fetch(query):
+            self.count += 1
+            return fetch(query)
+
+        def counted_fetch_table(query, int_vars=()):
+            self.count += 1
+            return fetch_table(query, int_vars)
+
+        backend.fetch = counted_fetch
+        backend.fetch_table = counted_fetch_table
+
+
+def measure(fn, args_list, counter):
+    """Latency samples and queries per call over ``args_list``, then one traced call for peak memory."""
+    samples = []
+    before = counter.count
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - t0)
+    queries = (counter.count - before) / len(args_list)
+
+    tracemalloc.start()
+    fn(*args_list[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples.sort()
+    return {
+        "n": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "queries_per_call": queries,
+        "peak_kb": peak / 1024,
+    }
+
+
+def run_size(params, iterations, seed, page_size=3):
+    """Benchmark one graph; runs in a fresh interpreter (see ``main``)."""
+    import resource
+
+    import sparql_client
+    from enovation_recommender import (
+        _bare_items,
+        clear_ranking_cache,
+        get_explanations,
+        get_justification_graph,
+        get_option_labels,
+        get_recommendations,
+        get_uri_for_label,
+        score_items,
+    )
+    from label_index import LABEL_INDEX
+    from app import app
+
+    counter = QueryCounter(sparql_client.get_backend())
+    t0 = time.perf_counter()
+    sparql_client.get_backend().graph()
+    LABEL_INDEX.refresh()
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    tech_labels, scen_labels = get_option_labels()
+    centre_labels = [f"Training Centre {c}" for c in range(params["centres"])]
+    if not tech_labels or not scen_labels:
+        raise SystemExit("synthetic graph produced no technology / scenario options")
+    rnd = random.Random(seed)
+    pairs = [(rnd.choice(tech_labels), rnd.choice(scen_labels)) for _ in range(iterations)]
+    triples = [(t, s, rnd.choice(centre_labels)) for t, s in pairs]
+    labels = [(rnd.choice(tech_labels + scen_labels + centre_labels),) for _ in range(iterations)]
+
+    # counts of each pair, scored afresh on every call
+    counts = [_bare_items(get_recommendations(t, s)) for t, s in pairs]
+    client = app.test_client()
+
+    def score(items):
+        score_items([dict(item, scores=dict(item["scores"])) for item in items])
+
+    payload_kb = {}
+
+    def recommend(tech, scen, top_k="", op="api_recommend"):
+        res = client.get("/api/recommend", query_string={"tech": tech, "scen": scen, "top_k": top_k})
+        if res.status_code != 200:
+            raise RuntimeError(f"/api/recommend returned {res.status_code}")
+        payload_kb[op] = len(res.data) / 1024
+
+    def page(query, op):
+        res = client.get("/api/recommend", query_string=query)
+        if res.status_code != 200:
+            raise RuntimeError(f"/api/recommend returned {res.status_code}")
+        payload_kb[op] = len(res.data) / 1024
+        return res.get_json()
+
+    def first_page(tech, scen):
+        # a first page scores the pair afresh
+        clear_ranking_cache()
+        return page({"tech": tech, "scen": scen, "limit": page_size}, "api_recommend_page")
+
+    def next_page(cursor):
+        page({"cursor": cursor}, "api_recommend_next_page")
+
+    ops = {
+        "get_uri_for_label": (get_uri_for_label, labels),
+        "get_recommendations": (get_recommendations, pairs),
+        "get_explanations": (get_explanations, triples),
+        "get_justification_graph": (get_justification_graph, triples),
+        "score_items": (score, [(items,) for items in counts]),
+        "api_recommend": (recommend, pairs),
+        "api_recommend_all": (recommend, [(t, s, "all", "api_recommend_all") for t, s in pairs]),
+        "api_recommend_page": (first_page, pairs),
+    }
+    measured = {name: measure(fn, args, counter) for name, (fn, args) in ops.items()}
+    # the second page of each pair, from the ranking its first page cached
+    cursors = []
+    for tech, scen in pairs:
+        cursor = page({"tech": tech, "scen": scen, "limit": page_size}, "api_recommend_page")["next_cursor"]
+        if cursor:
+            cursors.append((cursor,))
+    if cursors:
+        measured["api_recommend_next_page"] = measure(next_page, cursors, counter)
+    return {
+        "params": params,
+        "triples": len(sparql_client.get_backend().graph()),
+        "centres_per_pair": sum(len(c) for c in counts) / len(counts),
+        "load_ms": load_ms,
+        "ops": measured,
+        "payload_kb": payload_kb,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True, timeout=10
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(current, baseline_path, threshold):
+    """p50 ratios against an earlier result file; True if nothing regressed past ``threshold``."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    old_sizes = {s["params"]["centres"]: s for s in baseline.get("sizes", [])}
+    ok = True
+    for size in current["sizes"]:
+        old = old_sizes.get(size["params"]["centres"])
+        if old is None:
+            continue
+        for name, stats in size["ops"].items():
+            old_stats = old["ops"].get(name)
+            if not old_stats or not old_stats["p50_ms"]:
+                continue
+            ratio = stats["p50_ms"] / old_stats["p50_ms"]
+            flag = ""
+            if ratio > threshold:
+                flag = "  REGRESSION"
+                ok = False
+            print(
+                f"centres={size['params']['centres']:<5} {name:<24} "
+                f"{old_stats['p50_ms']:9.2f} -> {stats['p50_ms']:9.2f} ms  x{ratio:.2f}{flag}",
+                file=sys.stderr,
+            )
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--sizes", default="10,40,100", help="comma-separated numbers of centres")
+    ap.add_argument("--iterations", type=int, default=20, help="calls per operation and size")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--cache", action="store_true", help="keep the SPARQL result cache on")
+    ap.add_argument("--page-size", type=int, default=3, help="limit of the paginated /api/recommend calls")
+    ap.add_argument("--out", help="write the results to this JSON file")
+    ap.add_argument("--compare", help="earlier result file to compare p50 latencies with")
+    ap.add_argument("--threshold", type=float, default=1.2, help="p50 ratio counted as a regression")
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        params = json.loads(args.worker)
+        print(json.dumps(run_size(params, args.iterations, args.seed, args.page_size)))
+        return
+
+    sizes = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for centres in (int(s) for s in args.sizes.split(",") if s.strip()):
+            params = size_params(centres, args.seed)
+            path = os.path.join(tmp, f"synthetic_{centres}.ttl")
+            write_turtle(path, **params)
+            env = dict(os.environ, SPARQL_BACKEND="local", ONTOLOGY_FILE=path, ONTOLOGY_FORMAT="turtle",
+                       PRECOMPUTED_STORE="", FEEDBACK_LOG=os.path.join(tmp, "feedback.jsonl"))
+            if not args.cache:
+                env["SPARQL_CACHE_SIZE"] = "0"
+            cmd = [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(params),
+                   "--iterations", str(args.iterations), "--seed", str(args.seed), "--page-size", str(args.page_size)]
+            proc = subprocess.run(cmd, cwd=APP_DIR, env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                sys.stderr.write(proc.stderr)
+                raise SystemExit(f"benchmark for {centres} centres failed")
+            # the app modules print progress; the result is the last line
+            sizes.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    result = {
+        "benchmark": "bench_recommend",
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "iterations": args.iterations,
+        "cache": args.cache,
+        "env": {k: os.environ[k] for k in ("RECOMMENDER_ENGINE", "SUBCLASS_INDEX", "SCORING_PROFILE") if k in os.environ},
+        "sizes": sizes,
+    }
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.compare and not compare(result, args.compare, args.threshold):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
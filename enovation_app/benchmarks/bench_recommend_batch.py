@@ -0,0 +1,117 @@
+"""
+Benchmark: N ``/api/recommend`` calls vs one ``POST /api/recommend/batch``.
+
+For every size in ``--sizes`` (number of training centres, graph shaped as
+in ``bench_recommend.py``) a synthetic graph is served in-process
+(``SPARQL_BACKEND=local``, result cache off, one interpreter per size).  For
+each batch size in ``--pairs`` the same random technology/scenario pairs
+are answered once as separate GET calls and once as a single batch, and
+the wall time, pairs per second and SPARQL queries of both are reported.
+The two must return the same rankings; with the default single engine
+query only tie order may differ, so the check runs with
+``ENGINE_QUERY_STRATEGY=split``, whose rows the batch reproduces exactly.
+
+Usage:  python benchmarks/bench_recommend_batch.py --sizes 20,100 --pairs 10,50
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, HERE)
+
+from bench_recommend import QueryCounter, git_commit, size_params  # noqa: E402
+from synthetic_ontology import write_turtle  # noqa: E402
+
+
+def run_size(params, batch_sizes, seed):
+    """Benchmark one graph; runs in a fresh interpreter (see ``main``)."""
+    import sparql_client
+    from app import app
+    from enovation_recommender import get_option_labels
+    from label_index import LABEL_INDEX
+
+    counter = QueryCounter(sparql_client.get_backend())
+    sparql_client.get_backend().graph()
+    LABEL_INDEX.refresh()
+    tech_labels, scen_labels = get_option_labels()
+    client = app.test_client()
+    rnd = random.Random(seed)
+
+    batches = []
+    for n in batch_sizes:
+        pairs = [(rnd.choice(tech_labels), rnd.choice(scen_labels)) for _ in range(n)]
+
+        before, t0 = counter.count, time.perf_counter()
+        separate = [client.get("/api/recommend", query_string={"tech": t, "scen": s}).get_json()["results"] for t, s in pairs]
+        separate_s, separate_q = time.perf_counter() - t0, counter.count - before
+
+        before, t0 = counter.count, time.perf_counter()
+        res = client.post("/api/recommend/batch", json={"pairs": [{"tech": t, "scen": s} for t, s in pairs]})
+        batch = [r["results"] for r in res.get_json()["results"]]
+        batch_s, batch_q = time.perf_counter() - t0, counter.count - before
+
+        batches.append({
+            "pairs": n,
+            "unique_pairs": len(set(pairs)),
+            "separate": {"seconds": separate_s, "pairs_per_s": n / separate_s, "queries": separate_q},
+            "batch": {"seconds": batch_s, "pairs_per_s": n / batch_s, "queries": batch_q},
+            "speedup": separate_s / batch_s,
+            "identical": separate == batch,
+        })
+    return {"params": params, "batches": batches}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--sizes", default="20,100", help="comma-separated numbers of centres")
+    ap.add_argument("--pairs", default="10,50", help="comma-separated batch sizes")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="write the results to this JSON file")
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    batch_sizes = [int(s) for s in args.pairs.split(",") if s.strip()]
+
+    if args.worker:
+        print(json.dumps(run_size(json.loads(args.worker), batch_sizes, args.seed)))
+        return
+
+    sizes = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for centres in (int(s) for s in args.sizes.split(",") if s.strip()):
+            params = size_params(centres, args.seed)
+            path = os.path.join(tmp, f"synthetic_{centres}.ttl")
+            write_turtle(path, **params)
+            env = dict(os.environ, SPARQL_BACKEND="local", ONTOLOGY_FILE=path, ONTOLOGY_FORMAT="turtle",
+                       SPARQL_CACHE_SIZE="0", PRECOMPUTED_STORE="", WARMUP="off", ENGINE_QUERY_STRATEGY="split")
+            cmd = [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(params),
+                   "--pairs", args.pairs, "--seed", str(args.seed)]
+            proc = subprocess.run(cmd, cwd=APP_DIR, env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                sys.stderr.write(proc.stderr)
+                raise SystemExit(f"benchmark for {centres} centres failed")
+            sizes.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    result = {
+        "benchmark": "bench_recommend_batch",
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "sizes": sizes,
+    }
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if not all(b["identical"] for s in sizes for b in s["batches"]):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark: decoding SPARQL results from sparql-results+json vs TSV.
+
+Builds the response bodies Fuseki would send for two result shapes and
+times turning them into the values the recommender uses:
+
+* ``engine``: one row per centre with ``?center ?centerLabel`` and the eight
+  counts (what ``_remote_recommendations`` reads)
+* ``labels``: ``?s ?l`` with language tags (what ``LabelIndex.refresh`` reads)
+
+``json`` is ``json.loads`` plus walking the bindings with ``_get_val`` /
+``_get_int``; ``tsv`` is ``parse_tsv`` over the body in 64 KiB chunks, as
+``HttpBackend.fetch_table`` reads it.  Reported per shape and row count:
+body size, p50 decode time and the tracemalloc peak of one decode.
+
+Usage:  python benchmarks/bench_result_decoding.py --rows 1000,10000,100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from enovation_recommender import ENGINE_COUNT_VARS, _get_int, _get_val  # noqa: E402
+from result_table import iter_lines, parse_tsv  # noqa: E402
+
+EN = "http://www.semanticweb.org/eNOVATION-ontology#"
+XSD_INTEGER = "http://www.w3.org/2001/XMLSchema#integer"
+
+
+def engine_rows(n):
+    for i in range(n):
+        yield [("uri", f"{EN}centre{i}", None), ("literal", f"Training Centre {i}", "en")] + [
+            ("int", str((i * 7 + k) % 13), None) for k in range(len(ENGINE_COUNT_VARS))
+        ]
+
+
+def label_rows(n):
+    for i in range(n):
+        label = f"Entity {i} \"quoted\"" if i % 20 == 0 else f"Entity {i}"
+        yield [("uri", f"{EN}entity{i}", None), ("literal", label, "en" if i % 3 else "el")]
+
+
+SHAPES = {
+    "engine": (["center", "centerLabel", *ENGINE_COUNT_VARS], engine_rows),
+    "labels": (["s", "l"], label_rows),
+}
+
+
+def json_body(names, rows):
+    bindings = []
+    for row in rows:
+        b = {}
+        for name, (kind, value, lang) in zip(names, row):
+            if kind == "uri":
+                b[name] = {"type": "uri", "value": value}
+            elif kind == "int":
+                b[name] = {"type": "literal", "datatype": XSD_INTEGER, "value": value}
+            else:
+                b[name] = {"type": "literal", "xml:lang": lang, "value": value}
+        bindings.append(b)
+    return json.dumps({"head": {"vars": names}, "results": {"bindings": bindings}}).encode("utf-8")
+
+
+def tsv_body(names, rows):
+    lines = ["\t".join("?" + n for n in names)]
+    for row in rows:
+        fields = []
+        for kind, value, lang in row:
+            if kind == "uri":
+                fields.append(f"<{value}>")
+            elif kind == "int":
+                fields.append(value)
+            else:
+                fields.append('"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"@' + lang)
+        lines.append("\t".join(fields))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def decode_json(body, names):
+    data = json.loads(body)
+    out = []
+    for b in data.get("results", {}).get("bindings", []):
+        if names[0] == "center":
+            out.append((_get_val(b, "center"), _get_val(b, "centerLabel"), *(_get_int(b, v) for v in ENGINE_COUNT_VARS)))
+        else:
+            out.append((_get_val(b, "s"), _get_val(b, "l"), b["l"].get("xml:lang", "")))
+    return out
+
+
+def decode_tsv(body, names):
+    chunks = (body[i:i + 65536] for i in range(0, len(body), 65536))
+    table = parse_tsv(iter_lines(chunks), int_vars=ENGINE_COUNT_VARS)
+    if names[0] == "center":
+        return list(table.rows("center", "centerLabel", *ENGINE_COUNT_VARS))
+    return list(zip(table.column("s"), table.column("l"), table.lang("l")))
+
+
+def measure(fn, body, names, iterations):
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn(body, names)
+        samples.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    fn(body, names)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    samples.sort()
+    return {"p50_ms": samples[len(samples) // 2] * 1000, "peak_kb": peak / 1024}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--rows", default="1000,10000,100000", help="comma-separated row counts")
+    ap.add_argument("--iterations", type=int, default=5, help="decodes per format and size")
+    args = ap.parse_args()
+
+    results = []
+    for shape, (names, make_rows) in SHAPES.items():
+        for n in (int(s) for s in args.rows.split(",") if s.strip()):
+            rows = list(make_rows(n))
+            bodies = {"json": json_body(names, rows), "tsv": tsv_body(names, rows)}
+            # both formats must decode to the same values
+            if decode_json(bodies["json"], names) != decode_tsv(bodies["tsv"], names):
+                raise SystemExit(f"{shape}/{n}: JSON and TSV decode differently")
+            entry = {"shape": shape, "rows": n}
+            for fmt, fn in (("json", decode_json), ("tsv", decode_tsv)):
+                entry[fmt] = dict(measure(fn, bodies[fmt], names, args.iterations), bytes=len(bodies[fmt]))
+            entry["time_ratio"] = entry["tsv"]["p50_ms"] / entry["json"]["p50_ms"]
+            entry["peak_ratio"] = entry["tsv"]["peak_kb"] / entry["json"]["peak_kb"]
+            results.append(entry)
+    print(json.dumps({"benchmark": "bench_result_decoding", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
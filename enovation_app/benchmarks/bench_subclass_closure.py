@@ -0,0 +1,135 @@
+"""
+Benchmark: rdfs:subClassOf* walks vs the precomputed closure index.
+
+Builds a synthetic class hierarchy (``--depth`` levels, ``--branching``
+children per class, instances typed with the deepest classes) and compares
+
+* membership tests: a fresh upward walk per test (what a property path does
+  for every query and every centre) vs one bitset test on SubClassClosure
+* query latency (needs rdflib): ``?c rdfs:subClassOf* <root>`` vs the same
+  query with the path replaced by a VALUES block of precomputed descendants
+
+Usage:  python benchmarks/bench_subclass_closure.py --depth 12 --branching 2
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from class_closure import SubClassClosure  # noqa: E402
+
+NS = "http://example.org/synthetic#"
+
+
+def build_hierarchy(depth, branching):
+    edges = []
+    level = [NS + "C"]
+    leaves = level
+    for d in range(1, depth + 1):
+        nxt = []
+        for parent in level:
+            for b in range(branching):
+                child = f"{parent}_{b}"
+                edges.append((child, parent))
+                nxt.append(child)
+        level = nxt
+        leaves = nxt
+    return edges, leaves
+
+
+def walk_is_subclass(up, cls, ancestor):
+    seen = {cls}
+    stack = [cls]
+    while stack:
+        c = stack.pop()
+        if c == ancestor:
+            return True
+        for s in up.get(c, ()):
+            if s not in seen:
+                seen.add(s)
+                stack.append(s)
+    return False
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return {"median_ms": statistics.median(samples) * 1000, "min_ms": min(samples) * 1000}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--depth", type=int, default=10)
+    ap.add_argument("--branching", type=int, default=2)
+    ap.add_argument("--instances", type=int, default=2000)
+    ap.add_argument("--tests", type=int, default=20000, help="membership tests per run")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    rnd = random.Random(args.seed)
+
+    edges, leaves = build_hierarchy(args.depth, args.branching)
+    classes = [NS + "C"] + [c for c, _ in edges]
+    up = {}
+    for sub, sup in edges:
+        up.setdefault(sub, []).append(sup)
+
+    t0 = time.perf_counter()
+    closure = SubClassClosure(edges)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    pairs = [(rnd.choice(leaves), rnd.choice(classes)) for _ in range(args.tests)]
+    report = {
+        "classes": len(classes),
+        "depth": args.depth,
+        "index_build_ms": build_ms,
+        "membership": {
+            "walk": timed(lambda: [walk_is_subclass(up, c, a) for c, a in pairs], args.repeat),
+            "closure_index": timed(lambda: [closure.is_subclass(c, a) for c, a in pairs], args.repeat),
+        },
+    }
+    assert all(walk_is_subclass(up, c, a) == closure.is_subclass(c, a) for c, a in pairs[:2000])
+
+    try:
+        import rdflib
+    except ImportError:
+        report["query"] = "skipped (rdflib not installed)"
+    else:
+        g = rdflib.Graph()
+        sub_of = rdflib.RDFS.subClassOf
+        for sub, sup in edges:
+            g.add((rdflib.URIRef(sub), sub_of, rdflib.URIRef(sup)))
+        for i in range(args.instances):
+            g.add((rdflib.URIRef(f"{NS}i{i}"), rdflib.RDF.type, rdflib.URIRef(rnd.choice(leaves))))
+        target = rnd.choice([c for c in classes if c.count("_") == max(1, args.depth // 2)] or classes)
+        with_path = f"""
+        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+        SELECT (COUNT(?x) AS ?n) WHERE {{ ?x a ?c . ?c rdfs:subClassOf* <{target}> . }}
+        """
+        values = " ".join(f"<{c}>" for c in sorted(closure.descendants(target)))
+        with_index = f"""
+        SELECT (COUNT(?x) AS ?n) WHERE {{ VALUES ?c {{ {values} }} ?x a ?c . }}
+        """
+        n_path = int(list(g.query(with_path))[0][0])
+        n_index = int(list(g.query(with_index))[0][0])
+        assert n_path == n_index, (n_path, n_index)
+        report["query"] = {
+            "target_descendants": len(closure.descendants(target)),
+            "matches": n_path,
+            "property_path": timed(lambda: list(g.query(with_path)), args.repeat),
+            "values_from_index": timed(lambda: list(g.query(with_index)), args.repeat),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Synthetic eNOVATION-ontology graphs for benchmarks.
+
+Produces Turtle with the shape the recommender queries expect: training
+centres (typed with the class labelled "Training centre"@en), technologies
+as named individuals under a class hierarchy of ``--tech-depth`` levels below
+en:Technology, each technology also punned as a class with a chain of
+subclasses whose instances centres and courses may use instead (this is what
+the ``rdfs:subClassOf* ?selTech`` patterns walk), training courses,
+scenarios based on incidents, incidents involving threats, equipment
+addressing threats, facilities under en:Facility, disciplines and networks.
+
+Usage:  python benchmarks/synthetic_ontology.py --centres 50 --out synthetic.ttl
+"""
+import argparse
+import random
+from typing import Dict, Iterator, List
+
+EN = "http://www.semanticweb.org/eNOVATION-ontology#"
+
+PREFIXES = [
+    f"@prefix en: <{EN}> .",
+    "@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .",
+    "@prefix owl: <http://www.w3.org/2002/07/owl#> .",
+]
+
+DEFAULTS: Dict[str, int] = {
+    "centres": 20,
+    "technologies": 15,
+    "tech_depth": 3,
+    "courses": 3,
+    "incidents": 12,
+    "threats": 8,
+    "facilities": 2,
+    "scenarios": 6,
+    "disciplines": 5,
+    "networks": 6,
+    "fanout": 1,
+    "seed": 1,
+}
+
+
+def _lit(text: str, lang: str = "") -> str:
+    text = text.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"@{lang}' if lang else f'"{text}"'
+
+
+def generate(
+    centres: int = DEFAULTS["centres"],
+    technologies: int = DEFAULTS["technologies"],
+    tech_depth: int = DEFAULTS["tech_depth"],
+    courses: int = DEFAULTS["courses"],
+    incidents: int = DEFAULTS["incidents"],
+    threats: int = DEFAULTS["threats"],
+    facilities: int = DEFAULTS["facilities"],
+    scenarios: int = DEFAULTS["scenarios"],
+    disciplines: int = DEFAULTS["disciplines"],
+    networks: int = DEFAULTS["networks"],
+    fanout: int = DEFAULTS["fanout"],
+    seed: int = DEFAULTS["seed"],
+) -> Iterator[str]:
+    """
+    Turtle lines (prefixes first). ``courses`` / ``facilities`` are maxima per
+    centre; ``fanout`` multiplies every per-centre link count (technologies,
+    courses, incidents, equipment, facilities, disciplines, networks).
+    """
+    rnd = random.Random(seed)
+
+    def t(s: str, p: str, o: str) -> str:
+        return f"{s} {p} {o} ."
+
+    yield from PREFIXES
+    yield t("en:TrainingCentre", "rdfs:label", _lit("Training centre", "en"))
+    yield t("en:Technology", "rdfs:label", _lit("Technology", "en"))
+    yield t("en:Scenario", "rdfs:label", _lit("Scenario", "en"))
+    yield t("en:Facility", "rdfs:label", _lit("Facility", "en"))
+    yield t("en:TrainingCourse", "rdfs:label", _lit("Training course", "en"))
+    for p in ("usesTechnology", "providesTrainingCourse", "trainsOnTechnology", "tacklesIncident",
+              "isIncidentTackledBy", "isBasedOnIncident", "involvesThreat", "hasEquipment",
+              "hasCapacity", "adressesThreat", "hasFacility", "hasTCDiscipline", "connectsWithNetwork"):
+        yield t(f"en:{p}", "rdfs:label", _lit(p, "en"))
+
+    # Technology class hierarchy: binary tree of tech_depth levels under en:Technology
+    levels: List[List[str]] = [["en:Technology"]]
+    for d in range(1, tech_depth + 1):
+        level = []
+        for i, parent in enumerate(levels[-1]):
+            for b in range(2):
+                cls = f"en:TechClass_{d}_{2 * i + b}"
+                yield t(cls, "rdfs:subClassOf", parent)
+                yield t(cls, "rdfs:label", _lit(f"Technology class {d}.{2 * i + b}", "en"))
+                level.append(cls)
+        levels.append(level)
+    tech_classes = [c for level in levels for c in level]
+
+    # Technologies, each with a chain of punned subclasses and one variant instance per level
+    techs: List[str] = []
+    variants: List[str] = []
+    for i in range(technologies):
+        tech = f"en:tech{i}"
+        techs.append(tech)
+        yield t(tech, "a", rnd.choice(tech_classes))
+        yield t(tech, "a", "owl:NamedIndividual")
+        yield t(tech, "rdfs:label", _lit(f"Technology {i} (model T{i})"))
+        parent = tech
+        for d in range(1, max(tech_depth, 1) + 1):
+            sub = f"en:tech{i}_kind{d}"
+            yield t(sub, "rdfs:subClassOf", parent)
+            variant = f"en:tech{i}_variant{d}"
+            yield t(variant, "a", sub)
+            yield t(variant, "rdfs:label", _lit(f"Technology {i} variant {d}"))
+            variants.append(variant)
+            parent = sub
+    all_techs = techs + variants
+
+    threat_uris = [f"en:threat{i}" for i in range(threats)]
+    for i, th in enumerate(threat_uris):
+        yield t(th, "rdfs:label", _lit(f"Threat {i}"))
+    incident_uris = [f"en:incident{i}" for i in range(incidents)]
+    for i, inc in enumerate(incident_uris):
+        yield t(inc, "rdfs:label", _lit(f"Incident {i}"))
+        for th in rnd.sample(threat_uris, min(len(threat_uris), rnd.randint(1, 3))):
+            yield t(inc, "en:involvesThreat", th)
+    for i in range(scenarios):
+        scen = f"en:scenario{i}"
+        yield t(scen, "a", "en:Scenario")
+        yield t(scen, "a", "owl:NamedIndividual")
+        yield t(scen, "rdfs:label", _lit(f"Scenario {i}"))
+        for inc in rnd.sample(incident_uris, min(len(incident_uris), rnd.randint(1, 3))):
+            yield t(scen, "en:isBasedOnIncident", inc)
+
+    yield t("en:Laboratory", "rdfs:subClassOf", "en:Facility")
+    yield t("en:BSL3Laboratory", "rdfs:subClassOf", "en:Laboratory")
+    yield t("en:TrainingGround", "rdfs:subClassOf", "en:Facility")
+    facility_types = ["en:Laboratory", "en:BSL3Laboratory", "en:TrainingGround", "en:Office"]
+    discipline_uris = [f"en:discipline{i}" for i in range(disciplines)]
+    for i, d in enumerate(discipline_uris):
+        yield t(d, "rdfs:label", _lit(f"Discipline {i}"))
+    network_uris = [f"en:network{i}" for i in range(networks)]
+    for i, n in enumerate(network_uris):
+        yield t(n, "rdfs:label", _lit(f"Network {i}"))
+
+    for c in range(centres):
+        centre = f"en:centre{c}"
+        yield t(centre, "a", "en:TrainingCentre")
+        yield t(centre, "rdfs:label", _lit(f"Training Centre {c}"))
+        for tech in rnd.sample(all_techs, min(len(all_techs), rnd.randint(1, 4 * fanout))):
+            yield t(centre, "en:usesTechnology", tech)
+        for k in range(rnd.randint(0, courses * fanout)):
+            course = f"en:course{c}_{k}"
+            yield t(centre, "en:providesTrainingCourse", course)
+            yield t(course, "rdfs:label", _lit(f"Course {c}.{k}"))
+            if rnd.random() < 0.8:
+                yield t(course, "a", "en:TrainingCourse")
+            for tech in rnd.sample(all_techs, min(len(all_techs), rnd.randint(1, 2))):
+                yield t(course, "en:trainsOnTechnology", tech)
+        for inc in rnd.sample(incident_uris, min(len(incident_uris), rnd.randint(0, 3 * fanout))):
+            if rnd.random() < 0.5:
+                yield t(centre, "en:tacklesIncident", inc)
+            else:
+                yield t(inc, "en:isIncidentTackledBy", centre)
+        for k in range(rnd.randint(0, 2 * fanout)):
+            eq = f"en:equipment{c}_{k}"
+            yield t(centre, rnd.choice(["en:hasEquipment", "en:hasCapacity"]), eq)
+            yield t(eq, "rdfs:label", _lit(f"Equipment {c}.{k}"))
+            for th in rnd.sample(threat_uris, min(len(threat_uris), rnd.randint(1, 2))):
+                yield t(eq, "en:adressesThreat", th)
+        for k in range(rnd.randint(0, facilities * fanout)):
+            fac = f"en:facility{c}_{k}"
+            yield t(centre, "en:hasFacility", fac)
+            yield t(fac, "a", rnd.choice(facility_types))
+            yield t(fac, "rdfs:label", _lit(f"Facility {c}.{k}"))
+        for d in rnd.sample(discipline_uris, min(len(discipline_uris), rnd.randint(0, 3 * fanout))):
+            yield t(centre, "en:hasTCDiscipline", d)
+        for n in rnd.sample(network_uris, min(len(network_uris), rnd.randint(0, 2 * fanout))):
+            yield t(centre, "en:connectsWithNetwork", n)
+
+    # some technologies address threats directly (threat criterion via usesTechnology)
+    for tech in rnd.sample(techs, len(techs) // 3):
+        yield t(tech, "en:adressesThreat", rnd.choice(threat_uris))
+
+
+def write_turtle(path: str, **params) -> int:
+    """Write a synthetic graph to ``path``; returns the number of triples."""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for line in generate(**params):
+            f.write(line + "\n")
+            if not line.startswith("@prefix"):
+                count += 1
+    return count
+
+
+def add_arguments(ap: argparse.ArgumentParser) -> None:
+    for name, default in DEFAULTS.items():
+        ap.add_argument("--" + name.replace("_", "-"), type=int, default=default)
+
+
+def params_from_args(args) -> Dict[str, int]:
+    return {name: getattr(args, name) for name in DEFAULTS}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    add_arguments(ap)
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args()
+    n = write_turtle(args.out, **params_from_args(args))
+    print(f"wrote {n} triples to {args.out}")
@@ -0,0 +1,224 @@
+"""
+Change tracking between two states of the dataset.
+
+Every (subject, predicate) pair the recommender depends on gets a digest of
+its sorted objects (a blank-node object stands for a hash of its own
+properties, so edits inside e.g. an OWL restriction change the digest).  Diffing the digests of two snapshots tells exactly
+which entities gained or lost triples, and ``plan_changes`` maps those
+entities to the recommendations they can influence:
+
+* subclass edges or the engine predicates themselves changed -> full rebuild
+* the "Training centre" class changed (e.g. its label, which decides which
+  individuals are centres) -> full rebuild
+* a technology changed -> every pair with that technology
+* a scenario, one of its incidents or their threats changed -> every pair
+  with that scenario
+* a centre, or anything up to two hops away from it (course -> technology,
+  equipment -> threat, facility, ...) changed -> that centre, in every pair
+"""
+import hashlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sparql_client import run_sparql
+
+EN = "http://www.semanticweb.org/eNOVATION-ontology#"
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+RDFS_SUBCLASS = "http://www.w3.org/2000/01/rdf-schema#subClassOf"
+
+# Predicates followed from a centre when looking for changed neighbours
+CENTER_LINKS = [EN + p for p in (
+    "usesTechnology",
+    "providesTrainingCourse",
+    "trainsOnTechnology",
+    "tacklesIncident",
+    "hasEquipment",
+    "hasCapacity",
+    "adressesThreat",
+    "hasFacility",
+    "hasTCDiscipline",
+    "connectsWithNetwork",
+)]
+SCENARIO_LINKS = [EN + "isBasedOnIncident", EN + "involvesThreat", EN + "isIncidentTackledBy"]
+
+TRACKED_PREDICATES = CENTER_LINKS + SCENARIO_LINKS + [RDF_TYPE, RDFS_LABEL, RDFS_SUBCLASS]
+
+# Blank-node objects come with their own properties (?bp ?bo), in the same
+# result so that their labels are consistent
+TRACKED_QUERY = """
+SELECT ?s ?p ?o ?bp ?bo WHERE {
+  VALUES ?p { %s }
+  ?s ?p ?o .
+  FILTER(isIRI(?s))
+  OPTIONAL { ?o ?bp ?bo . FILTER(isBlank(?o)) }
+}
+""" % " ".join(f"<{p}>" for p in TRACKED_PREDICATES)
+
+# The same triples, summarized on the server: one row with their count and the
+# sum of a 12-digit number per triple (the decimal digits of an MD5 of the
+# triple, with a blank-node object replaced by each of its properties).  Any
+# edit changes the sum, so it tells whether the data changed without sending
+# it; the staleness check of the serving side runs it instead of TRACKED_QUERY.
+_TERM = 'CONCAT(COALESCE(STR(?{0}), "_:"), "|", COALESCE(LANG(?{0}), ""), "|", COALESCE(STR(DATATYPE(?{0})), ""))'
+CHECKSUM_QUERY = """
+PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+SELECT (COUNT(*) AS ?n) (SUM(?h) AS ?sum) WHERE {
+  VALUES ?p { %s }
+  ?s ?p ?o .
+  FILTER(isIRI(?s))
+  OPTIONAL { ?o ?bp ?bo . FILTER(isBlank(?o)) }
+  BIND(COALESCE(IF(isBlank(?o), CONCAT(STR(?bp), " ", %s), %s), "_:") AS ?obj)
+  BIND(MD5(CONCAT(STR(?s), " ", STR(?p), " ", ?obj)) AS ?md5)
+  BIND(xsd:integer(SUBSTR(CONCAT(REPLACE(?md5, "[a-f]", ""), "000000000000"), 1, 12)) AS ?h)
+}
+""" % (" ".join(f"<{p}>" for p in TRACKED_PREDICATES), _TERM.format("bo"), _TERM.format("o"))
+
+TRAINING_CENTRE_LABEL = '"Training centre"@en'
+
+
+def _term(t: Dict[str, str]) -> str:
+    kind = t.get("type")
+    value = t.get("value", "")
+    if kind == "uri":
+        return value
+    if kind == "bnode":
+        # blank node ids are not stable between queries; a nested blank node
+        # only counts by its presence
+        return "_:"
+    if "xml:lang" in t:
+        return f'"{value}"@{t["xml:lang"]}'
+    if "datatype" in t:
+        return f'"{value}"^^{t["datatype"]}'
+    return f'"{value}"'
+
+
+class DatasetState:
+    def __init__(self, triples: Iterable[Tuple[str, str, str]]):
+        self.out: Dict[str, Dict[str, Set[str]]] = defaultdict(lambda: defaultdict(set))
+        for s, p, o in triples:
+            self.out[s][p].add(o)
+
+    def digests(self) -> Dict[Tuple[str, str], str]:
+        out = {}
+        for s, preds in self.out.items():
+            for p, objs in preds.items():
+                h = hashlib.sha1("\n".join(sorted(objs)).encode("utf-8")).hexdigest()
+                out[(s, p)] = h
+        return out
+
+    def objects(self, s: str, preds: Iterable[str]) -> Set[str]:
+        found: Set[str] = set()
+        node = self.out.get(s)
+        if node:
+            for p in preds:
+                found |= node.get(p, set())
+        return found
+
+    def centre_classes(self) -> Set[str]:
+        return {s for s, preds in self.out.items() if TRAINING_CENTRE_LABEL in preds.get(RDFS_LABEL, ())}
+
+    def centres(self) -> Set[str]:
+        classes = self.centre_classes()
+        return {s for s, preds in self.out.items() if preds.get(RDF_TYPE, set()) & classes}
+
+
+def load_dataset_state() -> Optional[DatasetState]:
+    data = run_sparql(TRACKED_QUERY, cache=False, name="tracked_triples")
+    if not data:
+        print("[change_tracking] ERROR: could not load tracked triples")
+        return None
+    bindings = data.get("results", {}).get("bindings", [])
+    blank: Dict[str, Set[str]] = defaultdict(set)
+    for b in bindings:
+        if b["o"].get("type") == "bnode" and "bp" in b and "bo" in b:
+            blank[b["o"]["value"]].add(f'{b["bp"]["value"]} {_term(b["bo"])}')
+
+    def obj(t: Dict[str, str]) -> str:
+        if t.get("type") == "bnode":
+            return "_:" + hashlib.sha1("\n".join(sorted(blank.get(t["value"], ()))).encode("utf-8")).hexdigest()
+        return _term(t)
+
+    return DatasetState((b["s"]["value"], b["p"]["value"], obj(b["o"])) for b in bindings)
+
+
+def dataset_checksum() -> Optional[str]:
+    """``CHECKSUM_QUERY`` as ``"<count>:<sum>"``; None if the endpoint cannot be read."""
+    data = run_sparql(CHECKSUM_QUERY, cache=False, name="tracked_checksum")
+    bindings = data.get("results", {}).get("bindings", []) if data else []
+    if not bindings:
+        print("[change_tracking] ERROR: could not compute the dataset checksum")
+        return None
+    row = bindings[0]
+    return f'{row.get("n", {}).get("value", "0")}:{row.get("sum", {}).get("value", "0")}'
+
+
+def changed_keys(old: Dict[Tuple[str, str], str], new: Dict[Tuple[str, str], str]) -> Set[Tuple[str, str]]:
+    """(subject, predicate) pairs that were added, removed or whose objects changed."""
+    return {k for k in old.keys() | new.keys() if old.get(k) != new.get(k)}
+
+
+class ChangePlan:
+    def __init__(self):
+        self.full_rebuild = False
+        self.techs: Set[str] = set()
+        self.scenarios: Set[str] = set()
+        self.centres: Set[str] = set()
+
+    def is_empty(self) -> bool:
+        return not (self.full_rebuild or self.techs or self.scenarios or self.centres)
+
+    def __repr__(self) -> str:
+        if self.full_rebuild:
+            return "ChangePlan(full rebuild)"
+        return (
+            f"ChangePlan(techs={len(self.techs)}, scenarios={len(self.scenarios)}, "
+            f"centres={len(self.centres)})"
+        )
+
+
+def plan_changes(
+    changed: Set[Tuple[str, str]],
+    state: DatasetState,
+    tech_uris: List[str],
+    scen_uris: List[str],
+    old_centres: Iterable[str] = (),
+) -> ChangePlan:
+    plan = ChangePlan()
+    if not changed:
+        return plan
+    subjects = {s for s, _ in changed}
+    tracked = set(TRACKED_PREDICATES)
+    if any(p == RDFS_SUBCLASS for _, p in changed) or subjects & tracked:
+        # class hierarchy or predicate labels changed: every path may be affected
+        plan.full_rebuild = True
+        return plan
+
+    # the class whose label makes individuals centres; after a label edit the
+    # old centres still point at it through rdf:type
+    centre_classes = state.centre_classes()
+    for centre in old_centres:
+        centre_classes |= state.objects(centre, [RDF_TYPE])
+    if subjects & centre_classes:
+        plan.full_rebuild = True
+        return plan
+
+    plan.techs = {t for t in tech_uris if t in subjects}
+
+    for scen in scen_uris:
+        incidents = state.objects(scen, [EN + "isBasedOnIncident"])
+        threats: Set[str] = set()
+        for inc in incidents:
+            threats |= state.objects(inc, [EN + "involvesThreat"])
+        if scen in subjects or incidents & subjects or threats & subjects:
+            plan.scenarios.add(scen)
+
+    # old_centres: centres that disappeared only show up as changed subjects
+    for centre in state.centres() | set(old_centres):
+        hop1 = state.objects(centre, CENTER_LINKS)
+        hop2: Set[str] = set()
+        for node in hop1:
+            hop2 |= state.objects(node, CENTER_LINKS)
+        if centre in subjects or hop1 & subjects or hop2 & subjects:
+            plan.centres.add(centre)
+    return plan
@@ -0,0 +1,82 @@
+"""
+Circuit breaker for the SPARQL endpoints.
+
+After ``SPARQL_BREAKER_FAILURES`` consecutive failed requests (connection
+errors, timeouts, 5xx) an endpoint's circuit opens: queries fail at once
+with an empty result instead of each one waiting for a timeout, so an
+outage cannot tie up every worker.  After ``SPARQL_BREAKER_RESET`` seconds
+one trial request is let through (half-open); success closes the circuit,
+failure opens it for another period.
+
+``retry_delay`` gives the pause before a retry: exponential backoff with
+full jitter, so workers retrying the same outage do not hit the endpoint in
+lockstep.
+"""
+import os
+import random
+import threading
+import time
+from typing import Any, Dict
+
+SPARQL_BREAKER_FAILURES = int(os.getenv("SPARQL_BREAKER_FAILURES", "5"))
+SPARQL_BREAKER_RESET = float(os.getenv("SPARQL_BREAKER_RESET", "30"))
+SPARQL_RETRY_BACKOFF = float(os.getenv("SPARQL_RETRY_BACKOFF", "0.2"))
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = SPARQL_BREAKER_FAILURES, reset_after: float = SPARQL_BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failures
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self._since = 0.0
+
+    def allow(self) -> bool:
+        """True if a request may go out now (always, unless the circuit is open)."""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            # open: one trial after reset_after; half-open: another one if the trial never reported back
+            if now - self._since >= self.reset_after:
+                self.state = "half_open"
+                self._since = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                print(f"[CircuitBreaker] {self.name}: closed again")
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and 0 < self.failure_threshold <= self.failures):
+                if self.state == "closed":
+                    self.trips += 1
+                print(f"[CircuitBreaker] {self.name}: open for {self.reset_after:.0f}s after {self.failures} failures")
+                self.state = "open"
+                self._since = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open": int(self.state != "closed"),
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+def retry_delay(attempt: int, base: float = SPARQL_RETRY_BACKOFF) -> float:
+    """Seconds to wait before retry number ``attempt`` (0-based): full jitter over ``base * 2**attempt``."""
+    return random.uniform(0, base * (2 ** attempt))
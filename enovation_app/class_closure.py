@@ -0,0 +1,241 @@
+"""
+Precomputed rdfs:subClassOf* closure.
+
+Every class gets a bit position; ``ancestors`` and ``descendants`` of a
+class are stored as int bitsets (reflexive, so each class is its own
+ancestor, matching the zero-length case of ``rdfs:subClassOf*``).  Cycles in
+the hierarchy are handled by collapsing strongly connected components
+first.  Membership tests are then one shift and mask instead of a walk
+over the class graph.
+
+With ``SUBCLASS_INDEX=1`` the recommender also rewrites the
+``?c rdfs:subClassOf* ?selTech`` / ``en:Facility`` patterns of its SPARQL
+templates into ``VALUES ?c { ... }`` blocks built from this index, so Fuseki
+no longer evaluates the property path for every query.
+"""
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from sparql_client import on_cache_clear, run_sparql
+
+SUBCLASS_INDEX = os.getenv("SUBCLASS_INDEX", "0") == "1"
+
+SUBCLASS_QUERY = """
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+SELECT ?s ?o WHERE { ?s rdfs:subClassOf ?o . }
+"""
+
+EN = "http://www.semanticweb.org/eNOVATION-ontology#"
+
+
+def _strongly_connected(nodes: int, succ: List[List[int]]) -> List[List[int]]:
+    """Tarjan's algorithm (iterative). Components come out successors-first."""
+    index = [-1] * nodes
+    low = [0] * nodes
+    on_stack = [False] * nodes
+    stack: List[int] = []
+    comps: List[List[int]] = []
+    counter = 0
+    for root in range(nodes):
+        if index[root] != -1:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, i = work.pop()
+            if i == 0:
+                index[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                on_stack[v] = True
+            recurse = False
+            while i < len(succ[v]):
+                w = succ[v][i]
+                i += 1
+                if index[w] == -1:
+                    work.append((v, i))
+                    work.append((w, 0))
+                    recurse = True
+                    break
+                if on_stack[w]:
+                    low[v] = min(low[v], index[w])
+            if recurse:
+                continue
+            if low[v] == index[v]:
+                comp = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    comp.append(w)
+                    if w == v:
+                        break
+                comps.append(comp)
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[v])
+    return comps
+
+
+def _closure_masks(nodes: int, succ: List[List[int]]) -> List[int]:
+    """Reflexive-transitive reachability over ``succ`` as one bitset per node."""
+    masks = [0] * nodes
+    comp_of = [0] * nodes
+    comps = _strongly_connected(nodes, succ)
+    for ci, comp in enumerate(comps):
+        for v in comp:
+            comp_of[v] = ci
+    for ci, comp in enumerate(comps):
+        mask = 0
+        for v in comp:
+            mask |= 1 << v
+        for v in comp:
+            for w in succ[v]:
+                if comp_of[w] != ci:
+                    # successors-first order: this component is already final
+                    mask |= masks[w]
+        for v in comp:
+            masks[v] = mask
+    return masks
+
+
+class SubClassClosure:
+    def __init__(self, edges: Iterable[Tuple[str, str]]):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        pairs = []
+        for sub, sup in edges:
+            pairs.append((self._id(sub), self._id(sup)))
+        n = len(self.names)
+        up: List[List[int]] = [[] for _ in range(n)]
+        down: List[List[int]] = [[] for _ in range(n)]
+        for a, b in pairs:
+            up[a].append(b)
+            down[b].append(a)
+        self._ancestors = _closure_masks(n, up)
+        self._descendants = _closure_masks(n, down)
+
+    def _id(self, name: str) -> int:
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _members(self, mask: int) -> Set[str]:
+        out = set()
+        names = self.names
+        while mask:
+            low = mask & -mask
+            out.add(names[low.bit_length() - 1])
+            mask ^= low
+        return out
+
+    def is_subclass(self, cls: str, ancestor: str) -> bool:
+        """``cls rdfs:subClassOf* ancestor``"""
+        if cls == ancestor:
+            return True
+        a, b = self.ids.get(cls), self.ids.get(ancestor)
+        if a is None or b is None:
+            return False
+        return (self._ancestors[a] >> b) & 1 == 1
+
+    def ancestors_mask(self, cls: str) -> int:
+        i = self.ids.get(cls)
+        return 0 if i is None else self._ancestors[i]
+
+    def ancestors(self, cls: str) -> Set[str]:
+        i = self.ids.get(cls)
+        return {cls} if i is None else self._members(self._ancestors[i])
+
+    def descendants(self, cls: str) -> Set[str]:
+        i = self.ids.get(cls)
+        return {cls} if i is None else self._members(self._descendants[i])
+
+    def bit(self, cls: str) -> int:
+        i = self.ids.get(cls)
+        return 0 if i is None else 1 << i
+
+    @classmethod
+    def load(cls) -> Optional["SubClassClosure"]:
+        data = run_sparql(SUBCLASS_QUERY, cache=False, name="subclass_closure", shared=True)
+        if not data:
+            print("[SubClassClosure] ERROR: subclass query failed")
+            return None
+        return cls.from_bindings(data.get("results", {}).get("bindings", []))
+
+    @classmethod
+    def from_bindings(cls, bindings) -> "SubClassClosure":
+        def name(t):
+            # blank nodes (e.g. OWL restrictions) keep a "_:" prefix so they never look like IRIs
+            return t["value"] if t.get("type") == "uri" else "_:" + t["value"]
+        return cls((name(b["s"]), name(b["o"])) for b in bindings)
+
+
+_closure: Optional[SubClassClosure] = None
+_closure_lock = threading.Lock()
+
+
+def get_closure() -> Optional[SubClassClosure]:
+    global _closure
+    if _closure is None:
+        with _closure_lock:
+            if _closure is None:
+                _closure = SubClassClosure.load()
+    return _closure
+
+
+def refresh_closure() -> Optional[SubClassClosure]:
+    global _closure
+    closure = SubClassClosure.load()
+    if closure is not None:
+        with _closure_lock:
+            _closure = closure
+    return _closure
+
+
+@on_cache_clear
+def _reload_closure() -> None:
+    if _closure is not None:
+        refresh_closure()
+
+
+_PATH_RE = re.compile(r"(\?\w+)\s+rdfs:subClassOf\*\s+(\?selTech|en:Facility)\s*\.")
+
+
+def expand_subclass_paths(query: str, tech_uri: Union[str, Sequence[str]]) -> str:
+    """
+    Replace ``?c rdfs:subClassOf* ?selTech`` and ``?c rdfs:subClassOf* en:Facility``
+    with VALUES blocks of the precomputed descendants (the class itself included).
+    With several technologies (a query binding ``?selTech`` to each of them)
+    the block pairs every descendant with its technology:
+    ``VALUES (?c ?selTech) { (<class> <tech>) ... }``.
+    Returns the query unchanged when the index is disabled or unavailable.
+    """
+    if not SUBCLASS_INDEX:
+        return query
+    closure = get_closure()
+    if closure is None:
+        return query
+    targets = {"?selTech": tech_uri, "en:Facility": EN + "Facility"}
+    values: Dict[str, str] = {}
+
+    def repl(m: "re.Match") -> str:
+        target = m.group(2)
+        if target == "?selTech" and not isinstance(tech_uri, str):
+            rows = " ".join(
+                f"(<{c}> <{t}>)"
+                for t in dict.fromkeys(tech_uri)
+                for c in sorted(closure.descendants(t))
+                if not c.startswith("_:")
+            )
+            return f"VALUES ({m.group(1)} ?selTech) {{ {rows} }}"
+        if target not in values:
+            classes = sorted(c for c in closure.descendants(targets[target]) if not c.startswith("_:"))
+            values[target] = " ".join(f"<{c}>" for c in classes)
+        return f"VALUES {m.group(1)} {{ {values[target]} }}"
+
+    return _PATH_RE.sub(repl, query)
@@ -1,8 +1,19 @@
-import requests
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from hashlib import sha1
 import os
 
-FUSEKI_ENDPOINT = os.getenv("FUSEKI_ENDPOINT", "http://147.102.6.178:3030/enovation/sparql")
+from result_cache import StaleWhileRevalidate, TTLCache
+from result_table import SparqlTable
+from sparql_client import FUSEKI_ENDPOINT, iter_sparql_completed, on_cache_clear, run_sparql, run_sparql_many, run_sparql_table
+from label_index import LABEL_INDEX
+from local_engine import get_snapshot
+from class_closure import expand_subclass_paths
+from scoring_profiles import SCORE_KEYS, get_profile
+from instrumentation import register_gauges, span
+
+# "remote": counts come from ENGINE_QUERY_TEMPLATE on Fuseki
+# "local":  counts are computed from an in-memory snapshot (see local_engine.py)
+RECOMMENDER_ENGINE = os.getenv("RECOMMENDER_ENGINE", "remote")
 
 DISCIPLINE_MAP = {
     "B": "Biological (B)",
@@ -10,17 +21,6 @@ DISCIPLINE_MAP = {
     "RN": "Radiological / Nuclear (RN)",
 }
 
-def run_sparql(query: str) -> Dict[str, Any]:
-    headers = {"Accept": "application/sparql-results+json"}
-    params = {"query": query}
-    try:
-        resp = requests.get(FUSEKI_ENDPOINT, params=params, headers=headers, timeout=60)
-        resp.raise_for_status()
-        return resp.json()
-    except requests.exceptions.RequestException as e:
-        print(f"[run_sparql] ERROR: {e}")
-        return {}
-
 def sparql_escape_literal(value: str) -> str:
     return value.replace("\\", "\\\\").replace('"', '\\"')
 
@@ -37,14 +37,36 @@ def _get_int(binding: Dict[str, Any], name: str) -> int:
     except ValueError:
         return 0
 
-_URI_CACHE: Dict[str, Optional[str]] = {}
-
 def get_uri_for_label(label: str) -> Optional[str]:
     if not label:
         return None
-    if label in _URI_CACHE:
-        return _URI_CACHE[label]
+    with span("resolve_label"):
+        if LABEL_INDEX.ensure_loaded():
+            uri = LABEL_INDEX.lookup(label)
+            if uri is None:
+                print(f"[get_uri_for_label] WARNING: no URI found for label: {label!r}")
+            return uri
+        # Index could not be loaded (endpoint down or empty): ask the endpoint directly
+        cached = _label_cache.get(label)
+        if cached is not None:
+            return cached[0]
+        uri, complete = _query_uri_for_label(label)
+        if uri is not None:
+            _label_cache.set(label, (uri,))
+        elif complete:
+            # a real "no match", not a failed query: remembered only briefly
+            _label_cache.set(label, (None,), ttl=LABEL_NEGATIVE_TTL)
+        return uri
 
+# Labels resolved with _query_uri_for_label while the index is unavailable.  Failed
+# queries are never cached, so an outage cannot leave lasting "no URI found" answers.
+LABEL_CACHE_TTL = float(os.getenv("LABEL_CACHE_TTL", "3600"))
+LABEL_NEGATIVE_TTL = float(os.getenv("LABEL_NEGATIVE_TTL", "60"))
+_label_cache = TTLCache(4096, LABEL_CACHE_TTL)
+on_cache_clear(_label_cache.clear)
+
+def _query_uri_for_label(label: str) -> Tuple[Optional[str], bool]:
+    """``(uri, complete)``; ``complete`` is False if a query failed, so None may not mean "no match"."""
     esc_full = sparql_escape_literal(label)
 
     # 1) exact
@@ -55,12 +77,12 @@ def get_uri_for_label(label: str) -> Optional[str]:
       FILTER(LCASE(STR(?l)) = LCASE("{esc_full}"))
     }} LIMIT 1
     """
-    data = run_sparql(q_exact)
+    data = run_sparql(q_exact, name="label_exact")
+    complete = bool(data)
     bindings = data.get("results", {}).get("bindings", [])
     if bindings:
         uri = bindings[0]["s"]["value"]
-        _URI_CACHE[label] = uri
-        return uri
+        return uri, True
 
     # 2) prefix before "("
     prefix = label.split("(", 1)[0].strip()
@@ -73,12 +95,12 @@ def get_uri_for_label(label: str) -> Optional[str]:
           FILTER(CONTAINS(LCASE(STR(?l)), LCASE("{esc_prefix}")))
         }} LIMIT 1
         """
-        data2 = run_sparql(q_prefix)
+        data2 = run_sparql(q_prefix, name="label_prefix")
+        complete = complete and bool(data2)
         bindings2 = data2.get("results", {}).get("bindings", [])
         if bindings2:
             uri = bindings2[0]["s"]["value"]
-            _URI_CACHE[label] = uri
-            return uri
+            return uri, True
 
     # 3) generic contains
     q_contains = f"""
@@ -89,16 +111,18 @@ def get_uri_for_label(label: str) -> Optional[str]:
       FILTER(CONTAINS(LCASE(STR(?l)), LCASE("{esc_full}")))
     }} LIMIT 1
     """
-    data3 = run_sparql(q_contains)
+    data3 = run_sparql(q_contains, name="label_contains")
+    complete = complete and bool(data3)
     bindings3 = data3.get("results", {}).get("bindings", [])
     if bindings3:
         uri = bindings3[0]["s"]["value"]
-        _URI_CACHE[label] = uri
-        return uri
+        return uri, True
 
-    print(f"[get_uri_for_label] WARNING: no URI found for label: {label!r}")
-    _URI_CACHE[label] = None
-    return None
+    if complete:
+        print(f"[get_uri_for_label] WARNING: no URI found for label: {label!r}")
+    else:
+        print(f"[get_uri_for_label] ERROR: could not resolve label {label!r}, endpoint unavailable")
+    return None, complete
 
 ENGINE_QUERY_TEMPLATE = """
 PREFIX rdf:  <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
@@ -214,29 +238,295 @@ def get_recommendations(tech_label: str, scen_label: str):
     if not tech_uri or not scen_uri:
         print("[get_recommendations] ABORT – missing tech or scenario URI")
         return []
+    return get_recommendations_for_uris(tech_uri, scen_uri)
+
+def get_recommendations_for_uris(tech_uri: str, scen_uri: str, center_uris: Optional[List[str]] = None):
+    """Engine rows for the pair; ``center_uris`` restricts the result to those centres."""
+    if RECOMMENDER_ENGINE == "local":
+        snap = get_snapshot()
+        if snap is not None:
+            with span("engine_local"):
+                recs = snap.recommendations(tech_uri, scen_uri)
+            if center_uris is not None:
+                wanted = set(center_uris)
+                recs = [r for r in recs if r["center_uri"] in wanted]
+            return recs
+        print("[get_recommendations] local snapshot unavailable, falling back to SPARQL engine")
+    return _remote_recommendations(tech_uri, scen_uri, center_uris)
+
+ENGINE_COUNT_VARS = (
+    "techUseCount",
+    "techTrainCount",
+    "incidentCount",
+    "threatCapCount",
+    "facilityCount",
+    "disciplineCount",
+    "courseCount",
+    "networkCount",
+)
+
+# ORDER BY of ENGINE_QUERY_TEMPLATE
+ENGINE_ORDER_VARS = (
+    "techTrainCount",
+    "techUseCount",
+    "threatCapCount",
+    "incidentCount",
+    "facilityCount",
+    "disciplineCount",
+    "courseCount",
+    "networkCount",
+)
+
+# How the eight counts are queried:
+#   single    ENGINE_QUERY_TEMPLATE: all criteria as OPTIONALs of one group, so the
+#             rows counted per centre are the product of the matches per criterion
+#   subquery  one query, each criterion counted in its own grouped subquery
+#   split     one query per criterion (plus one for the centres), run in
+#             parallel and merged by centre URI
+ENGINE_QUERY_STRATEGY = os.getenv("ENGINE_QUERY_STRATEGY", "single")
+
+ENGINE_PREFIXES = """
+PREFIX rdf:  <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+PREFIX en:   <http://www.semanticweb.org/eNOVATION-ontology#>
+"""
 
-    query = (
-        ENGINE_QUERY_TEMPLATE
+ENGINE_CENTERS_PATTERN = """
+    {CENTER_VALUES}
+    ?trainingClass rdfs:label "Training centre"@en .
+    ?center a ?trainingClass ;
+            rdfs:label ?centerLabel ."""
+
+# Count variable -> pattern over ?center and the counted entity ?match, with the
+# same matches as the corresponding OPTIONAL of ENGINE_QUERY_TEMPLATE
+ENGINE_CRITERIA = {
+    "techUseCount": """
+    { ?center en:usesTechnology ?selTech . BIND(?selTech AS ?match) }
+    UNION
+    {
+      ?center   en:usesTechnology ?match .
+      ?match    a ?techClass .
+      ?techClass rdfs:subClassOf* ?selTech .
+    }""",
+    "techTrainCount": """
+    ?center en:providesTrainingCourse ?match .
+    { ?match en:trainsOnTechnology ?selTech . }
+    UNION
+    {
+      ?match en:trainsOnTechnology ?trainedTech .
+      ?trainedTech a ?techClassTrain .
+      ?techClassTrain rdfs:subClassOf* ?selTech .
+    }""",
+    "incidentCount": """
+    ?scenario en:isBasedOnIncident ?match .
+    { ?center en:tacklesIncident ?match . } UNION { ?match en:isIncidentTackledBy ?center . }""",
+    "threatCapCount": """
+    ?scenario     en:isBasedOnIncident ?incForThreat .
+    ?incForThreat en:involvesThreat    ?threatAgent .
+    ?center (en:hasEquipment | en:usesTechnology) ?match .
+    ?match  en:adressesThreat ?threatAgent .""",
+    "facilityCount": """
+    ?center  en:hasFacility ?match .
+    ?match   a ?facType .
+    ?facType rdfs:subClassOf* en:Facility .""",
+    "disciplineCount": """
+    ?center en:hasTCDiscipline ?match .""",
+    "courseCount": """
+    ?center en:providesTrainingCourse ?match .
+    ?match  a en:TrainingCourse .""",
+    "networkCount": """
+    ?center en:connectsWithNetwork ?match .""",
+}
+
+_ENGINE_BINDINGS = """
+    VALUES ?selTech { <{TECH_URI}> }
+    VALUES ?scenario { <{SCEN_URI}> }"""
+
+def _engine_subquery(var: str, count_as: str) -> str:
+    return (
+        "SELECT ?center (COUNT(DISTINCT ?match) AS ?" + count_as + ") WHERE {"
+        + _ENGINE_BINDINGS + "\n    {CENTER_VALUES}" + ENGINE_CRITERIA[var] + "\n  } GROUP BY ?center"
+    )
+
+ENGINE_SUBQUERY_TEMPLATE = (
+    ENGINE_PREFIXES
+    + "\nSELECT ?center ?centerLabel\n"
+    + "".join(f"  (COALESCE(?{v}_, 0) AS ?{v})\n" for v in ENGINE_COUNT_VARS)
+    + "WHERE {\n  { SELECT DISTINCT ?center ?centerLabel WHERE {" + ENGINE_CENTERS_PATTERN + "\n  } }\n"
+    + "".join(f"  OPTIONAL {{\n  {_engine_subquery(v, v + '_')}\n  }}\n" for v in ENGINE_COUNT_VARS)
+    + "}\nORDER BY " + " ".join(f"DESC(?{v})" for v in ENGINE_ORDER_VARS) + "\n"
+)
+
+ENGINE_SPLIT_CENTERS_TEMPLATE = ENGINE_PREFIXES + "SELECT DISTINCT ?center ?centerLabel WHERE {" + ENGINE_CENTERS_PATTERN + "\n}\n"
+
+ENGINE_SPLIT_TEMPLATES = {
+    v: ENGINE_PREFIXES + _engine_subquery(v, "n") + "\n" for v in ENGINE_COUNT_VARS
+}
+
+def _center_values(center_uris: Optional[List[str]]) -> str:
+    if not center_uris:
+        return ""
+    return "VALUES ?center { " + " ".join(f"<{u}>" for u in dict.fromkeys(center_uris)) + " }"
+
+def _fill_engine_template(template: str, tech_uri: str, scen_uri: str, center_uris: Optional[List[str]]) -> str:
+    return (
+        expand_subclass_paths(template, tech_uri)
+        .replace("{CENTER_VALUES}", _center_values(center_uris))
         .replace("{TECH_URI}", tech_uri)
         .replace("{SCEN_URI}", scen_uri)
     )
 
-    data = run_sparql(query)
-    results = []
+def engine_rows(tech_uri: str, scen_uri: str, center_uris: Optional[List[str]] = None, strategy: Optional[str] = None):
+    """``(center, centerLabel, *ENGINE_COUNT_VARS)`` rows, best first, computed with ``strategy``."""
+    strategy = strategy or ENGINE_QUERY_STRATEGY
+    if strategy == "split":
+        return _split_engine_rows(tech_uri, scen_uri, center_uris)
+    if strategy == "subquery":
+        query = _fill_engine_template(ENGINE_SUBQUERY_TEMPLATE, tech_uri, scen_uri, center_uris)
+    else:
+        template = expand_subclass_paths(ENGINE_QUERY_TEMPLATE, tech_uri)
+        if center_uris:
+            bind_scen = "BIND(<{SCEN_URI}> AS ?scenario)"
+            template = template.replace(bind_scen, bind_scen + "\n  " + _center_values(center_uris), 1)
+        query = (
+            template
+            .replace("{TECH_URI}", tech_uri)
+            .replace("{SCEN_URI}", scen_uri)
+        )
+    # counts arrive as ints, decoded column by column
+    table = run_sparql_table(query, name="engine", int_vars=ENGINE_COUNT_VARS)
+    return list(table.rows("center", "centerLabel", *ENGINE_COUNT_VARS))
+
+def _split_engine_rows(tech_uri: str, scen_uri: str, center_uris: Optional[List[str]]):
+    queries = [_fill_engine_template(ENGINE_SPLIT_CENTERS_TEMPLATE, tech_uri, scen_uri, center_uris)]
+    queries += [_fill_engine_template(ENGINE_SPLIT_TEMPLATES[v], tech_uri, scen_uri, center_uris) for v in ENGINE_COUNT_VARS]
+    names = ["engine_centers"] + ["engine_" + v for v in ENGINE_COUNT_VARS]
+    centers, *per_criterion = run_sparql_many(queries, name=names, as_table=True, int_vars=("n",))
+    if not centers or not all(per_criterion):
+        # a missing criterion would silently count as 0: fail like the single query does
+        print("[engine_rows] ERROR: split engine query failed")
+        return []
+    counts = [dict(zip(t.column("center"), t.column("n"))) for t in per_criterion]
+    rows = [
+        (center, label, *(c.get(center, 0) for c in counts))
+        for center, label in dict.fromkeys(centers.rows("center", "centerLabel"))
+    ]
+    order = [ENGINE_COUNT_VARS.index(v) + 2 for v in ENGINE_ORDER_VARS]
+    rows.sort(key=lambda r: [r[i] for i in order], reverse=True)
+    return rows
+
+def check_engine_parity(tech_uri: str, scen_uri: str, strategies=("subquery", "split")) -> List[str]:
+    """Differences between the ``single`` counts and those of ``strategies`` for one pair (empty list = identical)."""
+    def by_center(rows):
+        return {(r[0], r[1]): r[2:] for r in rows}
+
+    reference = by_center(engine_rows(tech_uri, scen_uri, strategy="single"))
+    problems = []
+    for strategy in strategies:
+        other = by_center(engine_rows(tech_uri, scen_uri, strategy=strategy))
+        for key in sorted(set(reference) | set(other)):
+            if key not in other:
+                problems.append(f"{strategy}: {key[0]} missing")
+            elif key not in reference:
+                problems.append(f"{strategy}: {key[0]} not returned by single")
+            elif other[key] != reference[key]:
+                diff = {v: (a, b) for v, a, b in zip(ENGINE_COUNT_VARS, reference[key], other[key]) if a != b}
+                problems.append(f"{strategy}: {key[0]} single/{strategy} differ {diff}")
+    return problems
+
+# Criteria of a batch (engine_rows_batch) by what they depend on: the technology,
+# the scenario, or neither (one query per batch, whatever the pairs)
+_TECH_CRITERIA = tuple(v for v in ENGINE_COUNT_VARS if "?selTech" in ENGINE_CRITERIA[v])
+_SCEN_CRITERIA = tuple(v for v in ENGINE_COUNT_VARS if "?scenario" in ENGINE_CRITERIA[v])
+_SHARED_CRITERIA = tuple(v for v in ENGINE_COUNT_VARS if v not in _TECH_CRITERIA + _SCEN_CRITERIA)
+
+def _batch_criterion_template(var: str, key: Optional[str]) -> str:
+    """Counts of ``var`` per centre, or per ``?key`` and centre with the keys given in ``{KEY_VALUES}``."""
+    select = f"?{key} ?center" if key else "?center"
+    values = "\n    {KEY_VALUES}" if key else ""
+    return (
+        ENGINE_PREFIXES + f"SELECT {select} (COUNT(DISTINCT ?match) AS ?n) WHERE {{"
+        + values + ENGINE_CRITERIA[var] + f"\n}} GROUP BY {select}\n"
+    )
 
-    for b in data.get("results", {}).get("bindings", []):
-        center_uri   = _get_val(b, "center")
-        center_label = _get_val(b, "centerLabel")
+ENGINE_BATCH_TEMPLATES = {
+    v: _batch_criterion_template(v, "selTech" if v in _TECH_CRITERIA else "scenario" if v in _SCEN_CRITERIA else None)
+    for v in ENGINE_COUNT_VARS
+}
 
-        tech_use   = _get_int(b, "techUseCount")
-        tech_train = _get_int(b, "techTrainCount")
-        incident   = _get_int(b, "incidentCount")
-        threat_cap = _get_int(b, "threatCapCount")
-        facility   = _get_int(b, "facilityCount")
-        discipline = _get_int(b, "disciplineCount")
-        course     = _get_int(b, "courseCount")
-        network    = _get_int(b, "networkCount")
+def engine_rows_batch(pairs: List[Tuple[str, str]]) -> Optional[Dict[Tuple[str, str], List[Tuple]]]:
+    """
+    ``engine_rows`` for several ``(tech_uri, scen_uri)`` pairs, sharing the
+    queries between them: the centre list and the criteria that depend on
+    neither technology nor scenario are queried once, each technology
+    criterion once for all technologies (``VALUES ?selTech``) and each
+    scenario criterion once for all scenarios, so a batch costs the same
+    nine queries as one pair with ``ENGINE_QUERY_STRATEGY=split`` (and gives
+    the same rows).  None if any query failed.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return {}
+    techs = list(dict.fromkeys(t for t, _ in pairs))
+    scens = list(dict.fromkeys(s for _, s in pairs))
+    keys = {
+        "selTech": "VALUES ?selTech { " + " ".join(f"<{t}>" for t in techs) + " }",
+        "scenario": "VALUES ?scenario { " + " ".join(f"<{s}>" for s in scens) + " }",
+    }
+    queries = [ENGINE_SPLIT_CENTERS_TEMPLATE.replace("{CENTER_VALUES}", "")]
+    for v in ENGINE_COUNT_VARS:
+        key = "selTech" if v in _TECH_CRITERIA else "scenario" if v in _SCEN_CRITERIA else None
+        query = ENGINE_BATCH_TEMPLATES[v].replace("{KEY_VALUES}", keys[key] if key else "")
+        queries.append(expand_subclass_paths(query, techs))
+    names = ["engine_centers"] + ["engine_batch_" + v for v in ENGINE_COUNT_VARS]
+    centers, *per_criterion = run_sparql_many(queries, name=names, as_table=True, int_vars=("n",))
+    if not centers or not all(per_criterion):
+        print("[engine_rows_batch] ERROR: batch engine query failed")
+        return None
+
+    counts = {}
+    for v, table in zip(ENGINE_COUNT_VARS, per_criterion):
+        if v in _TECH_CRITERIA:
+            counts[v] = {(t, c): n for t, c, n in table.rows("selTech", "center", "n")}
+        elif v in _SCEN_CRITERIA:
+            counts[v] = {(s, c): n for s, c, n in table.rows("scenario", "center", "n")}
+        else:
+            counts[v] = dict(zip(table.column("center"), table.column("n")))
+    center_rows = list(dict.fromkeys(centers.rows("center", "centerLabel")))
+    order = [ENGINE_COUNT_VARS.index(v) + 2 for v in ENGINE_ORDER_VARS]
+    out = {}
+    for tech_uri, scen_uri in pairs:
+        rows = []
+        for center, label in center_rows:
+            row = [center, label]
+            for v in ENGINE_COUNT_VARS:
+                key = (tech_uri, center) if v in _TECH_CRITERIA else (scen_uri, center) if v in _SCEN_CRITERIA else center
+                row.append(counts[v].get(key, 0))
+            rows.append(tuple(row))
+        rows.sort(key=lambda r: [r[i] for i in order], reverse=True)
+        out[(tech_uri, scen_uri)] = rows
+    return out
 
+def get_recommendations_batch(pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    """``get_recommendations_for_uris`` for several ``(tech_uri, scen_uri)`` pairs (see ``engine_rows_batch``)."""
+    pairs = list(dict.fromkeys(pairs))
+    if RECOMMENDER_ENGINE != "local" or get_snapshot() is None:
+        with span("engine_batch", pairs=len(pairs)):
+            rows = engine_rows_batch(pairs)
+        if rows is not None:
+            return {pair: _engine_recs(rows[pair]) for pair in pairs}
+    # local snapshot (no queries), or the batch failed: pair by pair
+    return {pair: get_recommendations_for_uris(*pair) for pair in pairs}
+
+def _remote_recommendations(tech_uri: str, scen_uri: str, center_uris: Optional[List[str]] = None):
+    if center_uris is not None and not center_uris:
+        return []
+    return _engine_recs(engine_rows(tech_uri, scen_uri, center_uris))
+
+def _engine_recs(rows) -> List[Dict[str, Any]]:
+    results = []
+    for (center_uri, center_label, tech_use, tech_train, incident, threat_cap,
+         facility, discipline, course, network) in rows:
         results.append(
             {
                 "center_uri": center_uri,
@@ -433,29 +723,31 @@ def get_explanations(tech_label: str, scen_label: str, center_label: str):
     if not tech_uri or not scen_uri or not center_uri:
         print("[get_explanations] missing URI")
         return []
+    return get_explanations_for_uris(tech_uri, scen_uri, center_uri)
 
+def get_explanations_for_uris(tech_uri: str, scen_uri: str, center_uri: str):
+    if COMBINED_DETAILS_QUERY:
+        return get_details_for_uris(tech_uri, scen_uri, center_uri)[0]
     q = (
-        EXPLAIN_QUERY_TEMPLATE
+        expand_subclass_paths(EXPLAIN_QUERY_TEMPLATE, tech_uri)
         .replace("{TECH_URI}", tech_uri)
         .replace("{SCENARIO_URI}", scen_uri)
         .replace("{CENTER_URI}", center_uri)
     )
-    data = run_sparql(q)
-    out = []
-    for b in data.get("results", {}).get("bindings", []):
-        criterion = _get_val(b, "criterion", "")
-        entity = _get_val(b, "entityLabel", "")
-        # Map discipline short codes (B/C/RN) to human-readable labels for explanations
-        if criterion == "Discipline Match" and entity in DISCIPLINE_MAP:
-            entity = DISCIPLINE_MAP[entity]
-        out.append(
-            {
-                "criterion": criterion,
-                "entity": entity,
-                "text": _get_val(b, "explanation", ""),
-            }
-        )
-    return out
+    data = run_sparql(q, name="explain")
+    return [_explanation_from_binding(b) for b in data.get("results", {}).get("bindings", [])]
+
+def _explanation_from_binding(b: Dict[str, Any]) -> Dict[str, str]:
+    criterion = _get_val(b, "criterion", "")
+    entity = _get_val(b, "entityLabel", "")
+    # Map discipline short codes (B/C/RN) to human-readable labels for explanations
+    if criterion == "Discipline Match" and entity in DISCIPLINE_MAP:
+        entity = DISCIPLINE_MAP[entity]
+    return {
+        "criterion": criterion,
+        "entity": entity,
+        "text": _get_val(b, "explanation", ""),
+    }
 
 
 JUST_QUERY_TEMPLATE = """
@@ -614,142 +906,814 @@ def get_justification_graph(tech_label: str, scen_label: str, center_label: str)
     if not tech_uri or not scen_uri or not center_uri:
         print("[get_justification_graph] missing URI")
         return {"edges": [], "paths": []}
+    return get_justification_graph_for_uris(tech_uri, scen_uri, center_uri)
 
+def get_justification_graph_for_uris(tech_uri: str, scen_uri: str, center_uri: str):
+    if COMBINED_DETAILS_QUERY:
+        return get_details_for_uris(tech_uri, scen_uri, center_uri)[1]
     q = (
-        JUST_QUERY_TEMPLATE
+        expand_subclass_paths(JUST_QUERY_TEMPLATE, tech_uri)
         .replace("{TECH_URI}", tech_uri)
         .replace("{SCENARIO_URI}", scen_uri)
         .replace("{CENTER_URI}", center_uri)
     )
-    data = run_sparql(q)
-    edges = []
-    for b in data.get("results", {}).get("bindings", []):
-        edges.append(
-            {
-                "edgeType": _get_val(b, "edgeType", ""),
-                "source": _get_val(b, "source", ""),
-                "sourceLabel": _get_val(b, "sourceLabel", ""),
-                "property": _get_val(b, "property", ""),
-                "propertyLabel": _get_val(b, "propertyLabel", ""),
-                "target": _get_val(b, "target", ""),
-                "targetLabel": _get_val(b, "targetLabel", ""),
-            }
-        )
+    data = run_sparql(q, name="justification")
+    edges = [_edge_from_binding(b) for b in data.get("results", {}).get("bindings", [])]
+    return _graph_from_edges(edges)
+
+def _edge_from_binding(b: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "edgeType": _get_val(b, "edgeType", ""),
+        "source": _get_val(b, "source", ""),
+        "sourceLabel": _get_val(b, "sourceLabel", ""),
+        "property": _get_val(b, "property", ""),
+        "propertyLabel": _get_val(b, "propertyLabel", ""),
+        "target": _get_val(b, "target", ""),
+        "targetLabel": _get_val(b, "targetLabel", ""),
+    }
+
+def _graph_from_edges(edges: List[Dict[str, str]]) -> Dict[str, Any]:
     paths = [f"{e['sourceLabel']} → {e['propertyLabel']} → {e['targetLabel']}" for e in edges]
     return {"edges": edges, "paths": paths}
 
-SCORE_KEYS = [
-    "tech_use_count",
-    "tech_train_count",
-    "incident_count",
-    "threat_cap_count",
-    "facility_count",
-    "discipline_count",
-    "course_count",
-    "network_count",
-]
-
-def _normalize_scores(items):
-    if not items:
-        return
-    max_vals = {k: 0 for k in SCORE_KEYS}
-    for item in items:
-        s = item["scores"]
-        for k in SCORE_KEYS:
-            v = s.get(k, 0)
-            if v > max_vals[k]:
-                max_vals[k] = v
-    for item in items:
-        s = item["scores"]
-        for k in SCORE_KEYS:
-            max_v = max_vals[k]
-            v = s.get(k, 0)
-            s[k + "_norm"] = v / max_v if max_v > 0 else 0.0
-
-def _compute_cluster_scores(s):
-    # Ανάκτηση των κανονικοποιημένων τιμών (0.0 - 1.0)
-    tu = s.get("tech_use_count_norm", 0.0)
-    tt = s.get("tech_train_count_norm", 0.0)
-    ic = s.get("incident_count_norm", 0.0)
-    th = s.get("threat_cap_count_norm", 0.0)
-    fa = s.get("facility_count_norm", 0.0)
-    di = s.get("discipline_count_norm", 0.0)
-    co = s.get("course_count_norm", 0.0)
-    ne = s.get("network_count_norm", 0.0)
-
-    # Υπολογισμός Core Scores (Μέσοι όροι για χρήση στο Penalty) *ΔΕΝ ΧΡΗΣΙΜΟΠΟΙΕΊΤΑΙ* 
-    tech_core = (tu + tt) / 2
-    scen_core = (ic + th) / 2
-    core_score = (tech_core + scen_core) / 2
-
-    # --- 1. Operational Fit Clustering (Weighted Sum Model) ---
-    # Scientific Basis: AHP (Analytic Hierarchy Process) logic.
-    # Δίνουμε προτεραιότητα στα 'Hard Constraints' (Tech Use), αλλά διατηρούμε
-    # ισχυρή επιρροή του Σεναρίου (Context).
-    # Αναλογία: Tech (35% + 25% = 60%) vs Scenario (25% + 15% = 40%)
-    operational_fit = 0.35 * tu + 0.20 * tt + 0.25 * ic + 0.20 * th
-
-    # --- 2. Capacity & Infrastructure Clusters ---
-    training_capacity = 0.60 * co + 0.40 * di
-    infrastructure_coop = 0.60 * fa + 0.40 * ne
-
-    # --- 3. Base Score Calculation ---
-    # Δίνουμε κυρίαρχο ρόλο στο Operational Fit (65%) για να διασφαλίσουμε τη σχετικότητα (Relevance).
-    base_score = 0.65 * operational_fit + 0.15 * training_capacity + 0.20 * infrastructure_coop
-
-    # --- 4. Penalty Factor (Soft/Concave Approach) --- ΔΕΝ ΧΡΗΣΙΜΟΠΟΙΕΊΤΑΙ 
-    # Scientific Basis: Χρήση Concave Function (Root) για ομαλοποίηση.
-    # Η γραμμική τιμωρία (Linear Penalty) ήταν πολύ αυστηρή για μεσαία σκορ.
-    # Η ρίζα (sqrt) επιτρέπει στα σχετικά κέντρα να μην βυθίζονται, ενώ τα άσχετα παραμένουν χαμηλά.
-    # Τύπος: 0.5 + 0.5 * sqrt(core_score)
-    penalty_factor = 0.5 + 0.5 * (core_score ** 0.5)
-
-    # --- 5. Final Score & Scaling (Linear Transformation) --- *ΔΕΝ ΧΡΗΣΙΜΟΠΟΙΕΊΤΑΙ* 
-    # Υπολογισμός αρχικού τελικού σκορ
-    raw_final = base_score * penalty_factor
-    
-    # Scaling Factor (x1.5): Μετασχηματισμός για βελτίωση UX. *ΔΕΝ ΧΡΗΣΙΜΟΠΟΙΕΊΤΑΙ* 
-    # Φέρνει τα σκορ σε πιο "φυσιολογικά" επίπεδα (π.χ. το 6/10 γίνεται 9/10),
-    # αξιοποιώντας όλο το εύρος της κλίμακας 0-10.
-    # Cap (Ταβάνι) στο 1.0 για να μην υπερβούμε το 10/10.
-    final_score_0_1 = min(1.0, raw_final * 1.5)
-    
-    # Το penalty factor δεν χρεισημοποιείται στην συγκεκριμένη έκδοση, το αποτέλεσμα είναι απλα το base score σε κλίμακα [0-10]
-    final_score_0_10 = 10 * base_score
-
-    # Αποθήκευση αποτελεσμάτων στο λεξικό
-    s["tech_core"] = tech_core
-    s["scenario_core"] = scen_core
-    s["core_score"] = core_score
-    s["operational_fit"] = operational_fit
-    s["training_capacity"] = training_capacity
-    s["infrastructure_coop"] = infrastructure_coop
-    s["base_score_0_1"] = base_score
-    s["penalty_factor"] = penalty_factor
-    s["final_score_0_1"] = final_score_0_1
-    s["final_score_0_10"] = final_score_0_10
-    s["total_score"] = final_score_0_10
-    
-def build_ui_payload(tech_label: str, scen_label: str):
-    recs = get_recommendations(tech_label, scen_label)
-    ui_items = []
-    for r in recs:
-        center_label = r["center_label"]
-        explanations = get_explanations(tech_label, scen_label, center_label)
-        graph = get_justification_graph(tech_label, scen_label, center_label)
-        scores = dict(r["scores"])
-        ui_items.append(
-            {
-                "center_uri": r["center_uri"],
-                "center_label": center_label,
-                "region": r.get("region", ""),
-                "scores": scores,
-                "explanations_simple": explanations,
-                "graph_paths": graph["paths"],
-            }
-        )
-    _normalize_scores(ui_items)
-    for item in ui_items:
-        _compute_cluster_scores(item["scores"])
-    ui_items.sort(key=lambda x: x["scores"].get("final_score_0_1", 0.0), reverse=True)
+# --- Batched explanation / justification -------------------------------------
+# The per-centre templates above are rewritten into a multi-centre form: the
+# single BIND of ?center becomes a VALUES block, ?center is projected and the
+# rows are ordered by centre first, so one request serves a whole chunk of
+# centres instead of one round trip per centre.
+
+BATCH_CHUNK_SIZE = int(os.getenv("SPARQL_BATCH_CHUNK_SIZE", "25"))
+
+def _batch_template(template: str) -> str:
+    bind_center = "BIND(<{CENTER_URI}>   AS ?center)"
+    assert bind_center in template and "SELECT DISTINCT\n" in template
+    return (
+        template
+        .replace("SELECT DISTINCT\n", "SELECT DISTINCT\n  ?center\n", 1)
+        .replace(bind_center, "VALUES ?center { {CENTER_URIS} }", 1)
+        .replace("ORDER BY ", "ORDER BY ?center ", 1)
+    )
+
+EXPLAIN_BATCH_QUERY_TEMPLATE = _batch_template(EXPLAIN_QUERY_TEMPLATE)
+JUST_BATCH_QUERY_TEMPLATE = _batch_template(JUST_QUERY_TEMPLATE)
+
+def _chunks(items: List[str], size: int):
+    size = max(1, size)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _center_chunks(center_uris: List[str]) -> List[List[str]]:
+    # dict.fromkeys keeps the first occurrence order and drops duplicate centres
+    unique = list(dict.fromkeys(u for u in center_uris if u))
+    return list(_chunks(unique, BATCH_CHUNK_SIZE))
+
+def _batch_query(template: str, tech_uri: str, scen_uri: str, chunk: List[str]) -> str:
+    return (
+        expand_subclass_paths(template, tech_uri)
+        .replace("{TECH_URI}", tech_uri)
+        .replace("{SCENARIO_URI}", scen_uri)
+        .replace("{CENTER_URIS}", " ".join(f"<{u}>" for u in chunk))
+    )
+
+def _batch_queries(template: str, tech_uri: str, scen_uri: str, center_uris: List[str]) -> List[str]:
+    return [_batch_query(template, tech_uri, scen_uri, chunk) for chunk in _center_chunks(center_uris)]
+
+def _collect_explanations(results: List[Dict[str, Any]], center_uris: List[str]) -> Dict[str, List[Dict[str, str]]]:
+    out: Dict[str, List[Dict[str, str]]] = {u: [] for u in center_uris}
+    for data in results:
+        for b in data.get("results", {}).get("bindings", []):
+            out.setdefault(_get_val(b, "center"), []).append(_explanation_from_binding(b))
+    return out
+
+def _collect_graphs(results: List[Dict[str, Any]], center_uris: List[str]) -> Dict[str, Dict[str, Any]]:
+    edges: Dict[str, List[Dict[str, str]]] = {u: [] for u in center_uris}
+    for data in results:
+        for b in data.get("results", {}).get("bindings", []):
+            edges.setdefault(_get_val(b, "center"), []).append(_edge_from_binding(b))
+    return {u: _graph_from_edges(e) for u, e in edges.items()}
+
+def get_explanations_batch(tech_uri: str, scen_uri: str, center_uris: List[str]) -> Dict[str, List[Dict[str, str]]]:
+    """Explanations for many centres in ceil(N / BATCH_CHUNK_SIZE) queries, keyed by centre URI."""
+    if COMBINED_DETAILS_QUERY:
+        return {u: d[0] for u, d in get_details_batch(tech_uri, scen_uri, center_uris).items()}
+    queries = _batch_queries(EXPLAIN_BATCH_QUERY_TEMPLATE, tech_uri, scen_uri, center_uris)
+    return _collect_explanations(run_sparql_many(queries, name="explain_batch"), center_uris)
+
+def get_justification_graphs_batch(tech_uri: str, scen_uri: str, center_uris: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Justification graphs for many centres in ceil(N / BATCH_CHUNK_SIZE) queries, keyed by centre URI."""
+    if COMBINED_DETAILS_QUERY:
+        return {u: d[1] for u, d in get_details_batch(tech_uri, scen_uri, center_uris).items()}
+    queries = _batch_queries(JUST_BATCH_QUERY_TEMPLATE, tech_uri, scen_uri, center_uris)
+    return _collect_graphs(run_sparql_many(queries, name="justification_batch"), center_uris)
+
+# --- Combined explanation + justification query -----------------------------
+# EXPLAIN_QUERY_TEMPLATE and JUST_QUERY_TEMPLATE walk mostly the same patterns.
+# DETAILS_QUERY_TEMPLATE matches every edge once, without labels, and both the
+# explanations and the justification graph are derived from its rows in
+# Python; labels come from LABEL_INDEX (or one VALUES query when the index is
+# not loaded).  The output is the same as running the two templates, with
+# two differences in the patterns that are kept as separate edge types:
+#
+# - "Technology Training" explanations need courses on exactly the selected
+#   technology (COURSE_SELECTED_TECH), while COURSE_TECH / TECH_TRAINING_COURSE
+#   edges follow typed technologies through rdfs:subClassOf*
+# - "Threat Capability" explanations name the threat (?via), the
+#   CENTER_RESOURCE_THREAT edge points at the resource
+#
+# COMBINED_DETAILS_QUERY=0 goes back to the two separate queries.
+
+COMBINED_DETAILS_QUERY = os.getenv("COMBINED_DETAILS_QUERY", "1") == "1"
+
+DETAILS_QUERY_TEMPLATE = """
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+PREFIX en:   <http://www.semanticweb.org/eNOVATION-ontology#>
+
+SELECT DISTINCT
+  ?edgeType
+  ?source
+  ?property
+  ?target
+  ?via
+WHERE {{
+
+  BIND(<{CENTER_URI}>   AS ?center)
+  BIND(<{TECH_URI}>     AS ?selTech)
+  BIND(<{SCENARIO_URI}> AS ?scenario)
+
+  {{
+    {{ ?center en:usesTechnology ?selTech . BIND(?selTech AS ?techUsed) }}
+    UNION
+    {{ ?center en:usesTechnology ?techUsed . ?techUsed a ?techClass . ?techClass rdfs:subClassOf* ?selTech . }}
+
+    BIND("TECH_USE" AS ?edgeType)
+    BIND(?center AS ?source)
+    BIND(en:usesTechnology AS ?property)
+    BIND(?techUsed AS ?target)
+  }}
+
+  UNION
+  {{
+    ?center en:providesTrainingCourse ?course .
+    ?course en:trainsOnTechnology ?techTrain .
+    ?techTrain a ?techClass2 .
+    ?techClass2 rdfs:subClassOf* ?selTech .
+
+    BIND("COURSE_TECH" AS ?edgeType)
+    BIND(?course AS ?source)
+    BIND(en:trainsOnTechnology AS ?property)
+    BIND(?techTrain AS ?target)
+  }}
+
+  UNION
+  {{
+    ?center en:providesTrainingCourse ?course2 .
+    ?course2 en:trainsOnTechnology ?selTech .
+
+    BIND("COURSE_SELECTED_TECH" AS ?edgeType)
+    BIND(?course2 AS ?source)
+    BIND(en:trainsOnTechnology AS ?property)
+    BIND(?selTech AS ?target)
+  }}
+
+  UNION
+  {{
+    ?scenario en:isBasedOnIncident ?incident .
+    BIND("SCENARIO_INCIDENT" AS ?edgeType)
+    BIND(?scenario AS ?source)
+    BIND(en:isBasedOnIncident AS ?property)
+    BIND(?incident AS ?target)
+  }}
+
+  UNION
+  {{
+    ?scenario en:isBasedOnIncident ?incident2 .
+    ?center   en:tacklesIncident   ?incident2 .
+    BIND("CENTER_INCIDENT" AS ?edgeType)
+    BIND(?center AS ?source)
+    BIND(en:tacklesIncident AS ?property)
+    BIND(?incident2 AS ?target)
+  }}
+
+  UNION
+  {{
+    ?scenario en:isBasedOnIncident ?incident3 .
+    ?incident3 en:involvesThreat ?threat .
+    BIND("INCIDENT_THREAT" AS ?edgeType)
+    BIND(?incident3 AS ?source)
+    BIND(en:involvesThreat AS ?property)
+    BIND(?threat AS ?target)
+  }}
+
+  UNION
+  {{
+    ?scenario en:isBasedOnIncident ?incident4 .
+    ?incident4 en:involvesThreat ?threat2 .
+    ?center ?resProp ?resource .
+    FILTER(?resProp IN (en:hasEquipment, en:hasCapacity, en:usesTechnology)) .
+    ?resource en:adressesThreat ?threat2 .
+    BIND("CENTER_RESOURCE_THREAT" AS ?edgeType)
+    BIND(?center AS ?source)
+    BIND(?resProp AS ?property)
+    BIND(?resource AS ?target)
+    BIND(?threat2 AS ?via)
+  }}
+
+  UNION
+  {{
+    ?center en:hasFacility ?fac .
+    ?fac a ?facClass .
+    ?facClass rdfs:subClassOf* en:Facility .
+    BIND("CENTER_FACILITY" AS ?edgeType)
+    BIND(?center AS ?source)
+    BIND(en:hasFacility AS ?property)
+    BIND(?fac AS ?target)
+  }}
+
+  UNION
+  {{
+    ?center en:hasTCDiscipline ?disc .
+    BIND("CENTER_DISCIPLINE" AS ?edgeType)
+    BIND(?center AS ?source)
+    BIND(en:hasTCDiscipline AS ?property)
+    BIND(?disc AS ?target)
+  }}
+
+  UNION
+  {{
+    ?center en:providesTrainingCourse ?courseGen .
+    BIND("CENTER_COURSE" AS ?edgeType)
+    BIND(?center AS ?source)
+    BIND(en:providesTrainingCourse AS ?property)
+    BIND(?courseGen AS ?target)
+  }}
+
+  UNION
+  {{
+    ?center en:connectsWithNetwork ?net .
+    BIND("CENTER_NETWORK" AS ?edgeType)
+    BIND(?center AS ?source)
+    BIND(en:connectsWithNetwork AS ?property)
+    BIND(?net AS ?target)
+  }}
+}}
+"""
+
+DETAILS_BATCH_QUERY_TEMPLATE = _batch_template(DETAILS_QUERY_TEMPLATE)
+
+LABELS_FOR_URIS_QUERY = """
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+SELECT ?s ?l WHERE {
+  VALUES ?s { {URIS} }
+  ?s rdfs:label ?l .
+}
+"""
+
+EN_PREFIX = "http://www.semanticweb.org/eNOVATION-ontology#"
+
+# criterion -> (text before the label, text after it), as in EXPLAIN_QUERY_TEMPLATE
+EXPLANATION_TEXTS = {
+    "Technology Use": ("This centre uses the technology '", "', which matches your selected technology."),
+    "Technology Training": ("This centre offers the training course '", "', which focuses on your selected technology."),
+    "Incident Coverage": ("This centre has experience with incidents of type '", "', which are part of your scenario."),
+    "Threat Capability": ("This centre has resources that address the threat '", "' present in your scenario."),
+    "Facility Match": ("This centre provides relevant facilities such as '", "' to support training and operations."),
+    "Discipline Match": ("This centre includes expertise in '", "', which is relevant for this type of scenario."),
+    "Training Capability": ("This centre offers the course '", "', contributing to overall CBRN training capacity."),
+    "Network Links": ("This centre is connected with the network '", "', supporting cooperation and knowledge sharing."),
+}
+
+# edge type -> criterion of the explanation and which end of the edge it names
+_EXPLAINED_EDGES = {
+    "COURSE_SELECTED_TECH": ("Technology Training", "source"),
+    "CENTER_INCIDENT": ("Incident Coverage", "target"),
+    "CENTER_RESOURCE_THREAT": ("Threat Capability", "via"),
+    "CENTER_FACILITY": ("Facility Match", "target"),
+    "CENTER_DISCIPLINE": ("Discipline Match", "target"),
+    "CENTER_COURSE": ("Training Capability", "target"),
+    "CENTER_NETWORK": ("Network Links", "target"),
+}
+
+# columns of DETAILS_QUERY_TEMPLATE rows, in the order _details_from_rows unpacks them
+DETAIL_COLUMNS = ("edgeType", "source", "property", "target", "via")
+_EXPLAINED_COLUMNS = {edge: (criterion, DETAIL_COLUMNS.index(end)) for edge, (criterion, end) in _EXPLAINED_EDGES.items()}
+
+def _explanation(criterion: str, label: str) -> Dict[str, str]:
+    prefix, suffix = EXPLANATION_TEXTS[criterion]
+    entity = label
+    if criterion == "Discipline Match" and entity in DISCIPLINE_MAP:
+        entity = DISCIPLINE_MAP[entity]
+    return {"criterion": criterion, "entity": entity, "text": prefix + label + suffix}
+
+def _local_name(uri: str) -> str:
+    # STRAFTER(STR(?x), "#"): empty when there is no "#"
+    return uri.split("#", 1)[1] if "#" in uri else ""
+
+def _label_lookup(tables: List[SparqlTable]):
+    """uri -> [(label, lang), ...] for every IRI in the node columns of ``tables``."""
+    if LABEL_INDEX.ensure_loaded():
+        return LABEL_INDEX.labels_of
+    # source/property/target/via only ever hold IRIs or blank nodes; blank node ids have no ":"
+    iris = sorted({
+        value
+        for table in tables
+        for name in DETAIL_COLUMNS[1:]
+        for value in table.column(name)
+        if value and ":" in value
+    })
+    labels: Dict[str, List[Tuple[str, str]]] = {}
+    queries = [
+        LABELS_FOR_URIS_QUERY.replace("{URIS}", " ".join(f"<{u}>" for u in chunk))
+        for chunk in _chunks(iris, 200)
+    ]
+    for table in run_sparql_many(queries, name="labels_values", as_table=True):
+        for uri, label, lang in zip(table.column("s"), table.column("l"), table.lang("l")):
+            own = labels.setdefault(uri, [])
+            if (label, lang) not in own:
+                own.append((label, lang))
+    return lambda uri: labels.get(uri, [])
+
+def _details_from_rows(rows: List[Tuple[Optional[str], ...]], tech_uri: str, center_uri: str, labels_of) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """(explanations_simple, {"edges", "paths"}) of one centre from its DETAILS_QUERY_TEMPLATE rows (DETAIL_COLUMNS tuples)."""
+    explained = set()
+    edges = set()
+    for row in rows:
+        edge_type, source, prop, target, _ = (v or "" for v in row)
+        if edge_type == "TECH_USE" and target == tech_uri:
+            explained.add(("Technology Use", tech_uri))
+        if edge_type in _EXPLAINED_COLUMNS:
+            criterion, end = _EXPLAINED_COLUMNS[edge_type]
+            explained.add((criterion, row[end] or ""))
+        if edge_type == "COURSE_SELECTED_TECH":
+            continue
+        edges.add((edge_type, source, prop, target))
+        if edge_type == "COURSE_TECH":
+            edges.add(("TECH_TRAINING_COURSE", center_uri, EN_PREFIX + "providesTrainingCourse", source))
+
+    # explanations need a label (inner join in EXPLAIN_QUERY_TEMPLATE); one per label
+    terms = sorted(
+        {(criterion, label, lang, uri) for criterion, uri in explained for label, lang in labels_of(uri)}
+    )
+    explanations = [_explanation(criterion, label) for criterion, label, _, _ in terms]
+
+    def names(uri: str) -> List[str]:
+        found = list(dict.fromkeys(label for label, _ in labels_of(uri)))
+        return found or [_local_name(uri)]
+
+    rows_out = set()
+    for edge_type, source, prop, target in edges:
+        for s in names(source):
+            for p in names(prop):
+                for t in names(target):
+                    rows_out.add((edge_type, s, t, p, source, prop, target))
+    graph_edges = [
+        {
+            "edgeType": edge_type,
+            "source": source,
+            "sourceLabel": s,
+            "property": prop,
+            "propertyLabel": p,
+            "target": target,
+            "targetLabel": t,
+        }
+        for edge_type, s, t, p, source, prop, target in sorted(rows_out)
+    ]
+    return explanations, _graph_from_edges(graph_edges)
+
+def _collect_details(tables: List[SparqlTable], tech_uri: str, center_uris: List[str]) -> Dict[str, Tuple[List[Dict[str, str]], Dict[str, Any]]]:
+    """Per-centre details from DETAILS_BATCH_QUERY_TEMPLATE results (rows carry ?center)."""
+    rows: Dict[str, List[Tuple[Optional[str], ...]]] = {u: [] for u in center_uris}
+    for table in tables:
+        for center, *row in table.rows("center", *DETAIL_COLUMNS):
+            rows.setdefault(center, []).append(row)
+    labels_of = _label_lookup(tables)
+    return {u: _details_from_rows(r, tech_uri, u, labels_of) for u, r in rows.items()}
+
+def get_details_for_uris(tech_uri: str, scen_uri: str, center_uri: str) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """Explanations and justification graph of one centre from a single query."""
+    q = (
+        expand_subclass_paths(DETAILS_QUERY_TEMPLATE, tech_uri)
+        .replace("{TECH_URI}", tech_uri)
+        .replace("{SCENARIO_URI}", scen_uri)
+        .replace("{CENTER_URI}", center_uri)
+    )
+    table = run_sparql_table(q, name="details")
+    return _details_from_rows(list(table.rows(*DETAIL_COLUMNS)), tech_uri, center_uri, _label_lookup([table]))
+
+def get_details_batch(tech_uri: str, scen_uri: str, center_uris: List[str]) -> Dict[str, Tuple[List[Dict[str, str]], Dict[str, Any]]]:
+    """
+    Explanations and graphs for many centres in ceil(N / BATCH_CHUNK_SIZE)
+    queries, keyed by centre URI.  Centres whose query failed are left out.
+    """
+    chunks = _center_chunks(center_uris)
+    queries = [_batch_query(DETAILS_BATCH_QUERY_TEMPLATE, tech_uri, scen_uri, chunk) for chunk in chunks]
+    tables = run_sparql_many(queries, name="details_batch", as_table=True)
+    answered = [u for chunk, table in zip(chunks, tables) if table for u in chunk]
+    return _collect_details([table for table in tables if table], tech_uri, answered)
+
+# Option lists for the UI: only owl:NamedIndividual instances, so classes such as
+# "DIM Technology" do not show up as selectable values.
+TECH_OPTIONS_QUERY = """
+PREFIX en: <http://www.semanticweb.org/eNOVATION-ontology#>
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+PREFIX owl: <http://www.w3.org/2002/07/owl#>
+
+SELECT DISTINCT ?label WHERE {
+  ?s a ?type .
+  ?type rdfs:subClassOf* en:Technology .
+  ?s a owl:NamedIndividual .
+  ?s rdfs:label ?label .
+} ORDER BY ?label
+"""
+
+SCEN_OPTIONS_QUERY = """
+PREFIX en: <http://www.semanticweb.org/eNOVATION-ontology#>
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+PREFIX owl: <http://www.w3.org/2002/07/owl#>
+
+SELECT DISTINCT ?label WHERE {
+  ?s a ?type .
+  ?type rdfs:subClassOf* en:Scenario .
+  ?s a owl:NamedIndividual .
+  ?s rdfs:label ?label .
+} ORDER BY ?label
+"""
+
+# Seconds the option lists are kept after a successful fetch (0 disables);
+# dropped whenever the SPARQL result cache is cleared (sparql_client.on_cache_clear)
+OPTIONS_CACHE_TTL = float(os.getenv("OPTIONS_CACHE_TTL", "3600"))
+_options_cache = TTLCache(1, OPTIONS_CACHE_TTL)
+
+def get_option_labels():
+    """Technology and scenario labels for the UI (shared lists, treat as read-only)."""
+    if OPTIONS_CACHE_TTL <= 0:
+        return _query_option_labels()
+    # empty lists mean the endpoint failed: not cached, the next page load asks again
+    return _options_cache.get_or_compute("options", _query_option_labels, cacheable=lambda v: bool(v[0] or v[1]))
+
+def _query_option_labels():
+    """Technology and scenario labels, fetched in parallel."""
+    tech_data, scen_data = run_sparql_many([TECH_OPTIONS_QUERY, SCEN_OPTIONS_QUERY], name=["tech_options", "scen_options"])
+    tech_labels = [b["label"]["value"] for b in tech_data.get("results", {}).get("bindings", [])]
+    scen_labels = [b["label"]["value"] for b in scen_data.get("results", {}).get("bindings", [])]
+    return tech_labels, scen_labels
+
+@on_cache_clear
+def clear_option_cache() -> None:
+    _options_cache.clear()
+
+def score_items(items, profile: Optional[str] = None):
+    """Normalize the raw counts of ``items`` and add the score fields of ``profile`` (in place)."""
+    get_profile(profile).score(items)
+
+# Centres whose explanations / graph paths are sent with the ranking; the rest
+# are fetched on demand through /api/explain and /api/justification
+DETAILS_PREFETCH_TOP_K = int(os.getenv("DETAILS_PREFETCH_TOP_K", "3"))
+
+def build_ui_payload(tech_label: str, scen_label: str, top_k: Optional[int] = None, profile: Optional[str] = None):
+    """
+    Ranked UI items for a technology/scenario pair, scored with the scoring
+    profile ``profile`` (default: ``SCORING_PROFILE``).
+
+    Explanations and graph paths are only filled in for the ``top_k`` best
+    centres (all of them when ``top_k`` is None); the others come back with
+    ``details_loaded: False`` and empty lists.
+    """
+    return _build_ui_payload(tech_label, scen_label, top_k, profile)[0]
+
+def _build_ui_payload(tech_label: str, scen_label: str, top_k: Optional[int] = None, profile: Optional[str] = None):
+    """``(items, complete)``: ``build_ui_payload`` and whether every details query succeeded."""
+    tech_uri = get_uri_for_label(tech_label)
+    scen_uri = get_uri_for_label(scen_label)
+    if not tech_uri or not scen_uri:
+        print("[build_ui_payload] ABORT – missing tech or scenario URI")
+        return [], False
+    ui_items = _bare_items(get_recommendations_for_uris(tech_uri, scen_uri))
+    if top_k is None:
+        complete = attach_details(tech_uri, scen_uri, ui_items)
+        rank_items(ui_items, profile)
+        return ui_items, complete
+    # Scores only need the counts: rank first, then fetch details for the head
+    rank_items(ui_items, profile)
+    complete = attach_details(tech_uri, scen_uri, ui_items[:max(top_k, 0)])
+    return ui_items, complete
+
+# Largest number of pairs accepted by /api/recommend/batch
+RECOMMEND_BATCH_MAX_PAIRS = int(os.getenv("RECOMMEND_BATCH_MAX_PAIRS", "100"))
+
+def build_ui_payload_batch(label_pairs: List[Tuple[str, str]], top_k: Optional[int] = None, profile: Optional[str] = None):
+    """
+    ``build_ui_payload`` for several ``(tech label, scenario label)`` pairs,
+    keyed by pair.  Each label is resolved once and the engine counts of all
+    pairs come from one set of shared queries (``get_recommendations_batch``);
+    only the explanations / graph paths are fetched pair by pair.  Pairs with
+    an unknown label map to ``[]``.
+    """
+    return {pair: items for pair, (items, _) in _build_ui_payload_batch(label_pairs, top_k, profile).items()}
+
+def _build_ui_payload_batch(label_pairs: List[Tuple[str, str]], top_k: Optional[int] = None, profile: Optional[str] = None):
+    """``{pair: (items, complete)}``, see ``_build_ui_payload``."""
+    label_pairs = list(dict.fromkeys(label_pairs))
+    uris = {label: get_uri_for_label(label) for label in dict.fromkeys(l for pair in label_pairs for l in pair)}
+    pair_uris = {pair: (uris[pair[0]], uris[pair[1]]) for pair in label_pairs}
+    recs = get_recommendations_batch([p for p in pair_uris.values() if p[0] and p[1]])
+    out = {}
+    for pair, (tech_uri, scen_uri) in pair_uris.items():
+        if not tech_uri or not scen_uri:
+            print(f"[build_ui_payload_batch] missing tech or scenario URI for {pair!r}")
+            out[pair] = [], False
+            continue
+        ui_items = _bare_items(recs[(tech_uri, scen_uri)])
+        rank_items(ui_items, profile)
+        complete = attach_details(tech_uri, scen_uri, ui_items if top_k is None else ui_items[:max(top_k, 0)])
+        out[pair] = ui_items, complete
+    return out
+
+# Last good payload of each /api/recommend request: served as is for RECOMMEND_FRESH_TTL
+# seconds, then (marked stale) for up to RECOMMEND_STALE_TTL while it is recomputed in the
+# background, so an endpoint outage does not turn into failed or slow requests
+RECOMMEND_FRESH_TTL = float(os.getenv("RECOMMEND_FRESH_TTL", os.getenv("SPARQL_CACHE_TTL", "300")))
+RECOMMEND_STALE_TTL = float(os.getenv("RECOMMEND_STALE_TTL", "86400"))
+_payloads = StaleWhileRevalidate(int(os.getenv("RECOMMEND_CACHE_SIZE", "1024")), RECOMMEND_FRESH_TTL, RECOMMEND_STALE_TTL)
+
+def build_ui_payload_swr(tech_label: str, scen_label: str, top_k: Optional[int] = None, profile: Optional[str] = None):
+    """
+    ``(items, stale)``: ``build_ui_payload`` through the stale-while-revalidate
+    cache.  An empty payload (unknown label or failed engine query) or one
+    with a failed details query is never kept, so it does not replace the
+    last good one.  Items are shared between requests and must not be changed.
+    """
+    if RECOMMEND_STALE_TTL <= 0:
+        return build_ui_payload(tech_label, scen_label, top_k=top_k, profile=profile), False
+    # the compiled profile is part of the key: editing its file invalidates the payloads
+    key = (tech_label, scen_label, top_k, get_profile(profile))
+    (items, _), stale = _payloads.get(
+        key, lambda: _build_ui_payload(tech_label, scen_label, top_k, profile), usable=_complete_payload
+    )
+    return items, stale
+
+def build_ui_payload_batch_swr(label_pairs: List[Tuple[str, str]], top_k: Optional[int] = None, profile: Optional[str] = None):
+    """
+    ``{pair: (items, stale)}``: ``build_ui_payload_batch`` through the same
+    cache entries as ``build_ui_payload_swr``.  Only the pairs without a
+    payload to serve are computed (together) before returning.
+    """
+    if RECOMMEND_STALE_TTL <= 0:
+        return {pair: (items, False) for pair, items in build_ui_payload_batch(label_pairs, top_k, profile).items()}
+    scorer = get_profile(profile)
+    keys = {(tech, scen, top_k, scorer): (tech, scen) for tech, scen in label_pairs}
+
+    def compute_many(missing):
+        built = _build_ui_payload_batch([keys[key] for key in missing], top_k, profile)
+        return {key: built[keys[key]] for key in missing}
+
+    served = _payloads.get_many(list(keys), compute_many, usable=_complete_payload)
+    return {pair: (served[key][0][0], served[key][1]) for key, pair in keys.items()}
+
+def _complete_payload(value) -> bool:
+    items, complete = value
+    return bool(items) and complete
+
+on_cache_clear(_payloads.clear)
+register_gauges("recommend_payloads", _payloads.stats)
+
+def _bare_items(recs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "center_uri": r["center_uri"],
+            "center_label": r["center_label"],
+            "region": r.get("region", ""),
+            "scores": dict(r["scores"]),
+            "explanations_simple": [],
+            "graph_paths": [],
+            "details_loaded": False,
+        }
+        for r in recs
+    ]
+
+def build_center_items(tech_uri: str, scen_uri: str, recs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """UI items (raw counts, explanations, graph paths) for engine rows; not scored yet."""
+    ui_items = _bare_items(recs)
+    attach_details(tech_uri, scen_uri, ui_items)
     return ui_items
+
+def attach_details(tech_uri: str, scen_uri: str, ui_items: List[Dict[str, Any]]) -> bool:
+    """
+    Fill ``explanations_simple`` / ``graph_paths`` of ``ui_items`` in place.
+    Items whose details query failed keep ``details_loaded: False`` (the UI
+    loads them on demand); returns False if there are any.
+    """
+    if not ui_items:
+        return True
+    # Centre URIs come straight from the engine query, so no label lookups here
+    center_uris = [item["center_uri"] for item in ui_items]
+    with span("details", centres=len(center_uris)):
+        if COMBINED_DETAILS_QUERY:
+            details = get_details_batch(tech_uri, scen_uri, center_uris)
+            explanations = {u: d[0] for u, d in details.items()}
+            graphs = {u: d[1] for u, d in details.items()}
+        else:
+            # Explanation and justification chunks are independent: send them all at once
+            chunks = _center_chunks(center_uris)
+            explain_qs = [_batch_query(EXPLAIN_BATCH_QUERY_TEMPLATE, tech_uri, scen_uri, chunk) for chunk in chunks]
+            just_qs = [_batch_query(JUST_BATCH_QUERY_TEMPLATE, tech_uri, scen_uri, chunk) for chunk in chunks]
+            names = ["explain_batch"] * len(explain_qs) + ["justification_batch"] * len(just_qs)
+            results = run_sparql_many(explain_qs + just_qs, name=names)
+            explain_results, just_results = results[:len(chunks)], results[len(chunks):]
+            # a failed query comes back as {}: its centres stay without details
+            answered = [u for chunk, e, j in zip(chunks, explain_results, just_results) if e and j for u in chunk]
+            explanations = _collect_explanations([r for r in explain_results if r], answered)
+            graphs = _collect_graphs([r for r in just_results if r], answered)
+    complete = True
+    for item in ui_items:
+        center_uri = item["center_uri"]
+        if center_uri not in explanations or center_uri not in graphs:
+            complete = False
+            continue
+        item["explanations_simple"] = explanations[center_uri]
+        item["graph_paths"] = graphs[center_uri]["paths"]
+        item["details_loaded"] = True
+    return complete
+
+def limit_details(ui_items: List[Dict[str, Any]], top_k: Optional[int]) -> List[Dict[str, Any]]:
+    """Copy of ranked ``ui_items`` keeping explanations / graph paths only for the first ``top_k``."""
+    if top_k is None:
+        return ui_items
+    out = []
+    for i, item in enumerate(ui_items):
+        if i >= top_k:
+            item = dict(item, explanations_simple=[], graph_paths=[], details_loaded=False)
+        out.append(item)
+    return out
+
+def rank_items(ui_items: List[Dict[str, Any]], profile: Optional[str] = None) -> None:
+    """Score ``ui_items`` from their raw counts and sort them best first (in place)."""
+    with span("score", items=len(ui_items)):
+        get_profile(profile).rank(ui_items)
+
+# Scored rankings shared by the pages of /api/recommend?limit=...&offset=...
+RANKING_CACHE_SIZE = int(os.getenv("RANKING_CACHE_SIZE", "256"))
+RANKING_CACHE_TTL = float(os.getenv("RANKING_CACHE_TTL", "600"))
+_ranking_cache = TTLCache(RANKING_CACHE_SIZE, RANKING_CACHE_TTL)
+
+def ranking_id(ui_items: List[Dict[str, Any]], rank_by: str) -> str:
+    """Short digest of the scores of a ranking; pages with the same id come from the same ranking."""
+    h = sha1()
+    for uri, score in sorted((item["center_uri"], item["scores"].get(rank_by, 0.0)) for item in ui_items):
+        h.update(f"{uri}\t{score!r}\n".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def get_ranking(tech_uri: str, scen_uri: str, profile: Optional[str] = None):
+    """
+    ``(ranking_id, items)``: every centre of the pair scored with ``profile``,
+    in engine order and without details.  Kept for ``RANKING_CACHE_TTL``
+    seconds, so all pages of a ranking share one engine query and one scoring
+    pass.  The items are shared between requests: copy before changing them.
+    """
+    scorer = get_profile(profile)
+    key = (tech_uri, scen_uri, scorer.name)
+
+    def compute():
+        ui_items = _bare_items(get_recommendations_for_uris(tech_uri, scen_uri))
+        with span("score", items=len(ui_items)):
+            scorer.score(ui_items)
+        return scorer, ranking_id(ui_items, scorer.rank_by), ui_items
+
+    # an empty ranking usually means the engine query failed: not kept
+    cached = _ranking_cache.get_or_compute(key, compute, cacheable=lambda v: bool(v[2]))
+    if cached[0] is not scorer:
+        # the profile file changed since this ranking was scored
+        _ranking_cache.invalidate(key)
+        cached = _ranking_cache.get_or_compute(key, compute, cacheable=lambda v: bool(v[2]))
+    return cached[1], cached[2]
+
+@on_cache_clear
+def clear_ranking_cache() -> None:
+    _ranking_cache.clear()
+
+def build_ui_page(tech_label: str, scen_label: str, offset: int = 0, limit: int = DETAILS_PREFETCH_TOP_K, profile: Optional[str] = None):
+    """
+    One page of the ranking of ``build_ui_payload``: the ``limit`` centres
+    from position ``offset`` on, with explanations and graph paths.
+
+    Only ``offset + limit`` centres are selected from the scored ranking
+    (partial heap selection, same order as the full sort) and only the page
+    gets details, so the cost grows with the page, not with the number of
+    centres.  Returns ``{"ranking_id", "total", "offset", "results"}``.
+    """
+    return _build_ui_page(tech_label, scen_label, offset, limit, profile)[0]
+
+def _build_ui_page(tech_label: str, scen_label: str, offset: int, limit: int, profile: Optional[str]):
+    tech_uri = get_uri_for_label(tech_label)
+    scen_uri = get_uri_for_label(scen_label)
+    if not tech_uri or not scen_uri:
+        print("[build_ui_page] ABORT – missing tech or scenario URI")
+        return {"ranking_id": None, "total": 0, "offset": offset, "results": []}, False
+    rid, ui_items = get_ranking(tech_uri, scen_uri, profile)
+    page = [dict(item) for item in get_profile(profile).top(ui_items, offset + limit)[offset:]]
+    complete = attach_details(tech_uri, scen_uri, page)
+    return {"ranking_id": rid, "total": len(ui_items), "offset": offset, "results": page}, complete
+
+def build_ui_page_swr(tech_label: str, scen_label: str, offset: int = 0, limit: int = DETAILS_PREFETCH_TOP_K, profile: Optional[str] = None):
+    """
+    ``(page, stale)``: ``build_ui_page`` through the stale-while-revalidate
+    cache of ``build_ui_payload_swr``, under the same rules.  The page is
+    shared between requests and must not be changed.
+    """
+    if RECOMMEND_STALE_TTL <= 0:
+        return build_ui_page(tech_label, scen_label, offset, limit, profile), False
+    key = ("page", tech_label, scen_label, offset, limit, get_profile(profile))
+    (page, _), stale = _payloads.get(
+        key, lambda: _build_ui_page(tech_label, scen_label, offset, limit, profile),
+        usable=lambda v: bool(v[0]["results"]) and v[1],
+    )
+    return page, stale
+
+def stream_ui_payload(tech_label: str, scen_label: str, top_k: Optional[int] = None, profile: Optional[str] = None):
+    """
+    Progressive version of ``build_ui_payload``, as a generator of messages:
+
+    - ``{"type": "ranking", "results": [...], "top_k": n}`` right after the
+      engine query: every centre, scored and sorted, without details
+    - ``{"type": "explanations" | "graph_paths", "results": {center_uri: [...]}}``
+      for each batch of the first ``top_k`` centres (all if None) as its
+      query finishes, best ranked first; a failed batch sends nothing and
+      its centres are loaded on demand
+    - ``{"type": "done"}``
+
+    A payload kept by ``build_ui_payload_swr`` for the same request is sent
+    whole in the ranking message (with ``"stale": true`` if it is stale), and
+    a complete streamed payload is kept there for the next request.
+    """
+    key = (tech_label, scen_label, top_k, get_profile(profile))
+    if RECOMMEND_STALE_TTL > 0:
+        served = _payloads.peek(key, lambda: _build_ui_payload(tech_label, scen_label, top_k, profile), usable=_complete_payload)
+        if served is not None:
+            (ui_items, _), stale = served
+            ranking = {"type": "ranking", "results": ui_items, "top_k": sum(1 for item in ui_items if item["details_loaded"])}
+            if stale:
+                ranking["stale"] = True
+            yield ranking
+            yield {"type": "done"}
+            return
+    tech_uri = get_uri_for_label(tech_label)
+    scen_uri = get_uri_for_label(scen_label)
+    if not tech_uri or not scen_uri:
+        print("[stream_ui_payload] ABORT – missing tech or scenario URI")
+        yield {"type": "ranking", "results": [], "top_k": 0}
+        yield {"type": "done"}
+        return
+    recs = get_recommendations_for_uris(tech_uri, scen_uri)
+    ui_items = _bare_items(recs)
+    rank_items(ui_items, profile)
+    head = ui_items if top_k is None else ui_items[:max(top_k, 0)]
+    yield {"type": "ranking", "results": ui_items, "top_k": len(head)}
+
+    details: Dict[str, Dict[str, Any]] = {"explanations": {}, "graph_paths": {}}
+    complete = True
+    for msg in _stream_details(tech_uri, scen_uri, [item["center_uri"] for item in head]):
+        if msg is None:
+            complete = False
+            continue
+        details[msg["type"]].update(msg["results"])
+        yield msg
+    if complete and ui_items and RECOMMEND_STALE_TTL > 0:
+        # the same payload build_ui_payload_swr would keep for this request
+        loaded = {item["center_uri"] for item in head}
+        _payloads.put(key, ([
+            dict(
+                item,
+                explanations_simple=details["explanations"][item["center_uri"]],
+                graph_paths=details["graph_paths"][item["center_uri"]],
+                details_loaded=True,
+            ) if item["center_uri"] in loaded else item
+            for item in ui_items
+        ], True), usable=_complete_payload)
+    yield {"type": "done"}
+
+def _stream_details(tech_uri: str, scen_uri: str, center_uris: List[str]):
+    """The explanations / graph_paths messages of ``stream_ui_payload``; None for a failed query."""
+    chunks = _center_chunks(center_uris)
+    if COMBINED_DETAILS_QUERY:
+        # one query per chunk; both messages of a chunk go out when it finishes
+        queries = [_batch_query(DETAILS_BATCH_QUERY_TEMPLATE, tech_uri, scen_uri, chunk) for chunk in chunks]
+        for i, table in iter_sparql_completed(queries, name="details_batch", as_table=True):
+            if not table:
+                yield None
+                continue
+            details = _collect_details([table], tech_uri, chunks[i])
+            yield {"type": "explanations", "results": {u: d[0] for u, d in details.items()}}
+            yield {"type": "graph_paths", "results": {u: d[1]["paths"] for u, d in details.items()}}
+        return
+    queries = []
+    for chunk in chunks:
+        queries.append(("explanations", chunk, _batch_query(EXPLAIN_BATCH_QUERY_TEMPLATE, tech_uri, scen_uri, chunk)))
+        queries.append(("graph_paths", chunk, _batch_query(JUST_BATCH_QUERY_TEMPLATE, tech_uri, scen_uri, chunk)))
+    names = ["explain_batch" if kind == "explanations" else "justification_batch" for kind, _, _ in queries]
+    for i, data in iter_sparql_completed([q for _, _, q in queries], name=names):
+        kind, chunk, _ = queries[i]
+        if not data:
+            yield None
+        elif kind == "explanations":
+            yield {"type": kind, "results": _collect_explanations([data], chunk)}
+        else:
+            yield {"type": kind, "results": {u: g["paths"] for u, g in _collect_graphs([data], chunk).items()}}
@@ -0,0 +1,236 @@
+"""
+Background writer for the feedback log.
+
+``/api/feedback`` only puts the record on an in-memory queue; one writer
+thread per process drains it in batches (``FEEDBACK_BATCH_SIZE`` records or
+``FEEDBACK_FLUSH_INTERVAL`` seconds, whichever comes first) and appends them
+to ``FEEDBACK_LOG`` with a single write + fsync.
+
+Several processes (e.g. gunicorn workers) may share the same log: every
+batch and every rotation happens under an exclusive ``flock`` on
+``<log>.lock``, so lines never interleave.  Once the log grows past
+``FEEDBACK_MAX_BYTES`` it is rotated to ``<log>.1`` (gzip-compressed to
+``<log>.1.gz`` with ``FEEDBACK_COMPRESS=1``), keeping ``FEEDBACK_BACKUPS``
+old files; as with ``RotatingFileHandler``, ``FEEDBACK_BACKUPS=0`` means the
+log is never rotated (rather than deleted).  Pending records are written out at interpreter exit.
+"""
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+FEEDBACK_FILE = Path(os.getenv("FEEDBACK_LOG", "feedback_log.jsonl"))
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "100"))
+FEEDBACK_FLUSH_INTERVAL = float(os.getenv("FEEDBACK_FLUSH_INTERVAL", "1.0"))
+FEEDBACK_QUEUE_SIZE = int(os.getenv("FEEDBACK_QUEUE_SIZE", "10000"))
+# 0 disables rotation (so does FEEDBACK_BACKUPS=0)
+FEEDBACK_MAX_BYTES = int(os.getenv("FEEDBACK_MAX_BYTES", str(10 * 1024 * 1024)))
+FEEDBACK_BACKUPS = int(os.getenv("FEEDBACK_BACKUPS", "5"))
+FEEDBACK_COMPRESS = os.getenv("FEEDBACK_COMPRESS", "1") == "1"
+
+
+def rotated_files(path: Path) -> List[Path]:
+    """Existing rotated logs of ``path``, oldest first (``.N[.gz]`` ... ``.1[.gz]``)."""
+    found = []
+    for i in range(FEEDBACK_BACKUPS, 0, -1):
+        for candidate in (Path(f"{path}.{i}.gz"), Path(f"{path}.{i}")):
+            if candidate.exists():
+                found.append(candidate)
+    return found
+
+
+def log_files(path: Path) -> List[Path]:
+    """Rotated logs oldest first, then the live one."""
+    files = rotated_files(path)
+    if path.exists():
+        files.append(path)
+    return files
+
+
+def iter_records(files: Iterable[Path]) -> Iterator[Dict[str, Any]]:
+    for f in files:
+        opener = gzip.open if f.suffix == ".gz" else open
+        with opener(f, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+class FeedbackWriter:
+    def __init__(
+        self,
+        path: Path = FEEDBACK_FILE,
+        batch_size: int = FEEDBACK_BATCH_SIZE,
+        flush_interval: float = FEEDBACK_FLUSH_INTERVAL,
+        max_bytes: int = FEEDBACK_MAX_BYTES,
+        backups: int = FEEDBACK_BACKUPS,
+        compress: bool = FEEDBACK_COMPRESS,
+        queue_size: int = FEEDBACK_QUEUE_SIZE,
+    ):
+        self.path = Path(path)
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pid = None
+        self.written = 0
+        self.failed = 0
+
+    # --- producer side -----------------------------------------------------
+
+    def submit(self, record: Dict[str, Any]) -> None:
+        """Queue one record; written inline if the queue is full."""
+        self._ensure_started()
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            print("[FeedbackWriter] WARNING: queue full, writing inline")
+            self._write([line])
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything queued so far is on disk."""
+        if not self._running():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Drain the queue and stop the writer thread."""
+        if not self._running():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # --- writer thread -----------------------------------------------------
+
+    def _running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def _ensure_started(self) -> None:
+        if self._running():
+            return
+        with self._start_lock:
+            if self._running():
+                return
+            # after a fork the parent's thread does not exist in this process
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            batch: List[str] = []
+            waiters: List[threading.Event] = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or waiters or len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if stop:
+                # drain whatever was queued behind the stop marker
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                    elif item is not None:
+                        batch.append(item)
+            if batch:
+                self._write(batch)
+            for w in waiters:
+                w.set()
+
+    def _write(self, lines: List[str]) -> None:
+        data = "".join(lines).encode("utf-8")
+        try:
+            with self._locked():
+                with self.path.open("ab") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    size = f.tell()
+                if self.max_bytes and self.backups > 0 and size >= self.max_bytes:
+                    self._rotate()
+            self.written += len(lines)
+        except OSError as e:
+            self.failed += len(lines)
+            print(f"[FeedbackWriter] ERROR: could not write {len(lines)} records: {e}")
+
+    @contextmanager
+    def _locked(self):
+        with self._write_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.path}.lock", "a") as lock:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _rotate(self) -> None:
+        """Shift ``<log>.i[.gz]`` -> ``<log>.i+1[.gz]`` and move the live log to ``.1``. Caller holds the lock."""
+        for i in range(self.backups, 0, -1):
+            for suffix in ("", ".gz"):
+                src = Path(f"{self.path}.{i}{suffix}")
+                if not src.exists():
+                    continue
+                if i == self.backups:
+                    src.unlink()
+                else:
+                    src.replace(f"{self.path}.{i + 1}{suffix}")
+        first = Path(f"{self.path}.1")
+        self.path.replace(first)
+        if self.compress:
+            with first.open("rb") as src, gzip.open(f"{first}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            first.unlink()
+        print(f"[FeedbackWriter] rotated {self.path}")
+
+
+FEEDBACK_WRITER = FeedbackWriter()
+atexit.register(FEEDBACK_WRITER.close)
+
+
+def submit_feedback(record: Dict[str, Any]) -> None:
+    FEEDBACK_WRITER.submit(record)
@@ -0,0 +1,23 @@
+"""
+gunicorn settings for the recommender (``gunicorn -c gunicorn.conf.py wsgi:app``).
+
+N worker processes with a few threads each; the workers share SPARQL
+results through ``SHARED_CACHE`` (SQLite, see ``shared_cache.py``), so
+adding workers adds cores without multiplying the queries sent to Fuseki.
+"""
+import multiprocessing
+import os
+import tempfile
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count())))
+# requests mostly wait on Fuseki, so a few threads per worker keep the cores busy
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "4"))
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+# The app starts threads at import (SPARQL pool, feedback writer, warm-up),
+# which do not survive a fork: every worker imports it on its own.
+preload_app = False
+
+# The workers only share results when they open the same file
+os.environ.setdefault("SHARED_CACHE", os.path.join(tempfile.gettempdir(), "enovation_shared_cache.sqlite"))
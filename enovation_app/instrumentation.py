@@ -0,0 +1,342 @@
+"""
+Request tracing and Prometheus metrics for the recommender.
+
+Off by default; ``INSTRUMENTATION=1`` turns it on.  While off, ``span()``
+returns a shared no-op object and ``run_sparql`` skips all bookkeeping, so the
+hot path only pays for one flag test.
+
+While on:
+
+* every ``run_sparql`` call is a span tagged with its query template name
+  (the ``name`` argument), whether the result cache answered it, the row
+  count and, for HTTP, the response size and JSON decoding time
+* other hot-path steps (label resolution, scoring, details) are spans too
+* each Flask request gets a ``RequestTrace`` (a contextvar, carried into the
+  SPARQL worker threads) counting its queries and cache hits; it is returned
+  in the ``Server-Timing`` / ``X-SPARQL-Queries`` headers and printed as one
+  JSON line when the request takes longer than ``TRACE_SLOW_MS``
+* ``render_metrics()`` exposes latency histograms per endpoint, per query
+  template and per span, query/row/byte counters and registered gauges
+  (e.g. the result cache hit rate) in the Prometheus text format
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+INSTRUMENTATION = os.getenv("INSTRUMENTATION", "0") == "1"
+# Requests slower than this are printed with their spans; 0 = every request, <0 = never
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+# Spans kept per request for the printed trace (all of them are still counted)
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+# --- metrics -----------------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {_num(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = 'le="%s"' % _num(bound)
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {count}")
+                total = series[len(self.buckets)]
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {total}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_num(series[-1])}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {total}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("enovation_http_request_duration_seconds", "HTTP request latency (until the body is sent)", ["endpoint", "status"])
+REQUEST_QUERIES = Histogram("enovation_http_request_sparql_queries", "SPARQL queries issued per HTTP request", ["endpoint"], COUNT_BUCKETS)
+SPARQL_SECONDS = Histogram("enovation_sparql_query_duration_seconds", "run_sparql latency per query template", ["template", "cache"])
+SPARQL_QUERIES = Counter("enovation_sparql_queries_total", "run_sparql calls per query template and cache outcome (hit, miss, off)", ["template", "cache"])
+SPARQL_ERRORS = Counter("enovation_sparql_errors_total", "Queries that failed or timed out (empty result)", ["template"])
+SPARQL_ROWS = Counter("enovation_sparql_rows_total", "Result rows returned per query template", ["template"])
+SPARQL_BYTES = Counter("enovation_sparql_response_bytes_total", "HTTP response bytes per query template", ["template"])
+SPARQL_DECODE_SECONDS = Histogram("enovation_sparql_decode_duration_seconds", "JSON decoding time of HTTP responses", ["template"])
+SPAN_SECONDS = Histogram("enovation_span_duration_seconds", "Duration of instrumented recommender steps", ["span"])
+
+METRICS = [
+    REQUEST_SECONDS, REQUEST_QUERIES, SPARQL_SECONDS, SPARQL_QUERIES, SPARQL_ERRORS,
+    SPARQL_ROWS, SPARQL_BYTES, SPARQL_DECODE_SECONDS, SPAN_SECONDS,
+]
+
+_gauges_lock = threading.Lock()
+_gauges: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_gauges(prefix: str, source: Callable[[], Dict[str, Any]]) -> None:
+    """Expose the numeric values of ``source()`` as gauges ``enovation_<prefix>_<key>``."""
+    with _gauges_lock:
+        _gauges[prefix] = source
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    with _gauges_lock:
+        sources = list(_gauges.items())
+    for prefix, source in sources:
+        try:
+            values = source()
+        except Exception as e:
+            print(f"[instrumentation] gauge source {prefix} failed: {e}")
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"enovation_{prefix}_{key}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_num(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# --- traces and spans --------------------------------------------------------
+
+class RequestTrace:
+    """What one HTTP request spent its time on."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.cache_hits = 0
+        self.spans: List[Dict[str, Any]] = []
+        self.dropped_spans = 0
+        # span name -> [count, total seconds]
+        self.totals: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, tags: Dict[str, Any]) -> None:
+        with self._lock:
+            total = self.totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append(dict(tags, span=name, ms=round(seconds * 1000, 3)))
+            else:
+                self.dropped_spans += 1
+
+    def count_query(self, cache_hit: bool) -> None:
+        with self._lock:
+            self.queries += 1
+            if cache_hit:
+                self.cache_hits += 1
+
+    def server_timing(self) -> str:
+        """``Server-Timing`` header value: total time per span name so far."""
+        with self._lock:
+            items = sorted(self.totals.items())
+        return ", ".join(f'{name};dur={seconds * 1000:.1f};desc="{int(count)}x"' for name, (count, seconds) in items)
+
+    def summary(self, status: int) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "endpoint": self.endpoint,
+                "status": status,
+                "ms": round((time.perf_counter() - self.started) * 1000, 3),
+                "queries": self.queries,
+                "cache_hits": self.cache_hits,
+                "totals_ms": {name: round(seconds * 1000, 3) for name, (_, seconds) in self.totals.items()},
+                "spans": list(self.spans),
+                "dropped_spans": self.dropped_spans,
+            }
+
+
+_trace: "contextvars.ContextVar[Optional[RequestTrace]]" = contextvars.ContextVar("enovation_trace", default=None)
+_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("enovation_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, tags: Dict[str, Any]):
+        self.name = name
+        self.tags = tags
+        self._started = 0.0
+        self._token = None
+
+    def set(self, **tags: Any) -> None:
+        self.tags.update(tags)
+
+    def __enter__(self) -> "Span":
+        self._token = _span.set(self)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        seconds = time.perf_counter() - self._started
+        _span.reset(self._token)
+        self.record(seconds)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(self.name, seconds, self.tags)
+        return False
+
+    def record(self, seconds: float) -> None:
+        SPAN_SECONDS.observe(seconds, self.name)
+
+
+class SparqlSpan(Span):
+    """One ``run_sparql`` call; the cache outcome is "hit" unless the backend was called."""
+
+    def __init__(self, template: str, cached: bool):
+        super().__init__("sparql", {"template": template, "cache": "hit" if cached else "off"})
+        self.template = template
+
+    def fetched(self) -> None:
+        if self.tags["cache"] == "hit":
+            self.tags["cache"] = "miss"
+
+    def result(self, data: Any) -> None:
+        """Record the outcome: a sparql-results+json dict or a ``SparqlTable``."""
+        if not data:
+            self.tags["error"] = True
+            SPARQL_ERRORS.inc(self.template)
+            return
+        rows = len(data.get("results", {}).get("bindings", [])) if isinstance(data, dict) else len(data)
+        self.tags["rows"] = rows
+        SPARQL_ROWS.inc(self.template, amount=rows)
+
+    def record(self, seconds: float) -> None:
+        cache = self.tags["cache"]
+        SPARQL_SECONDS.observe(seconds, self.template, cache)
+        SPARQL_QUERIES.inc(self.template, cache)
+        trace = _trace.get()
+        if trace is not None:
+            trace.count_query(cache == "hit")
+
+
+class _NoopSpan:
+    def set(self, **tags: Any) -> None:
+        pass
+
+    def fetched(self) -> None:
+        pass
+
+    def result(self, data: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **tags: Any):
+    """``with span("score"): ...`` — times the block when instrumentation is on."""
+    if not INSTRUMENTATION:
+        return _NOOP
+    return Span(name, tags)
+
+
+def sparql_span(template: Optional[str], cached: bool):
+    if not INSTRUMENTATION:
+        return _NOOP
+    return SparqlSpan(template or "unnamed", cached)
+
+
+def annotate_http(size: int, decode_seconds: float) -> None:
+    """Response size and JSON decoding time of the current SPARQL span (HTTP backend)."""
+    current = _span.get()
+    if not isinstance(current, SparqlSpan):
+        return
+    current.set(bytes=size, decode_ms=round(decode_seconds * 1000, 3))
+    SPARQL_BYTES.inc(current.template, amount=size)
+    SPARQL_DECODE_SECONDS.observe(decode_seconds, current.template)
+
+
+def in_context(fn: Callable) -> Callable:
+    """``fn`` bound to a copy of the caller's context, so worker threads report to the same trace."""
+    if not INSTRUMENTATION:
+        return fn
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+# --- request lifecycle -------------------------------------------------------
+
+def start_request(endpoint: str) -> Optional[RequestTrace]:
+    if not INSTRUMENTATION:
+        return None
+    trace = RequestTrace(endpoint)
+    _trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _trace.get() if INSTRUMENTATION else None
+
+
+def finish_request(trace: RequestTrace, status: int) -> None:
+    seconds = time.perf_counter() - trace.started
+    REQUEST_SECONDS.observe(seconds, trace.endpoint, str(status))
+    REQUEST_QUERIES.observe(trace.queries, trace.endpoint)
+    if TRACE_SLOW_MS >= 0 and seconds * 1000 >= TRACE_SLOW_MS:
+        print("[trace] " + json.dumps(trace.summary(status), ensure_ascii=False, default=str))
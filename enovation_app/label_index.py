@@ -0,0 +1,233 @@
+"""
+In-memory rdfs:label -> URI index.
+
+All ``rdfs:label`` triples are loaded with one query and resolved locally
+with the same fallback order the SPARQL lookup used:
+
+1. exact, case-insensitive match of the whole label
+2. labels containing the part before "(" (only if it is at least 5 chars)
+3. labels containing the whole label
+
+Exact matches are a dict lookup.  Substring matches use a suffix array over
+the lower-cased labels, searched with ``bisect`` in O(len(label) * log n).
+It is sorted on fixed-length chunks of each suffix, refining only ties, so
+the build needs O(n) memory (n = total label length), not one substring of
+the rest of its label per position.
+When several labels match, the one loaded first wins.
+
+The index also keeps every label of every URI (``labels_of``), so result
+rows that only carry URIs can be labelled without another query.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sparql_client import on_cache_clear, run_sparql_table
+
+LABELS_QUERY = """
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+SELECT ?s ?l WHERE {
+  ?s rdfs:label ?l .
+}
+"""
+
+# Seconds to wait before retrying a failed load triggered by a lookup
+RETRY_AFTER = 30.0
+
+# Separates labels in the concatenated text; never part of a lower-cased label.
+_SEP = "\x00"
+# Characters of each suffix compared per sorting pass while building the suffix array
+_KEY_CHARS = 32
+
+
+class _Index(NamedTuple):
+    """One immutable build of the index; ``refresh`` swaps the whole tuple at once."""
+    exact: Dict[str, str]
+    labels: Dict[str, List[Tuple[str, str]]]
+    uris: List[str]
+    text: str
+    suffixes: array
+    # Segment tree over the owning label of each suffix (leaves at len(suffixes)):
+    # the earliest label in any range of suffixes in O(log n)
+    owners: array
+
+
+_EMPTY = _Index({}, {}, [], "", array("l"), array("l"))
+
+
+def _chunk(text: str, p: int) -> str:
+    """Up to ``_KEY_CHARS`` characters of ``text`` from ``p``, stopping at the end of the label."""
+    chunk = text[p:p + _KEY_CHARS]
+    end = chunk.find(_SEP)
+    return chunk if end < 0 else chunk[:end]
+
+
+def _suffix_order(text: str, positions: List[int]) -> List[int]:
+    """
+    ``positions`` ordered by their suffix of ``text`` up to the next ``_SEP``.
+    Sorted on at most ``_KEY_CHARS`` characters at a time: only runs that
+    still tie on a whole chunk are sorted again on the next chunk, so the
+    keys held at any time take O(len(positions) * _KEY_CHARS) memory.
+    """
+    out: List[int] = []
+    # (group, depth of its next chunk); depth None: a run of equal keys, done
+    stack: List[Tuple[List[int], Optional[int]]] = [(positions, 0)]
+    while stack:
+        group, depth = stack.pop()
+        if depth is None or len(group) == 1:
+            out.extend(group)
+            continue
+        key = lambda p: _chunk(text, p + depth)
+        # the sort's keys are dropped as soon as it returns; groupby recomputes them one by one
+        group.sort(key=key)
+        # a run ending in a full chunk may continue past it; a shorter one reached the separator
+        runs = [(list(run), depth + _KEY_CHARS if len(k) == _KEY_CHARS else None) for k, run in groupby(group, key)]
+        stack.extend(reversed(runs))
+    return out
+
+
+def _owner_tree(owners: List[int]) -> array:
+    n = len(owners)
+    tree = array("l", [0] * n) + array("l", owners)
+    for i in range(n - 1, 0, -1):
+        tree[i] = min(tree[2 * i], tree[2 * i + 1])
+    return tree
+
+
+def _earliest(tree: array, n: int, lo: int, hi: int) -> int:
+    """Smallest owner among suffixes ``lo .. hi-1``."""
+    best = len(tree)
+    lo += n
+    hi += n
+    while lo < hi:
+        if lo & 1:
+            best = min(best, tree[lo])
+            lo += 1
+        if hi & 1:
+            hi -= 1
+            best = min(best, tree[hi])
+        lo >>= 1
+        hi >>= 1
+    return best
+
+
+class LabelIndex:
+    def __init__(self):
+        self._load_lock = threading.Lock()
+        self._next_attempt = 0.0
+        self._loaded = False
+        self._index = _EMPTY
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return len(self._index.uris)
+
+    def build(self, pairs: List[Tuple[str, ...]]) -> None:
+        """Replace the index contents with ``(uri, label)`` or ``(uri, label, lang)`` tuples."""
+        exact: Dict[str, str] = {}
+        labels: Dict[str, List[Tuple[str, str]]] = {}
+        uris: List[str] = []
+        texts: List[str] = []
+        seen = set()
+        for uri, label, *rest in pairs:
+            term = (label, rest[0] if rest else "")
+            own = labels.setdefault(uri, [])
+            if term not in own:
+                own.append(term)
+            low = label.lower()
+            exact.setdefault(low, uri)
+            if (uri, low) in seen:
+                continue
+            seen.add((uri, low))
+            uris.append(uri)
+            texts.append(low.replace(_SEP, " "))
+
+        starts = array("l")
+        pos = 0
+        for t in texts:
+            starts.append(pos)
+            pos += len(t) + 1
+        text = _SEP.join(texts) + _SEP
+
+        # Each key stops at the end of its own label, so matches never span labels
+        positions = []
+        for i, t in enumerate(texts):
+            start = starts[i]
+            positions.extend(range(start, start + len(t)))
+        positions = _suffix_order(text, positions)
+        owners = [bisect_right(starts, p) - 1 for p in positions]
+
+        self._index = _Index(exact, labels, uris, text, array("l", positions), _owner_tree(owners))
+        self._loaded = True
+
+    def refresh(self) -> bool:
+        """
+        Reload every label from the endpoint. Keeps the old index if the query
+        fails.  The labels go through the cross-process cache (if configured),
+        so worker processes after the first load them without a query.
+        """
+        table = run_sparql_table(LABELS_QUERY, cache=False, name="labels", shared=True)
+        if not len(table):
+            print("[LabelIndex] WARNING: label query returned nothing, keeping previous index")
+            return False
+        self.build([row for row in zip(table.column("s"), table.column("l"), table.lang("l")) if row[0] and row[1] is not None])
+        print(f"[LabelIndex] loaded {len(self)} labels")
+        return True
+
+    def invalidate(self) -> None:
+        """Drop the index; the next ``ensure_loaded`` reloads it."""
+        self._loaded = False
+
+    def ensure_loaded(self) -> bool:
+        if self._loaded:
+            return True
+        with self._load_lock:
+            if not self._loaded and time.monotonic() >= self._next_attempt:
+                if not self.refresh():
+                    self._next_attempt = time.monotonic() + RETRY_AFTER
+        return self._loaded
+
+    @staticmethod
+    def _contains(index: _Index, needle: str) -> Optional[str]:
+        text, sa = index.text, index.suffixes
+        n = len(needle)
+        key = lambda p: text[p:p + n]
+        lo = bisect_left(sa, needle, key=key)
+        hi = bisect_right(sa, needle, lo=lo, key=key)
+        if lo == hi:
+            return None
+        return index.uris[_earliest(index.owners, len(sa), lo, hi)]
+
+    def labels_of(self, uri: str) -> List[Tuple[str, str]]:
+        """Every ``(label, language tag)`` of ``uri`` in load order; empty if it has none."""
+        return self._index.labels.get(uri, [])
+
+    def lookup(self, label: str) -> Optional[str]:
+        index = self._index
+        low = label.lower()
+        uri = index.exact.get(low)
+        if uri:
+            return uri
+        prefix = label.split("(", 1)[0].strip()
+        if len(prefix) >= 5:
+            uri = self._contains(index, prefix.lower())
+            if uri:
+                return uri
+        if low:
+            return self._contains(index, low)
+        return None
+
+
+LABEL_INDEX = LabelIndex()
+
+
+@on_cache_clear
+def _reload_labels() -> None:
+    if LABEL_INDEX.loaded:
+        LABEL_INDEX.refresh()
@@ -0,0 +1,214 @@
+"""
+Learn the MCDM weights from the feedback log.
+
+Each feedback record carries the rating the user gave a centre and the full
+``scores`` dict shown at the time, including the eight ``*_norm`` criteria.
+Ratings become targets (Bad = 0, Neutral = 0.5, Good = 1) and the job fits
+
+    rating ~ b + s * sum_k w_k * norm_k,   w_k >= 0,  sum_k w_k = 1
+
+by non-negative least squares, shrunk towards the weights of the current
+scoring profile (``--ridge``) so a handful of ratings cannot swing the model.  Only the sufficient statistics
+(X'X, X'y, ...) are kept, accumulated over NumPy chunks of the log, so memory
+does not depend on the number of records; rotated ``.gz`` logs are read too.
+
+The per-criterion weights are written as a scoring profile (see
+``scoring_profiles.py``) in the usual cluster structure (operational fit /
+training capacity / infrastructure): base weight of a cluster = sum of its
+criteria's weights, cluster weights = each criterion's share of it.  The
+profile carries an increasing ``version``; the previous file is kept as
+``<name>.json.v<N>``, which the profile registry does not list.  The recommender picks it up without a restart, via
+``?profile=learned`` or ``SCORING_PROFILE=learned``.
+
+    python learn_weights.py [--log feedback_log.jsonl] [--out profiles/learned.json]
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from feedback_writer import FEEDBACK_FILE, iter_records, log_files
+from scoring_profiles import PROFILES_DIR, SCORE_KEYS, get_profile, weights_to_profile
+
+RATING_TARGETS = {"bad": 0.0, "neutral": 0.5, "good": 1.0}
+NORM_KEYS = [k + "_norm" for k in SCORE_KEYS]
+
+
+def iter_rows(records: Iterable[Dict[str, Any]]) -> Iterator[Tuple[List[float], float]]:
+    """(normalized criteria, target) per usable record."""
+    for rec in records:
+        target = RATING_TARGETS.get(str(rec.get("rating", "")).lower())
+        scores = rec.get("scores")
+        if target is None or not isinstance(scores, dict):
+            continue
+        if not any(k in scores for k in NORM_KEYS):
+            continue
+        try:
+            yield [float(scores.get(k) or 0.0) for k in NORM_KEYS], target
+        except (TypeError, ValueError):
+            continue
+
+
+class FeedbackStats:
+    """Sufficient statistics of the least-squares problem."""
+
+    def __init__(self, dims: int = len(SCORE_KEYS)):
+        self.n = 0
+        self.sx = np.zeros(dims)
+        self.sy = 0.0
+        self.syy = 0.0
+        self.xtx = np.zeros((dims, dims))
+        self.xty = np.zeros(dims)
+
+    def add(self, X: "np.ndarray", y: "np.ndarray") -> None:
+        self.n += len(y)
+        self.sx += X.sum(axis=0)
+        self.sy += float(y.sum())
+        self.syy += float(y @ y)
+        self.xtx += X.T @ X
+        self.xty += X.T @ y
+
+    def centered(self) -> Tuple["np.ndarray", "np.ndarray", float]:
+        """Per-record covariance of X, covariance of X with y and variance of y."""
+        mx = self.sx / self.n
+        my = self.sy / self.n
+        q = self.xtx / self.n - np.outer(mx, mx)
+        c = self.xty / self.n - mx * my
+        vy = self.syy / self.n - my * my
+        return q, c, vy
+
+    def mse(self, w: "np.ndarray") -> float:
+        """Mean squared error of ``w`` with its best intercept and (non-negative) scale."""
+        q, c, vy = self.centered()
+        curvature = float(w @ q @ w)
+        scale = max(float(w @ c) / curvature, 0.0) if curvature > 0 else 0.0
+        return float(vy - 2 * scale * (w @ c) + scale * scale * curvature)
+
+
+def accumulate(rows: Iterable[Tuple[List[float], float]], chunk_size: int = 65536) -> "FeedbackStats":
+    stats = FeedbackStats()
+    xs: List[List[float]] = []
+    ys: List[float] = []
+    for x, y in rows:
+        xs.append(x)
+        ys.append(y)
+        if len(ys) >= chunk_size:
+            stats.add(np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))
+            xs, ys = [], []
+    if ys:
+        stats.add(np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))
+    return stats
+
+
+def fit_weights(stats: "FeedbackStats", prior: "np.ndarray", ridge: float, iters: int = 20000, tol: float = 1e-12) -> "np.ndarray":
+    """
+    Non-negative least squares for ``v = s * w`` (ratings have their own
+    scale, so only the direction of the weights is constrained):
+
+        min_v  v'Qv - 2c'v + lam * |v - s0 * prior|^2,  v >= 0
+
+    with ``s0`` the best scale for the prior weights and ``lam`` = ``ridge``
+    times the mean criterion variance, by projected gradient descent
+    (step 1/L).  Returned normalized to sum to 1.
+    """
+    q, c, _ = stats.centered()
+    curvature = float(prior @ q @ prior)
+    scale = max(float(prior @ c) / curvature, 0.0) if curvature > 0 else 0.0
+    lam = ridge * float(np.trace(q)) / len(prior)
+    a = q + lam * np.eye(len(prior))
+    b = c + lam * scale * prior
+    lipschitz = float(np.linalg.eigvalsh(a).max())
+    if lipschitz <= 0:
+        return prior.copy()
+    step = 1.0 / lipschitz
+    v = scale * prior if scale > 0 else prior.copy()
+    for _ in range(iters):
+        nxt = np.maximum(v - step * (a @ v - b), 0.0)
+        if float(np.abs(nxt - v).max()) < tol:
+            v = nxt
+            break
+        v = nxt
+    total = float(v.sum())
+    # ratings that do not increase with any criterion carry no usable signal
+    return v / total if total > 0 else prior.copy()
+
+
+def prior_criterion_weights(profile: Optional[str] = None) -> "np.ndarray":
+    """Per-criterion weights of a scoring profile (default: ``SCORING_PROFILE``), summing to 1."""
+    w = np.asarray(get_profile(profile).criterion_weights(), dtype=np.float64)
+    total = float(w.sum())
+    return w / total if total > 0 else np.full(len(w), 1.0 / len(w))
+
+
+def next_version(out: Path) -> int:
+    try:
+        return int(json.loads(out.read_text(encoding="utf-8")).get("version", 0)) + 1
+    except (OSError, ValueError, AttributeError):
+        return 1
+
+
+def write_profile(out: Path, profile: Dict[str, Any]) -> None:
+    """Keep a copy of the previous version next to it, then replace ``out`` atomically."""
+    if out.exists():
+        try:
+            previous = out.read_text(encoding="utf-8")
+            old_version = int(json.loads(previous).get("version", 0))
+            # not *.json: a backup must not show up as a selectable profile
+            out.with_name(f"{out.name}.v{old_version}").write_text(previous, encoding="utf-8")
+        except (OSError, ValueError, AttributeError):
+            pass
+    tmp = out.with_name(out.name + ".tmp")
+    tmp.write_text(json.dumps(profile, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, out)
+
+
+def learn(log: Path, out: Path, ridge: float, min_records: int, chunk_size: int, prior_profile: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    files = log_files(log)
+    started = time.perf_counter()
+    stats = accumulate(iter_rows(iter_records(files)), chunk_size)
+    if stats.n < min_records:
+        print(f"[learn_weights] only {stats.n} usable ratings (< {min_records}), not writing a profile")
+        return None
+
+    prior = prior_criterion_weights(prior_profile)
+    w = fit_weights(stats, prior, ridge)
+    profile = weights_to_profile(w.tolist())
+    profile.update(
+        {
+            "name": out.stem,
+            "version": next_version(out),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "description": f"Weights fitted to {stats.n} feedback ratings",
+            "trained_on": {"records": stats.n, "files": [str(f) for f in files], "ridge": ridge, "prior": get_profile(prior_profile).name},
+            "fit": {"mse": stats.mse(w), "mse_default_weights": stats.mse(prior)},
+        }
+    )
+    write_profile(out, profile)
+    print(
+        f"[learn_weights] {stats.n} ratings in {time.perf_counter() - started:.1f}s, "
+        f"mse {profile['fit']['mse']:.4f} (default weights {profile['fit']['mse_default_weights']:.4f}) "
+        f"-> {out} v{profile['version']}"
+    )
+    return profile
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--log", default=str(FEEDBACK_FILE), help="feedback log (rotated .N/.N.gz files are read too)")
+    parser.add_argument("--out", default=str(PROFILES_DIR / "learned.json"), help="scoring profile to write")
+    parser.add_argument("--prior", default=None, help="profile whose weights the fit is pulled towards (default: SCORING_PROFILE)")
+    parser.add_argument("--ridge", type=float, default=0.05, help="pull towards the prior weights (relative to the criterion variance)")
+    parser.add_argument("--min-records", type=int, default=50)
+    parser.add_argument("--chunk-size", type=int, default=65536)
+    args = parser.parse_args()
+    if np is None:
+        raise SystemExit("learn_weights.py needs numpy (pip install numpy)")
+    result = learn(Path(args.log), Path(args.out), args.ridge, args.min_records, args.chunk_size, args.prior)
+    raise SystemExit(0 if result is not None else 1)
@@ -0,0 +1,301 @@
+"""
+Local scoring engine over an in-memory snapshot of the graph.
+
+The triples ``ENGINE_QUERY_TEMPLATE`` looks at are pulled once into plain
+dicts/sets and the eight per-centre counts are computed in Python, with the
+same semantics as the SPARQL query (``rdfs:subClassOf*`` is reflexive and
+transitive, counts are COUNT(DISTINCT ...), one row per centre/label pair).
+Subclass tests go through the precomputed closure in ``class_closure``.
+
+Select it with ``RECOMMENDER_ENGINE=local``; if the snapshot cannot be
+loaded the recommender falls back to the remote query.
+
+Run ``python local_engine.py`` to compare both paths for every
+technology/scenario pair offered by the UI; ``tests/test_local_engine.py``
+does the same on a synthetic graph without an endpoint.
+"""
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from class_closure import SUBCLASS_QUERY, SubClassClosure
+from sparql_client import on_cache_clear, run_sparql
+
+EN = "http://www.semanticweb.org/eNOVATION-ontology#"
+FACILITY_CLASS = EN + "Facility"
+TRAINING_COURSE_CLASS = EN + "TrainingCourse"
+
+SNAPSHOT_PREDICATES = [
+    "usesTechnology",
+    "providesTrainingCourse",
+    "trainsOnTechnology",
+    "isBasedOnIncident",
+    "tacklesIncident",
+    "isIncidentTackledBy",
+    "involvesThreat",
+    "hasEquipment",
+    "adressesThreat",
+    "hasFacility",
+    "hasTCDiscipline",
+    "connectsWithNetwork",
+]
+
+CENTERS_QUERY = """
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+SELECT ?center ?centerLabel WHERE {
+  ?trainingClass rdfs:label "Training centre"@en .
+  ?center a ?trainingClass ;
+          rdfs:label ?centerLabel .
+}
+"""
+
+EDGES_QUERY = """
+PREFIX en: <http://www.semanticweb.org/eNOVATION-ontology#>
+SELECT ?s ?p ?o WHERE {
+  VALUES ?p { %s }
+  ?s ?p ?o .
+}
+""" % " ".join("en:" + p for p in SNAPSHOT_PREDICATES)
+
+TYPES_QUERY = """
+PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+SELECT ?s ?o WHERE { ?s rdf:type ?o . }
+"""
+
+
+def _term(t: Dict[str, Any]) -> str:
+    """Stable key for an RDF term from a sparql-results+json binding."""
+    kind = t.get("type")
+    value = t.get("value", "")
+    if kind == "uri":
+        return value
+    if kind == "bnode":
+        return "_:" + value
+    if "xml:lang" in t:
+        return f'"{value}"@{t["xml:lang"]}'
+    if "datatype" in t:
+        return f'"{value}"^^{t["datatype"]}'
+    return f'"{value}"'
+
+
+def _bindings(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return data.get("results", {}).get("bindings", [])
+
+
+class GraphSnapshot:
+    def __init__(
+        self,
+        centers: List[Tuple[str, str]],
+        edges: Iterable[Tuple[str, str, str]],
+        types: Iterable[Tuple[str, str]],
+        subclass: Iterable[Tuple[str, str]],
+    ):
+        self.centers = centers
+        self.out: Dict[str, Dict[str, Set[str]]] = {p: defaultdict(set) for p in SNAPSHOT_PREDICATES}
+        for s, p, o in edges:
+            if p in self.out:
+                self.out[p][s].add(o)
+        self.types: Dict[str, Set[str]] = defaultdict(set)
+        for s, o in types:
+            self.types[s].add(o)
+        self.closure = SubClassClosure(subclass)
+        self._type_masks: Dict[str, int] = {}
+
+        # isIncidentTackledBy is the inverse of tacklesIncident for the incident criterion
+        self.incidents_of: Dict[str, Set[str]] = defaultdict(set)
+        for c, incs in self.out["tacklesIncident"].items():
+            self.incidents_of[c] |= incs
+        for inc, cs in self.out["isIncidentTackledBy"].items():
+            for c in cs:
+                self.incidents_of[c].add(inc)
+
+        # Criteria 5-8 do not depend on the selected tech or scenario
+        self.static_counts: Dict[str, Tuple[int, int, int, int]] = {}
+        for c, _ in centers:
+            if c in self.static_counts:
+                continue
+            facilities = [f for f in self.out["hasFacility"].get(c, ()) if self.is_instance_of(f, FACILITY_CLASS)]
+            courses = [k for k in self.out["providesTrainingCourse"].get(c, ()) if TRAINING_COURSE_CLASS in self.types.get(k, ())]
+            self.static_counts[c] = (
+                len(facilities),
+                len(self.out["hasTCDiscipline"].get(c, ())),
+                len(courses),
+                len(self.out["connectsWithNetwork"].get(c, ())),
+            )
+
+    @classmethod
+    def load(cls) -> Optional["GraphSnapshot"]:
+        centers_data = run_sparql(CENTERS_QUERY, cache=False, name="snapshot_centers", shared=True)
+        edges_data = run_sparql(EDGES_QUERY, cache=False, name="snapshot_edges", shared=True)
+        types_data = run_sparql(TYPES_QUERY, cache=False, name="snapshot_types", shared=True)
+        subclass_data = run_sparql(SUBCLASS_QUERY, cache=False, name="snapshot_subclasses", shared=True)
+        if not (centers_data and edges_data and types_data and subclass_data):
+            print("[GraphSnapshot] ERROR: snapshot query failed")
+            return None
+        # One row per distinct (centre, label term), like the GROUP BY of the engine query
+        rows = {
+            (b["center"]["value"], _term(b["centerLabel"])): b["centerLabel"]["value"]
+            for b in _bindings(centers_data)
+        }
+        centers = [(center, label) for (center, _), label in rows.items()]
+        edges = [
+            (_term(b["s"]), b["p"]["value"][len(EN):], _term(b["o"]))
+            for b in _bindings(edges_data)
+        ]
+        types = [(_term(b["s"]), _term(b["o"])) for b in _bindings(types_data)]
+        subclass = [(_term(b["s"]), _term(b["o"])) for b in _bindings(subclass_data)]
+        snap = cls(centers, edges, types, subclass)
+        print(f"[GraphSnapshot] loaded {len(centers)} centres, {len(edges)} edges, {len(types)} type triples")
+        return snap
+
+    def is_instance_of(self, node: str, cls_uri: str) -> bool:
+        """``node a ?c . ?c rdfs:subClassOf* cls_uri``"""
+        bit = self.closure.bit(cls_uri)
+        if not bit:
+            # not part of any subClassOf triple: only the zero-length path can match
+            return cls_uri in self.types.get(node, ())
+        mask = self._type_masks.get(node)
+        if mask is None:
+            mask = 0
+            for c in self.types.get(node, ()):
+                mask |= self.closure.ancestors_mask(c)
+            self._type_masks[node] = mask
+        return mask & bit != 0
+
+    def counts(self, center: str, tech_uri: str, scenario_threats: Set[str], scenario_incidents: Set[str]) -> Dict[str, int]:
+        out = self.out
+        used = out["usesTechnology"].get(center, ())
+        tech_use = {t for t in used if t == tech_uri or self.is_instance_of(t, tech_uri)}
+
+        tech_train = set()
+        for course in out["providesTrainingCourse"].get(center, ()):
+            trained = out["trainsOnTechnology"].get(course, ())
+            if tech_uri in trained or any(self.is_instance_of(t, tech_uri) for t in trained):
+                tech_train.add(course)
+
+        incidents = scenario_incidents & self.incidents_of.get(center, set())
+
+        threat_cap = set()
+        if scenario_threats:
+            for res in set(out["hasEquipment"].get(center, ())) | set(used):
+                if out["adressesThreat"].get(res, set()) & scenario_threats:
+                    threat_cap.add(res)
+
+        facility, discipline, course, network = self.static_counts[center]
+        return {
+            "tech_use_count": len(tech_use),
+            "tech_train_count": len(tech_train),
+            "incident_count": len(incidents),
+            "threat_cap_count": len(threat_cap),
+            "facility_count": facility,
+            "discipline_count": discipline,
+            "course_count": course,
+            "network_count": network,
+        }
+
+    def recommendations(self, tech_uri: str, scen_uri: str) -> List[Dict[str, Any]]:
+        """Same rows as ``get_recommendations_for_uris``, computed locally."""
+        incidents = set(self.out["isBasedOnIncident"].get(scen_uri, ()))
+        threats: Set[str] = set()
+        for inc in incidents:
+            threats |= self.out["involvesThreat"].get(inc, set())
+
+        per_center: Dict[str, Dict[str, int]] = {}
+        results = []
+        for center, label in self.centers:
+            scores = per_center.get(center)
+            if scores is None:
+                scores = per_center[center] = self.counts(center, tech_uri, threats, incidents)
+            results.append(
+                {
+                    "center_uri": center,
+                    "center_label": label,
+                    "region": "",
+                    "scores": dict(scores),
+                }
+            )
+        results.sort(
+            key=lambda r: tuple(r["scores"][k] for k in _ORDER_KEYS),
+            reverse=True,
+        )
+        return results
+
+
+# Same priority as the ORDER BY of ENGINE_QUERY_TEMPLATE
+_ORDER_KEYS = [
+    "tech_train_count",
+    "tech_use_count",
+    "threat_cap_count",
+    "incident_count",
+    "facility_count",
+    "discipline_count",
+    "course_count",
+    "network_count",
+]
+
+_snapshot: Optional[GraphSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> Optional[GraphSnapshot]:
+    """The current snapshot, loading it on first use."""
+    global _snapshot
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = GraphSnapshot.load()
+    return _snapshot
+
+
+def refresh_snapshot() -> Optional[GraphSnapshot]:
+    """Reload the snapshot; the previous one stays in use if loading fails."""
+    global _snapshot
+    snap = GraphSnapshot.load()
+    if snap is not None:
+        with _snapshot_lock:
+            _snapshot = snap
+    return _snapshot
+
+
+@on_cache_clear
+def _reload_snapshot() -> None:
+    if _snapshot is not None:
+        refresh_snapshot()
+
+
+def check_parity(tech_uri: str, scen_uri: str) -> List[str]:
+    """Differences between the local and the SPARQL counts for one pair (empty list = identical)."""
+    from enovation_recommender import _remote_recommendations
+
+    snap = get_snapshot()
+    if snap is None:
+        return ["snapshot could not be loaded"]
+    remote = {(r["center_uri"], r["center_label"]): r["scores"] for r in _remote_recommendations(tech_uri, scen_uri)}
+    local = {(r["center_uri"], r["center_label"]): r["scores"] for r in snap.recommendations(tech_uri, scen_uri)}
+    problems = []
+    for key in sorted(set(remote) | set(local)):
+        if key not in local:
+            problems.append(f"{key[0]} missing locally")
+        elif key not in remote:
+            problems.append(f"{key[0]} missing remotely")
+        elif local[key] != remote[key]:
+            diff = {k: (remote[key][k], local[key][k]) for k in local[key] if local[key][k] != remote[key][k]}
+            problems.append(f"{key[0]}: remote/local differ {diff}")
+    return problems
+
+
+if __name__ == "__main__":
+    from enovation_recommender import get_option_labels, get_uri_for_label
+
+    techs, scens = get_option_labels()
+    failures = 0
+    for tech in techs:
+        for scen in scens:
+            tech_uri, scen_uri = get_uri_for_label(tech), get_uri_for_label(scen)
+            if not tech_uri or not scen_uri:
+                continue
+            for problem in check_parity(tech_uri, scen_uri):
+                failures += 1
+                print(f"[parity] {tech} × {scen}: {problem}")
+    print(f"[parity] {len(techs) * len(scens)} pairs checked, {failures} differences")
+    raise SystemExit(1 if failures else 0)
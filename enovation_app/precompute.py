@@ -0,0 +1,430 @@
+"""
+All-pairs precomputation of recommendations.
+
+    python precompute.py --store recommendations.sqlite --workers 4
+
+Lists every technology and scenario offered by ``/api/options``, runs
+``build_ui_payload`` for each pair with bounded parallelism and writes the
+results to a SQLite file (one zlib-compressed JSON payload per pair).  The
+file is built next to the target and moved into place when complete, so
+readers never see a half-written store.
+
+Each store records the ontology fingerprint it was computed from: a hash
+of the per (subject, predicate) digests of every triple the recommender
+reads (see ``change_tracking``), so any edit to them changes it, even one
+that keeps the triple counts.  It also records the server-side checksum of
+the same triples (``change_tracking.CHECKSUM_QUERY``, one aggregate row).
+With ``PRECOMPUTED_STORE`` set, ``/api/recommend`` answers from the store
+only while that checksum still matches the live dataset; otherwise it
+computes live as before.  The live checksum is queried by a background
+thread every ``FINGERPRINT_CHECK_INTERVAL`` seconds; requests only read its
+last verdict.  The tracked triples themselves are only read by this script.
+
+    python precompute.py --store recommendations.sqlite --incremental
+
+refreshes an existing store after the dataset changed: the per
+(subject, predicate) digests saved with the store are diffed against the
+live data (see ``change_tracking``) and only the affected pairs, or only
+the affected centres within a pair, are recomputed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from change_tracking import DatasetState, changed_keys, dataset_checksum, load_dataset_state, plan_changes
+from sparql_client import clear_cache
+
+PRECOMPUTED_STORE = os.getenv("PRECOMPUTED_STORE", "")
+# How often (seconds) the live checksum is queried to detect stale stores
+FINGERPRINT_CHECK_INTERVAL = float(os.getenv("FINGERPRINT_CHECK_INTERVAL", "60"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+  key   TEXT PRIMARY KEY,
+  value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recommendations (
+  tech        TEXT NOT NULL,
+  scen        TEXT NOT NULL,
+  payload     BLOB NOT NULL,
+  computed_at TEXT NOT NULL,
+  PRIMARY KEY (tech, scen)
+);
+CREATE TABLE IF NOT EXISTS subject_digests (
+  subject   TEXT NOT NULL,
+  predicate TEXT NOT NULL,
+  digest    TEXT NOT NULL,
+  PRIMARY KEY (subject, predicate)
+);
+"""
+
+
+def ontology_fingerprint(state: Optional[DatasetState] = None) -> Optional[str]:
+    """Content hash of the tracked triples (loaded unless ``state`` is given); None if they cannot be read."""
+    state = load_dataset_state() if state is None else state
+    if state is None:
+        return None
+    h = hashlib.sha256()
+    for (s, p), digest in sorted(state.digests().items()):
+        h.update(f"{s}\t{p}\t{digest}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _encode(payload: Any) -> bytes:
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _decode(blob: bytes) -> Any:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class RecommendationStore:
+    def __init__(self, path: str):
+        self.path = path
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        if readonly:
+            return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        conn = sqlite3.connect(self.path)
+        conn.executescript(SCHEMA)
+        return conn
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def get_meta(self, key: str) -> Optional[str]:
+        if not self.exists():
+            return None
+        conn = self._connect(readonly=True)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            return None
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        conn.close()
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        return self.get_meta("fingerprint")
+
+    @property
+    def checksum(self) -> Optional[str]:
+        return self.get_meta("checksum")
+
+    def get(self, tech: str, scen: str) -> Optional[List[Dict[str, Any]]]:
+        if not self.exists():
+            return None
+        conn = self._connect(readonly=True)
+        try:
+            row = conn.execute(
+                "SELECT payload FROM recommendations WHERE tech = ? AND scen = ?", (tech, scen)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[RecommendationStore] ERROR reading {self.path}: {e}")
+            return None
+        finally:
+            conn.close()
+        return _decode(row[0]) if row else None
+
+    def put_many(self, rows: List[Tuple[str, str, Any]]) -> None:
+        now = datetime.utcnow().isoformat() + "Z"
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO recommendations (tech, scen, payload, computed_at) VALUES (?, ?, ?, ?)",
+                [(tech, scen, _encode(payload), now) for tech, scen, payload in rows],
+            )
+        conn.close()
+
+    def delete_pairs(self, pairs: List[Tuple[str, str]]) -> None:
+        conn = self._connect()
+        with conn:
+            conn.executemany("DELETE FROM recommendations WHERE tech = ? AND scen = ?", pairs)
+        conn.close()
+
+    def put_digests(self, digests: Dict[Tuple[str, str], str]) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM subject_digests")
+            conn.executemany(
+                "INSERT INTO subject_digests (subject, predicate, digest) VALUES (?, ?, ?)",
+                [(s, p, d) for (s, p), d in digests.items()],
+            )
+        conn.close()
+
+    def get_digests(self) -> Dict[Tuple[str, str], str]:
+        if not self.exists():
+            return {}
+        conn = self._connect(readonly=True)
+        try:
+            rows = conn.execute("SELECT subject, predicate, digest FROM subject_digests").fetchall()
+        except sqlite3.Error:
+            return {}
+        finally:
+            conn.close()
+        return {(s, p): d for s, p, d in rows}
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        if not self.exists():
+            return []
+        conn = self._connect(readonly=True)
+        try:
+            return conn.execute("SELECT tech, scen FROM recommendations ORDER BY tech, scen").fetchall()
+        finally:
+            conn.close()
+
+
+def precompute_all(path: str, workers: int = 4, batch_size: int = 50) -> int:
+    """Compute every (technology, scenario) pair into a fresh store at ``path``. Returns the pair count."""
+    from enovation_recommender import get_option_labels
+
+    # checksum first: an edit made while the store is built leaves it stale, never wrongly fresh
+    checksum = dataset_checksum()
+    state = load_dataset_state()
+    if state is None or checksum is None:
+        raise RuntimeError("could not fingerprint the dataset (endpoint unreachable?)")
+    fingerprint = ontology_fingerprint(state)
+    techs, scens = get_option_labels()
+    pairs = [(t, s) for t in techs for s in scens]
+    print(f"[precompute] {len(techs)} technologies × {len(scens)} scenarios = {len(pairs)} pairs")
+
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    store = RecommendationStore(tmp_path)
+    store.set_meta("fingerprint", fingerprint)
+    store.set_meta("checksum", checksum)
+    store.put_digests(state.digests())
+
+    started = time.monotonic()
+    jobs = {(t, s): (_complete_payload, (t, s)) for t, s in pairs}
+    done = _run_jobs(store, jobs, workers, batch_size)
+
+    store.set_meta("created_at", datetime.utcnow().isoformat() + "Z")
+    os.replace(tmp_path, path)
+    print(f"[precompute] wrote {done} pairs to {path} in {time.monotonic() - started:.1f}s")
+    return done
+
+
+def _run_jobs(store: "RecommendationStore", jobs: Dict[Tuple[str, str], Tuple[Any, tuple]], workers: int, batch_size: int = 50) -> int:
+    """Run ``fn(*args)`` for every pair in parallel and write the payloads in batches."""
+    started = time.monotonic()
+    done = 0
+    pending: List[Tuple[str, str, Any]] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(fn, *args): pair for pair, (fn, args) in jobs.items()}
+        for f in as_completed(futures):
+            tech, scen = futures[f]
+            try:
+                pending.append((tech, scen, f.result()))
+            except Exception as e:
+                print(f"[precompute] ERROR {tech} × {scen}: {e}")
+                continue
+            done += 1
+            if len(pending) >= batch_size:
+                store.put_many(pending)
+                pending = []
+                print(f"[precompute] {done}/{len(jobs)} pairs ({time.monotonic() - started:.1f}s)")
+    if pending:
+        store.put_many(pending)
+    return done
+
+
+def _complete_payload(tech_label: str, scen_label: str) -> List[Dict[str, Any]]:
+    """``build_ui_payload``, raising when a details query failed so a half-filled payload is never stored."""
+    from enovation_recommender import _build_ui_payload
+
+    items, complete = _build_ui_payload(tech_label, scen_label)
+    if not complete:
+        raise RuntimeError("details query failed")
+    return items
+
+
+def _reload_dataset_caches() -> None:
+    """
+    Forget everything derived from the previous state of the dataset.
+    ``clear_cache`` reruns the ``on_cache_clear`` listeners (option lists,
+    label index, snapshot, subclass closure) here and, through the shared
+    cache generation, in every serving worker.
+    """
+    from class_closure import SUBCLASS_INDEX, get_closure
+    from enovation_recommender import RECOMMENDER_ENGINE
+    from label_index import LABEL_INDEX
+    from local_engine import get_snapshot
+
+    clear_cache()
+    LABEL_INDEX.ensure_loaded()
+    if RECOMMENDER_ENGINE == "local":
+        get_snapshot()
+    if SUBCLASS_INDEX:
+        get_closure()
+
+
+def _patch_pair(tech_uri: str, scen_uri: str, items: List[Dict[str, Any]], centres: List[str]) -> List[Dict[str, Any]]:
+    """Recompute only ``centres`` inside a stored payload, then re-rank the whole list."""
+    from enovation_recommender import SCORE_KEYS, build_center_items, get_recommendations_for_uris, rank_items
+
+    touched = set(centres)
+    recs = get_recommendations_for_uris(tech_uri, scen_uri, centres)
+    patched = build_center_items(tech_uri, scen_uri, recs)
+    if not all(item["details_loaded"] for item in patched):
+        raise RuntimeError("details query failed")
+    merged = [item for item in items if item["center_uri"] not in touched]
+    merged += patched
+    # normalization depends on every centre, so all items are re-scored from raw counts
+    for item in merged:
+        item["scores"] = {k: item["scores"].get(k, 0) for k in SCORE_KEYS}
+    rank_items(merged)
+    return merged
+
+
+def recompute_incremental(path: str, workers: int = 4) -> int:
+    """
+    Bring an existing store up to date by recomputing only what changed.
+    Falls back to ``precompute_all`` when the store has no digests or the
+    change touches the class hierarchy. Returns the number of pairs written.
+    """
+    from enovation_recommender import get_option_labels, get_uri_for_label
+
+    store = RecommendationStore(path)
+    old_digests = store.get_digests()
+    if not old_digests:
+        print("[precompute] no change-tracking data in store, running a full build")
+        return precompute_all(path, workers=workers)
+
+    _reload_dataset_caches()
+    checksum = dataset_checksum()
+    state = load_dataset_state()
+    if state is None or checksum is None:
+        raise RuntimeError("could not read the dataset (endpoint unreachable?)")
+    fingerprint = ontology_fingerprint(state)
+    new_digests = state.digests()
+    changed = changed_keys(old_digests, new_digests)
+    if not changed:
+        store.set_meta("fingerprint", fingerprint)
+        store.set_meta("checksum", checksum)
+        print("[precompute] dataset unchanged, nothing to do")
+        return 0
+
+    techs, scens = get_option_labels()
+    tech_uris = {t: get_uri_for_label(t) for t in techs}
+    scen_uris = {s: get_uri_for_label(s) for s in scens}
+    stored_pairs = set(store.pairs())
+    old_centres = set()
+    for tech, scen in stored_pairs:
+        old_centres.update(item["center_uri"] for item in store.get(tech, scen) or [])
+
+    plan = plan_changes(
+        changed, state,
+        [u for u in tech_uris.values() if u], [u for u in scen_uris.values() if u],
+        old_centres,
+    )
+    print(f"[precompute] {len(changed)} changed (subject, predicate) pairs -> {plan}")
+    if plan.full_rebuild:
+        return precompute_all(path, workers=workers)
+
+    current = {(t, s) for t in techs for s in scens}
+    jobs: Dict[Tuple[str, str], Tuple[Any, tuple]] = {}
+    for tech, scen in current:
+        tech_uri, scen_uri = tech_uris[tech], scen_uris[scen]
+        if (tech, scen) not in stored_pairs or tech_uri in plan.techs or scen_uri in plan.scenarios:
+            jobs[(tech, scen)] = (_complete_payload, (tech, scen))
+        elif plan.centres and tech_uri and scen_uri:
+            items = store.get(tech, scen) or []
+            jobs[(tech, scen)] = (_patch_pair, (tech_uri, scen_uri, items, sorted(plan.centres)))
+
+    removed = sorted(stored_pairs - current)
+    if removed:
+        store.delete_pairs(removed)
+    done = _run_jobs(store, jobs, workers)
+    store.put_digests(new_digests)
+    store.set_meta("fingerprint", fingerprint)
+    store.set_meta("checksum", checksum)
+    store.set_meta("updated_at", datetime.utcnow().isoformat() + "Z")
+    print(f"[precompute] incremental update: {done} pairs rewritten, {len(removed)} removed")
+    return done
+
+
+# --- Serving side ------------------------------------------------------------
+
+_store: Optional[RecommendationStore] = RecommendationStore(PRECOMPUTED_STORE) if PRECOMPUTED_STORE else None
+# Only guards the bookkeeping below; the checksum itself is queried outside it
+_fresh_lock = threading.Lock()
+# fresh: None until the first check has completed
+_fresh_state: Dict[str, Any] = {"checked_at": float("-inf"), "fresh": None, "checking": False}
+
+
+def check_store_freshness() -> bool:
+    """Query the live checksum now and record whether the store matches it."""
+    if _store is None:
+        return False
+    try:
+        live = dataset_checksum()
+        # If the endpoint cannot be reached, keep the previous verdict
+        if live is not None:
+            stored = _store.checksum
+            fresh = stored is not None and stored == live
+            if not fresh and _fresh_state["fresh"] is not False:
+                # logged once per transition, not on every check
+                print(f"[precompute] store {_store.path} is stale or missing, computing live")
+            _fresh_state["fresh"] = fresh
+    finally:
+        with _fresh_lock:
+            _fresh_state["checked_at"] = time.monotonic()
+            _fresh_state["checking"] = False
+    return _fresh_state["fresh"] is True
+
+
+def store_is_fresh() -> bool:
+    """
+    True while the store's checksum matched the live dataset at the last
+    check.  Never queries on the calling thread: when a check is due it is
+    started in the background and the previous verdict (False before the
+    first check completes) is returned.
+    """
+    if _store is None:
+        return False
+    with _fresh_lock:
+        due = time.monotonic() - _fresh_state["checked_at"] >= FINGERPRINT_CHECK_INTERVAL
+        if due and not _fresh_state["checking"]:
+            _fresh_state["checking"] = True
+            threading.Thread(target=check_store_freshness, name="fingerprint-check", daemon=True).start()
+        return _fresh_state["fresh"] is True
+
+
+def get_precomputed(tech: str, scen: str) -> Optional[List[Dict[str, Any]]]:
+    """Stored payload for the pair, or None if there is no usable store or entry."""
+    if _store is None or not store_is_fresh():
+        return None
+    return _store.get(tech, scen)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Precompute recommendations for every technology × scenario pair.")
+    ap.add_argument("--store", default=PRECOMPUTED_STORE or "recommendations.sqlite", help="SQLite file to write")
+    ap.add_argument("--workers", type=int, default=4, help="pairs computed in parallel")
+    ap.add_argument("--incremental", action="store_true", help="only recompute what changed since the last run")
+    args = ap.parse_args()
+    if args.incremental:
+        recompute_incremental(args.store, workers=args.workers)
+    else:
+        precompute_all(args.store, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+In-process TTL + LRU cache used for SPARQL results.
+
+Entries expire ``ttl`` seconds after they are stored and the least recently
+used entry is evicted once ``max_entries`` is reached.  ``get_or_compute``
+optionally collapses concurrent misses on the same key into a single call
+(stampede protection): the first caller computes, the others wait for it.
+
+``StaleWhileRevalidate`` keeps the last good value of an expensive
+computation and keeps serving it, marked stale, while a background thread
+computes a new one, so callers do not wait for (or fail with) a slow or
+unreachable endpoint.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+_MISSING = object()
+
+# Tokens that must survive normalization verbatim: string literals (long and
+# short forms) and IRIs.  '#' inside them is not a comment.
+_QUERY_TOKEN_RE = re.compile(
+    r'"""(?:[^"\\]|\\.|"(?!""))*"""'
+    r"|'''(?:[^'\\]|\\.|'(?!''))*'''"
+    r'|"(?:[^"\\\n]|\\.)*"'
+    r"|'(?:[^'\\\n]|\\.)*'"
+    r'|<[^<>"{}|^`\\\s]*>'
+    r"|(?P<comment>#[^\n]*)"
+    r"|(?P<space>\s+)"
+    r"|[^\"'<#\s]+"
+    r"|.",
+    re.S,
+)
+
+
+def normalize_query(query: str) -> str:
+    """Drop comments and collapse whitespace outside literals and IRIs."""
+    parts = []
+    for m in _QUERY_TOKEN_RE.finditer(query):
+        if m.group("comment") is not None or m.group("space") is not None:
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        else:
+            parts.append(m.group(0))
+    return "".join(parts).strip()
+
+
+class _Pending:
+    __slots__ = ("event", "value")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = _MISSING
+
+
+class TTLCache:
+    def __init__(self, max_entries: int, ttl: float, stampede_protection: bool = True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stampede_protection = stampede_protection
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, _Pending] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, key: Hashable) -> Any:
+        # caller holds self._lock
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        cacheable: Callable[[Any], bool] = lambda v: True,
+        wait_timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Return the cached value for ``key`` or compute and store it.
+
+        Values rejected by ``cacheable`` (e.g. empty results from a failed
+        query) are returned to the caller but not stored.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+            pending = self._inflight.get(key) if self.stampede_protection else None
+            leader = pending is None
+            if leader and self.stampede_protection:
+                pending = self._inflight[key] = _Pending()
+
+        if not leader:
+            # Someone else is already fetching this key; reuse their answer.
+            if pending.event.wait(wait_timeout) and pending.value is not _MISSING:
+                return pending.value
+            return compute()
+
+        try:
+            value = compute()
+            if cacheable(value):
+                self.set(key, value)
+            if pending is not None:
+                pending.value = value
+            return value
+        finally:
+            if pending is not None:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                pending.event.set()
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class StaleWhileRevalidate:
+    """
+    Last good value per key.  Up to ``fresh_ttl`` seconds old it is returned
+    as is; older (up to ``stale_ttl``) it is still returned at once, marked
+    stale, and a background thread recomputes it (one refresh at a time per
+    key).  A new value replaces the old one only if ``usable``, so a failed
+    refresh keeps the last good value in service.
+    """
+
+    def __init__(self, max_entries: int, fresh_ttl: float, stale_ttl: float):
+        self.fresh_ttl = fresh_ttl
+        self._values = TTLCache(max_entries, stale_ttl, stampede_protection=False)
+        self._lock = threading.Lock()
+        self._refreshing: Set[Hashable] = set()
+        self.stale_served = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def get(self, key: Hashable, compute: Callable[[], Any], usable: Callable[[Any], bool] = bool) -> Tuple[Any, bool]:
+        """``(value, stale)``; computes in the caller's thread only when there is no value to serve."""
+        served = self.peek(key, compute, usable)
+        if served is not None:
+            return served
+        value = compute()
+        self.put(key, value, usable)
+        return value, False
+
+    def get_many(
+        self,
+        keys: List[Hashable],
+        compute_many: Callable[[List[Hashable]], Dict[Hashable, Any]],
+        usable: Callable[[Any], bool] = bool,
+    ) -> Dict[Hashable, Tuple[Any, bool]]:
+        """
+        ``get`` for several keys, as ``{key: (value, stale)}``.  The keys with
+        no value to serve are computed together by ``compute_many(keys)`` in
+        the caller's thread; the stale ones are recomputed together in one
+        background thread.
+        """
+        out: Dict[Hashable, Tuple[Any, bool]] = {}
+        stale = []
+        for key in dict.fromkeys(keys):
+            served = self._served(key)
+            if served is None:
+                continue
+            out[key] = served
+            if served[1]:
+                stale.append(key)
+        if stale:
+            self._revalidate(stale, compute_many, usable)
+        missing = [key for key in dict.fromkeys(keys) if key not in out]
+        if missing:
+            values = compute_many(missing)
+            for key in missing:
+                self.put(key, values[key], usable)
+                out[key] = values[key], False
+        return out
+
+    def peek(self, key: Hashable, compute: Callable[[], Any], usable: Callable[[Any], bool] = bool) -> Optional[Tuple[Any, bool]]:
+        """
+        ``(value, stale)`` if there is a value to serve, else None (nothing is
+        computed then; store the result with ``put``).  A stale value is
+        recomputed in the background, as in ``get``.
+        """
+        served = self._served(key)
+        if served is not None and served[1]:
+            self._revalidate([key], lambda keys: {key: compute()}, usable)
+        return served
+
+    def put(self, key: Hashable, value: Any, usable: Callable[[Any], bool] = bool) -> None:
+        """Store ``value`` as the fresh value of ``key`` if it is ``usable``."""
+        if usable(value):
+            self._values.set(key, (value, time.monotonic()))
+
+    def _served(self, key: Hashable) -> Optional[Tuple[Any, bool]]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if time.monotonic() - stored_at < self.fresh_ttl:
+            return value, False
+        with self._lock:
+            self.stale_served += 1
+        return value, True
+
+    def _revalidate(
+        self,
+        keys: List[Hashable],
+        compute_many: Callable[[List[Hashable]], Dict[Hashable, Any]],
+        usable: Callable[[Any], bool],
+    ) -> None:
+        with self._lock:
+            keys = [key for key in keys if key not in self._refreshing]
+            self._refreshing.update(keys)
+        if not keys:
+            return
+
+        def run():
+            ok = 0
+            try:
+                values = compute_many(keys)
+                for key in keys:
+                    if usable(values[key]):
+                        self._values.set(key, (values[key], time.monotonic()))
+                        ok += 1
+            except Exception as e:
+                print(f"[StaleWhileRevalidate] refresh of {keys!r} failed: {e}")
+            with self._lock:
+                self._refreshing.difference_update(keys)
+                self.refreshes += len(keys)
+                self.refresh_failures += len(keys) - ok
+
+        threading.Thread(target=run, name="revalidate", daemon=True).start()
+
+    def clear(self) -> None:
+        self._values.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self._values.stats()["size"],
+                "stale_served": self.stale_served,
+                "refreshes": self.refreshes,
+                "refresh_failures": self.refresh_failures,
+            }
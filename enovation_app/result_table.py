@@ -0,0 +1,212 @@
+"""
+Columnar SPARQL results, decoded from ``text/tab-separated-values``.
+
+sparql-results+json turns every binding into a dict of small dicts that are
+then walked with ``_get_val`` / ``_get_int``.  Here the TSV response is read
+line by line straight into one list per variable:
+
+* IRIs without the angle brackets, literals as their lexical form, blank
+  nodes as their label (the same strings the JSON ``value`` fields hold)
+* unbound values as None
+* language tags in a side column, only for variables that have any
+* the variables listed in ``int_vars`` converted to ints while parsing
+  (0 when unbound or not a number, as ``_get_int`` did)
+
+Rows are read with ``table.rows("a", "b")``, which zips the columns without
+building a per-row object.
+"""
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+_ESCAPE_RE = re.compile(r"\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)", re.S)
+_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+
+
+def _unescape_match(m: "re.Match") -> str:
+    code = m.group(1)
+    if len(code) > 1:
+        return chr(int(code[1:], 16))
+    return _ESCAPES.get(code, code)
+
+
+def _unescape(text: str) -> str:
+    return _ESCAPE_RE.sub(_unescape_match, text) if "\\" in text else text
+
+
+def parse_term(text: str) -> Tuple[Optional[str], str]:
+    """``(value, lang)`` of one TSV field; ``(None, "")`` when unbound."""
+    if not text:
+        return None, ""
+    first = text[0]
+    if first == "<" and text[-1] == ">":
+        return _unescape(text[1:-1]), ""
+    if first == '"':
+        if text.startswith('"""'):
+            end = text.rindex('"""')
+            body, rest = text[3:end], text[end + 3:]
+        else:
+            end = text.rindex('"')
+            body, rest = text[1:end], text[end + 1:]
+        return _unescape(body), rest[1:] if rest.startswith("@") else ""
+    if text.startswith("_:"):
+        return text[2:], ""
+    # abbreviated numbers and booleans (Turtle short forms)
+    return text, ""
+
+
+def _to_int(value: Optional[str]) -> int:
+    if value is None:
+        return 0
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+class SparqlTable:
+    __slots__ = ("vars", "columns", "langs", "ok")
+
+    def __init__(self, vars: Sequence[str], columns: Dict[str, List[Any]], langs: Optional[Dict[str, List[str]]] = None, ok: bool = True):
+        self.vars = list(vars)
+        self.columns = columns
+        self.langs = langs or {}
+        self.ok = ok
+
+    @classmethod
+    def failed(cls) -> "SparqlTable":
+        """Result of a failed or timed-out query; falsy, so it is never cached."""
+        return cls([], {}, ok=False)
+
+    def __len__(self) -> int:
+        for col in self.columns.values():
+            return len(col)
+        return 0
+
+    def __bool__(self) -> bool:
+        return self.ok
+
+    def column(self, name: str) -> List[Any]:
+        col = self.columns.get(name)
+        return col if col is not None else [None] * len(self)
+
+    def lang(self, name: str) -> List[str]:
+        """Language tags of ``name`` ("" for values without one)."""
+        col = self.langs.get(name)
+        return col if col is not None else [""] * len(self)
+
+    def rows(self, *names: str) -> Iterator[Tuple[Any, ...]]:
+        return zip(*(self.column(n) for n in names)) if names else iter(())
+
+
+def parse_tsv(lines: Iterable[str], int_vars: Sequence[str] = ()) -> SparqlTable:
+    """Table from the lines of a SPARQL TSV result (header line first)."""
+    it = iter(lines)
+    try:
+        header = next(it)
+    except StopIteration:
+        return SparqlTable([], {})
+    vars = [v[1:] if v[:1] in "?$" else v for v in header.rstrip("\r\n").split("\t")] if header.strip() else []
+    width = len(vars)
+    cols: List[List[Any]] = [[] for _ in vars]
+    langs: Dict[int, List[str]] = {}
+    ints = [v in int_vars for v in vars]
+    count = 0
+    for line in it:
+        line = line.rstrip("\r\n")
+        if not line and width != 1:
+            continue
+        fields = line.split("\t")
+        if len(fields) < width:
+            fields.extend([""] * (width - len(fields)))
+        for i in range(width):
+            text = fields[i]
+            if ints[i]:
+                # counts come back abbreviated ("3"); anything else goes through parse_term
+                try:
+                    cols[i].append(int(text))
+                except ValueError:
+                    cols[i].append(_to_int(parse_term(text)[0]))
+                continue
+            if text[:1] == "<" and "\\" not in text:
+                cols[i].append(text[1:-1])
+                lang = ""
+            else:
+                value, lang = parse_term(text)
+                cols[i].append(value)
+            if lang:
+                tags = langs.get(i)
+                if tags is None:
+                    tags = langs[i] = [""] * count
+                tags.append(lang)
+            elif i in langs:
+                langs[i].append("")
+        count += 1
+    return SparqlTable(vars, dict(zip(vars, cols)), {vars[i]: tags for i, tags in langs.items()})
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Decoded lines of a byte stream, split on "\\n" only (literals keep other separators escaped)."""
+    pending = b""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        pending += chunk
+        parts = pending.split(b"\n")
+        pending = parts.pop()
+        for part in parts:
+            yield part.decode("utf-8")
+    if pending:
+        yield pending.decode("utf-8")
+
+
+def table_from_json(data: Dict[str, Any], int_vars: Sequence[str] = ()) -> SparqlTable:
+    """Table from a sparql-results+json dict (servers that ignore the TSV Accept header)."""
+    if not data:
+        return SparqlTable.failed()
+    vars = list(data.get("head", {}).get("vars", []))
+    bindings = data.get("results", {}).get("bindings", [])
+    columns: Dict[str, List[Any]] = {}
+    langs: Dict[str, List[str]] = {}
+    for v in vars:
+        terms = [b.get(v) for b in bindings]
+        if v in int_vars:
+            columns[v] = [_to_int(t.get("value")) if t else 0 for t in terms]
+            continue
+        columns[v] = [t.get("value") if t else None for t in terms]
+        if any(t and "xml:lang" in t for t in terms):
+            langs[v] = [t.get("xml:lang", "") if t else "" for t in terms]
+    return SparqlTable(vars, columns, langs)
+
+
+def table_from_rdflib(result, int_vars: Sequence[str] = ()) -> SparqlTable:
+    """Table from an rdflib SELECT result, without serializing it."""
+    from rdflib import Literal
+
+    vars = [str(v) for v in result.vars or []]
+    cols: List[List[Any]] = [[] for _ in vars]
+    langs: Dict[int, List[str]] = {}
+    ints = {i for i, v in enumerate(vars) if v in int_vars}
+    count = 0
+    for row in result:
+        for i, term in enumerate(row):
+            if i in ints:
+                cols[i].append(_to_int(None if term is None else str(term)))
+                continue
+            lang = ""
+            if term is None:
+                value = None
+            else:
+                # IRIs, literals' lexical forms and blank node ids, as in _term_json
+                value = str(term)
+                if isinstance(term, Literal):
+                    lang = term.language or ""
+            cols[i].append(value)
+            if lang:
+                tags = langs.get(i)
+                if tags is None:
+                    tags = langs[i] = [""] * count
+                tags.append(lang)
+            elif i in langs:
+                langs[i].append("")
+        count += 1
+    return SparqlTable(vars, dict(zip(vars, cols)), {vars[i]: tags for i, tags in langs.items()})
@@ -0,0 +1,405 @@
+"""
+Scoring profiles.
+
+A profile is a JSON file in ``profiles/`` (``SCORING_PROFILES_DIR``) holding
+the weights and formula settings of the MCDM model:
+
+    {
+      "clusters": {"operational_fit": {"tech_use_count": 0.35, ...}, ...},
+      "base": {"operational_fit": 0.65, "training_capacity": 0.15, "infrastructure_coop": 0.20},
+      "penalty": {"floor": 0.5, "exponent": 0.5},   # or null
+      "final_scale": 1.5,
+      "rank_by": "final_score_0_1",
+      "fields": ["final_score_0_10", "operational_fit", ...]
+    }
+
+Keys a profile leaves out come from the built-in AHP model below, so a
+profile written by ``learn_weights.py`` only needs ``clusters`` / ``base``.
+
+Each profile is compiled once into a plain Python function that computes
+only ``fields``, ``rank_by`` and what they depend on (e.g. no core score or
+penalty factor when nothing asks for them), plus a NumPy variant for large
+lists.  Profiles are looked up by name (``/api/recommend?profile=...``,
+default ``SCORING_PROFILE``) and recompiled when their file changes.
+"""
+import heapq
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+try:
+    import numpy as np
+except ImportError:  # optional: only needed for vectorized batch scoring
+    np = None
+
+PROFILES_DIR = Path(os.getenv("SCORING_PROFILES_DIR", str(Path(__file__).parent / "profiles")))
+DEFAULT_PROFILE = os.getenv("SCORING_PROFILE", "default")
+
+# Below this many items the per-dict loop is faster than building arrays
+VECTORIZE_MIN_ITEMS = 64
+
+SCORE_KEYS = [
+    "tech_use_count",
+    "tech_train_count",
+    "incident_count",
+    "threat_cap_count",
+    "facility_count",
+    "discipline_count",
+    "course_count",
+    "network_count",
+]
+NORM_FIELDS = [k + "_norm" for k in SCORE_KEYS]
+CLUSTERS = ["operational_fit", "training_capacity", "infrastructure_coop"]
+
+# Local names of the normalized criteria inside compiled functions
+_SHORT = ["tu", "tt", "ic", "th", "fa", "di", "co", "ne"]
+
+# What each derived field needs computed first
+_DEPENDS: Dict[str, List[str]] = {
+    "tech_core": [],
+    "scenario_core": [],
+    "core_score": ["tech_core", "scenario_core"],
+    "operational_fit": [],
+    "training_capacity": [],
+    "infrastructure_coop": [],
+    "base_score_0_1": CLUSTERS,
+    "penalty_factor": ["core_score"],
+    "final_score_0_1": ["base_score_0_1", "penalty_factor"],
+    "final_score_0_10": ["base_score_0_1"],
+    "total_score": ["final_score_0_10"],
+}
+# Evaluation order of the derived fields
+_ORDER = list(_DEPENDS)
+ALL_FIELDS = NORM_FIELDS + _ORDER
+
+BUILTIN_PROFILE: Dict[str, Any] = {
+    # --- 1. Operational Fit Clustering (Weighted Sum Model) ---
+    # Scientific Basis: AHP (Analytic Hierarchy Process) logic.
+    # Δίνουμε προτεραιότητα στα 'Hard Constraints' (Tech Use), αλλά διατηρούμε
+    # ισχυρή επιρροή του Σεναρίου (Context).
+    # Αναλογία: Tech (35% + 25% = 60%) vs Scenario (25% + 15% = 40%)
+    # --- 2. Capacity & Infrastructure Clusters ---
+    "clusters": {
+        "operational_fit": {
+            "tech_use_count": 0.35,
+            "tech_train_count": 0.20,
+            "incident_count": 0.25,
+            "threat_cap_count": 0.20,
+        },
+        "training_capacity": {"course_count": 0.60, "discipline_count": 0.40},
+        "infrastructure_coop": {"facility_count": 0.60, "network_count": 0.40},
+    },
+    # --- 3. Base Score ---
+    # Κυρίαρχος ρόλος στο Operational Fit (65%) για τη σχετικότητα (Relevance).
+    "base": {"operational_fit": 0.65, "training_capacity": 0.15, "infrastructure_coop": 0.20},
+    # --- 4. Penalty Factor (Soft/Concave Approach): floor + (1 - floor) * core_score ** exponent ---
+    # Η ρίζα (sqrt) επιτρέπει στα σχετικά κέντρα να μην βυθίζονται, ενώ τα άσχετα παραμένουν χαμηλά.
+    "penalty": {"floor": 0.5, "exponent": 0.5},
+    # --- 5. final_score_0_1 = min(1, base * penalty * final_scale); final_score_0_10 = 10 * base ---
+    "final_scale": 1.5,
+    "rank_by": "final_score_0_1",
+    "fields": ALL_FIELDS,
+}
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+class ProfileError(ValueError):
+    pass
+
+
+def weights_to_profile(criterion_weights: List[float]) -> Dict[str, Any]:
+    """
+    Per-criterion weights (SCORE_KEYS order, summing to 1) in the cluster
+    form of a profile: a cluster's base weight is the sum of its criteria,
+    its inner weights are their shares of that sum.
+    """
+    clusters = {}
+    base = {}
+    for cluster, members in BUILTIN_PROFILE["clusters"].items():
+        total = sum(criterion_weights[SCORE_KEYS.index(k)] for k in members)
+        base[cluster] = total
+        # an unused cluster keeps the default split so the profile stays well-formed
+        clusters[cluster] = {
+            k: (criterion_weights[SCORE_KEYS.index(k)] / total if total > 0 else w)
+            for k, w in members.items()
+        }
+    return {"clusters": clusters, "base": base}
+
+
+def _closure(fields: List[str], depends: Dict[str, List[str]]) -> Set[str]:
+    needed: Set[str] = set()
+    stack = list(fields)
+    while stack:
+        f = stack.pop()
+        if f not in needed:
+            needed.add(f)
+            stack.extend(depends.get(f, ()))
+    return needed
+
+
+def _weighted_sum(terms: List[tuple]) -> str:
+    parts = [f"{w!r} * {v}" for w, v in terms if w != 0]
+    return " + ".join(parts) if parts else "0.0"
+
+
+class ScoringProfile:
+    def __init__(self, name: str, doc: Dict[str, Any]):
+        self.name = name
+        self.doc = doc
+        merged = dict(BUILTIN_PROFILE)
+        merged.update({k: v for k, v in doc.items() if k in BUILTIN_PROFILE})
+        self.version = doc.get("version")
+
+        clusters = merged["clusters"]
+        if not isinstance(clusters, dict) or set(clusters) - set(CLUSTERS):
+            raise ProfileError(f"'clusters' must map {CLUSTERS} to weights")
+        self.matrix = []
+        for key in SCORE_KEYS:
+            self.matrix.append([float(clusters.get(c, {}).get(key, 0.0)) for c in CLUSTERS])
+        for c, weights in clusters.items():
+            unknown = set(weights) - set(SCORE_KEYS)
+            if unknown:
+                raise ProfileError(f"unknown criteria in cluster {c}: {sorted(unknown)}")
+        base = merged["base"]
+        if set(base) - set(CLUSTERS):
+            raise ProfileError(f"'base' keys must be among {CLUSTERS}")
+        self.base = [float(base.get(c, 0.0)) for c in CLUSTERS]
+        penalty = merged["penalty"]
+        self.penalty = None if penalty is None else (float(penalty["floor"]), float(penalty["exponent"]))
+        self.final_scale = float(merged["final_scale"])
+
+        self.fields = list(merged["fields"])
+        unknown = set(self.fields) - set(ALL_FIELDS)
+        if unknown:
+            raise ProfileError(f"unknown fields: {sorted(unknown)}")
+        self.rank_by = merged["rank_by"]
+        if self.rank_by not in ALL_FIELDS:
+            raise ProfileError(f"unknown rank_by field: {self.rank_by}")
+        depends = dict(_DEPENDS)
+        if self.penalty is None:
+            depends["final_score_0_1"] = ["base_score_0_1"]
+            depends["penalty_factor"] = []
+        self.needed = _closure(self.fields + [self.rank_by], depends)
+        self.source = self._codegen()
+        namespace: Dict[str, Any] = {}
+        exec(compile(self.source, f"<scoring profile {name}>", "exec"), namespace)
+        self._score_one: Callable[[List[float], Dict[str, Any]], None] = namespace["score"]
+
+    # --- compilation ---------------------------------------------------------
+
+    def _expr(self, field: str) -> str:
+        col = {"operational_fit": 0, "training_capacity": 1, "infrastructure_coop": 2}
+        if field == "tech_core":
+            return "(tu + tt) / 2"
+        if field == "scenario_core":
+            return "(ic + th) / 2"
+        if field == "core_score":
+            return "(tech_core + scenario_core) / 2"
+        if field in col:
+            j = col[field]
+            return _weighted_sum([(row[j], v) for row, v in zip(self.matrix, _SHORT)])
+        if field == "base_score_0_1":
+            return _weighted_sum(list(zip(self.base, CLUSTERS)))
+        if field == "penalty_factor":
+            if self.penalty is None:
+                return "1.0"
+            floor, exponent = self.penalty
+            return f"{floor!r} + {1 - floor!r} * (core_score ** {exponent!r})"
+        if field == "final_score_0_1":
+            raw = "base_score_0_1 * penalty_factor" if self.penalty is not None else "base_score_0_1"
+            return f"min(1.0, {raw} * {self.final_scale!r})"
+        if field == "final_score_0_10":
+            return "10 * base_score_0_1"
+        if field == "total_score":
+            return "final_score_0_10"
+        raise ProfileError(field)
+
+    def _codegen(self) -> str:
+        lines = ["def score(n, s):", "    " + ", ".join(_SHORT) + " = n"]
+        for field, short in zip(NORM_FIELDS, _SHORT):
+            if field in self.needed:
+                lines.append(f"    s[{field!r}] = {short}")
+        for field in _ORDER:
+            if field in self.needed:
+                lines.append(f"    {field} = {self._expr(field)}")
+                if field in self.fields or field == self.rank_by:
+                    lines.append(f"    s[{field!r}] = {field}")
+        return "\n".join(lines) + "\n"
+
+    # --- scoring -------------------------------------------------------------
+
+    def score(self, items: List[Dict[str, Any]]) -> None:
+        """Normalize the raw counts of ``items`` and add this profile's fields (in place)."""
+        if not items:
+            return
+        if np is not None and len(items) >= VECTORIZE_MIN_ITEMS:
+            counts = np.array([[item["scores"].get(k, 0) for k in SCORE_KEYS] for item in items], dtype=np.float64)
+            # tolist() hands back plain Python floats, which is what jsonify expects
+            as_lists = {name: col.tolist() for name, col in self.score_matrix(counts).items()}
+            for i, item in enumerate(items):
+                s = item["scores"]
+                for name, values in as_lists.items():
+                    s[name] = values[i]
+            return
+
+        max_vals = [0] * len(SCORE_KEYS)
+        for item in items:
+            s = item["scores"]
+            for j, k in enumerate(SCORE_KEYS):
+                v = s.get(k, 0)
+                if v > max_vals[j]:
+                    max_vals[j] = v
+        score_one = self._score_one
+        for item in items:
+            s = item["scores"]
+            norms = [
+                s.get(k, 0) / max_v if max_v > 0 else 0.0
+                for k, max_v in zip(SCORE_KEYS, max_vals)
+            ]
+            score_one(norms, s)
+
+    def score_matrix(self, counts: "np.ndarray") -> Dict[str, "np.ndarray"]:
+        """
+        Score an (N x 8) array of raw counts (columns in SCORE_KEYS order).
+        Returns one length-N array per emitted field.
+        """
+        need = self.needed
+        max_vals = counts.max(axis=0)
+        norm = np.divide(counts, max_vals, out=np.zeros_like(counts), where=max_vals > 0)
+        cols: Dict[str, "np.ndarray"] = {f: norm[:, j] for j, f in enumerate(NORM_FIELDS)}
+        if "tech_core" in need:
+            cols["tech_core"] = (norm[:, 0] + norm[:, 1]) / 2
+        if "scenario_core" in need:
+            cols["scenario_core"] = (norm[:, 2] + norm[:, 3]) / 2
+        if "core_score" in need:
+            cols["core_score"] = (cols["tech_core"] + cols["scenario_core"]) / 2
+        if need & set(CLUSTERS):
+            clusters = norm @ np.array(self.matrix)
+            for j, c in enumerate(CLUSTERS):
+                cols[c] = clusters[:, j]
+        if "base_score_0_1" in need:
+            cols["base_score_0_1"] = clusters @ np.array(self.base)
+        if "penalty_factor" in need:
+            if self.penalty is None:
+                cols["penalty_factor"] = np.ones(len(counts))
+            else:
+                floor, exponent = self.penalty
+                cols["penalty_factor"] = floor + (1 - floor) * np.power(cols["core_score"], exponent)
+        if "final_score_0_1" in need:
+            raw = cols["base_score_0_1"] * cols["penalty_factor"] if self.penalty is not None else cols["base_score_0_1"]
+            cols["final_score_0_1"] = np.minimum(1.0, raw * self.final_scale)
+        if "final_score_0_10" in need:
+            cols["final_score_0_10"] = 10 * cols["base_score_0_1"]
+        if "total_score" in need:
+            cols["total_score"] = cols["final_score_0_10"]
+        emitted = set(self.fields) | {self.rank_by}
+        return {f: v for f, v in cols.items() if f in emitted}
+
+    def rank(self, items: List[Dict[str, Any]]) -> None:
+        """Score ``items`` and sort them best first (in place)."""
+        self.score(items)
+        rank_by = self.rank_by
+        items.sort(key=lambda x: x["scores"].get(rank_by, 0.0), reverse=True)
+
+    def top(self, items: List[Dict[str, Any]], n: int) -> List[Dict[str, Any]]:
+        """
+        The ``n`` best of already scored ``items``, best first, in the order
+        ``rank`` would sort them (ties keep their input order), found with a
+        partial heap selection instead of a full sort.
+        """
+        rank_by = self.rank_by
+        return heapq.nlargest(n, items, key=lambda x: x["scores"].get(rank_by, 0.0))
+
+    def criterion_weights(self) -> List[float]:
+        """Overall weight of each criterion in the base score (SCORE_KEYS order)."""
+        return [sum(w * b for w, b in zip(row, self.base)) for row in self.matrix]
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "description": self.doc.get("description", ""),
+            "rank_by": self.rank_by,
+            "fields": self.fields,
+        }
+
+
+class ProfileRegistry:
+    """Profiles of a directory, compiled on first use and again whenever their file changes."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._compiled: Dict[str, tuple] = {}
+        self._builtin = ScoringProfile("builtin", {})
+
+    def names(self) -> List[str]:
+        if not self.directory.is_dir():
+            return []
+        return sorted(p.stem for p in self.directory.glob("*.json"))
+
+    def get(self, name: Optional[str] = None) -> ScoringProfile:
+        """
+        The compiled profile ``name`` (default: ``SCORING_PROFILE``).
+        Raises KeyError for unknown names; a file that fails to load or
+        compile keeps its previous version.
+        """
+        name = name or DEFAULT_PROFILE
+        if not _NAME_RE.match(name):
+            raise KeyError(name)
+        path = self.directory / f"{name}.json"
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            cached = self._compiled.get(name)
+            if cached is not None:
+                return cached[1]
+            if name == DEFAULT_PROFILE:
+                return self._builtin
+            raise KeyError(name)
+        cached = self._compiled.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with self._lock:
+            cached = self._compiled.get(name)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            try:
+                with path.open(encoding="utf-8") as f:
+                    profile = ScoringProfile(name, json.load(f))
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                print(f"[scoring_profiles] ERROR loading {path}: {e}")
+                fallback = cached[1] if cached is not None else (self._builtin if name == DEFAULT_PROFILE else None)
+                if fallback is None:
+                    raise KeyError(name)
+                # remember the broken mtime so the file is not re-parsed on every request
+                self._compiled[name] = (mtime, fallback)
+                return fallback
+            print(f"[scoring_profiles] loaded profile {name!r} (version {profile.version})")
+            self._compiled[name] = (mtime, profile)
+            return profile
+
+
+PROFILES = ProfileRegistry(PROFILES_DIR)
+
+
+def get_profile(name: Optional[str] = None) -> ScoringProfile:
+    return PROFILES.get(name)
+
+
+def rerank(items: List[Dict[str, Any]], profile: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Copy of ``items`` (e.g. a stored payload) re-scored from their raw counts
+    under ``profile`` and sorted again; nothing is queried.
+    """
+    out = []
+    for item in items:
+        item = dict(item)
+        item["scores"] = {k: item["scores"].get(k, 0) for k in SCORE_KEYS}
+        out.append(item)
+    get_profile(profile).rank(out)
+    return out
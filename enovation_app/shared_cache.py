@@ -0,0 +1,276 @@
+"""
+Cross-process cache tier for SPARQL results, in a SQLite file (WAL mode).
+
+With several worker processes (see ``gunicorn.conf.py``) each one keeps its
+own in-memory ``TTLCache``; with ``SHARED_CACHE=/path/cache.sqlite`` a miss
+there is looked up here before going to Fuseki, and every result fetched by
+one worker is stored for the others.  Values are zlib-compressed JSON
+(sparql-results+json dicts and ``SparqlTable``s).
+
+Consistency across processes:
+
+* ``clear()`` bumps a generation counter stored in the file.  Entries carry
+  the generation they were computed under and only entries of the current
+  generation are ever returned, so a clear in one process (e.g. an
+  incremental ``precompute.py`` run) is seen by every worker on its next
+  lookup; ``generation()`` lets workers drop their in-memory caches too.
+* A result computed while a clear happened is stored under the old
+  generation and therefore never served.
+* Concurrent misses on the same key across processes are collapsed with a
+  lease row: one process fetches, the others poll for its result (up to
+  ``wait_timeout``) and fetch themselves only if the lease expires.
+
+The file should be private to the service account; it only holds query
+results, never code.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from hashlib import sha1
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from result_table import SparqlTable
+
+SHARED_CACHE = os.getenv("SHARED_CACHE", "")
+SHARED_CACHE_TTL = float(os.getenv("SHARED_CACHE_TTL", os.getenv("SPARQL_CACHE_TTL", "300")))
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "20000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+  key   TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+CREATE TABLE IF NOT EXISTS entries (
+  key        TEXT PRIMARY KEY,
+  generation INTEGER NOT NULL,
+  expires_at REAL NOT NULL,
+  value      BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+  key        TEXT PRIMARY KEY,
+  owner      TEXT NOT NULL,
+  expires_at REAL NOT NULL
+);
+"""
+
+_GET = """
+SELECT e.value FROM entries e JOIN meta m ON m.key = 'generation'
+WHERE e.key = ? AND e.generation = m.value AND e.expires_at > ?
+"""
+
+# Entries written between two prunes; pruning drops expired / old-generation rows
+_PRUNE_EVERY = 200
+
+
+def _encode(value: Any) -> bytes:
+    if isinstance(value, SparqlTable):
+        value = {"table": [value.vars, value.columns, value.langs]}
+    else:
+        value = {"json": value}
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _decode(blob: bytes) -> Any:
+    value = json.loads(zlib.decompress(blob).decode("utf-8"))
+    if "table" in value:
+        return SparqlTable(*value["table"])
+    return value["json"]
+
+
+def _key(key: Hashable) -> str:
+    return sha1(repr(key).encode("utf-8")).hexdigest()
+
+
+class SharedCache:
+    def __init__(self, path: str, ttl: float = SHARED_CACHE_TTL, max_entries: int = SHARED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.errors = 0
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    # --- connections ------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        """This thread's connection (a new one after a fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    # --- generation -------------------------------------------------------
+
+    def generation(self) -> int:
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def clear(self) -> int:
+        """Invalidate every entry in every process; returns the new generation."""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+            generation = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+            conn.execute("DELETE FROM entries WHERE generation < ?", (generation,))
+            conn.execute("DELETE FROM leases")
+        return generation
+
+    # --- entries ----------------------------------------------------------
+
+    def get(self, key: Hashable) -> Any:
+        """Cached value or None."""
+        row = self._connect().execute(_GET, (_key(key), time.time())).fetchone()
+        return _decode(row[0]) if row else None
+
+    def set(self, key: Hashable, value: Any, generation: int, ttl: Optional[float] = None) -> None:
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, generation, expires_at, value) VALUES (?, ?, ?, ?)",
+            (_key(key), generation, time.time() + (self.ttl if ttl is None else ttl), _encode(value)),
+        )
+        with self._stats_lock:
+            self._writes += 1
+            prune = self._writes % _PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self) -> None:
+        """Drop expired and superseded entries, then the oldest beyond ``max_entries``."""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "DELETE FROM entries WHERE expires_at <= ? OR generation < (SELECT value FROM meta WHERE key = 'generation')",
+                (time.time(),),
+            )
+            conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            conn.execute("DELETE FROM leases WHERE expires_at <= ?", (time.time(),))
+
+    # --- leases -----------------------------------------------------------
+
+    def _acquire(self, key: str, owner: str, seconds: float) -> bool:
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)", (key, owner, now + seconds)
+            )
+            return cur.rowcount == 1
+
+    def _release(self, key: str, owner: str) -> None:
+        self._connect().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        cacheable: Callable[[Any], bool] = lambda v: True,
+        wait_timeout: float = 60.0,
+    ) -> Any:
+        """
+        Shared value for ``key``, or ``compute()`` stored for the other
+        processes.  Any SQLite error falls back to calling ``compute``.
+        """
+        try:
+            generation = self.generation()
+            value = self.get(key)
+            if value is not None:
+                self._count("hits")
+                return value
+            skey = _key(key)
+            owner = f"{os.getpid()}:{threading.get_ident()}"
+            deadline = time.monotonic() + wait_timeout
+            delay = 0.02
+            while not self._acquire(skey, owner, wait_timeout):
+                # another process is fetching the same result
+                if time.monotonic() >= deadline:
+                    return compute()
+                self._count("waits")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.25)
+                value = self.get(key)
+                if value is not None:
+                    self._count("hits")
+                    return value
+            self._count("misses")
+        except sqlite3.Error as e:
+            print(f"[SharedCache] ERROR: {e}")
+            self._count("errors")
+            return compute()
+
+        try:
+            value = compute()
+            if cacheable(value):
+                try:
+                    self.set(key, value, generation)
+                except sqlite3.Error as e:
+                    print(f"[SharedCache] ERROR storing result: {e}")
+                    self._count("errors")
+            return value
+        finally:
+            try:
+                self._release(skey, owner)
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            size = self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            generation = self.generation()
+        except sqlite3.Error:
+            size = generation = -1
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "generation": generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "waits": self.waits,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_shared: Optional[SharedCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """The cache at ``SHARED_CACHE``, or None when it is not configured or cannot be opened."""
+    global _shared
+    if not SHARED_CACHE:
+        return None
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                try:
+                    _shared = SharedCache(SHARED_CACHE)
+                except sqlite3.Error as e:
+                    print(f"[SharedCache] ERROR: cannot open {SHARED_CACHE}: {e}")
+                    return None
+    return _shared
@@ -0,0 +1,617 @@
+"""
+SPARQL transport for the recommender.
+
+A single pooled ``requests.Session`` is shared by every caller (keep-alive
+connections to Fuseki are reused instead of opening a socket per query), and
+a bounded thread pool lets independent queries run side by side.  Each
+endpoint has its own in-flight limit: callers wait at most
+``SPARQL_QUEUE_TIMEOUT`` seconds for a slot and then give up with an empty
+result, so a slow Fuseki cannot pile up blocked Flask workers.
+
+Successful results are kept in a TTL + LRU cache keyed on the endpoint and
+the normalized query text, so repeating a recommendation is served from
+memory.  Cached result dicts are shared between callers and must be treated
+as read-only.
+
+Queries go to one of two backends (``SPARQL_BACKEND``):
+
+* ``http`` (default): the Fuseki endpoint at ``FUSEKI_ENDPOINT``
+* ``local``: ``ONTOLOGY_FILE`` loaded into an in-process rdflib graph; rows
+  are turned into sparql-results+json shaped dicts directly, with no HTTP
+  round trip or JSON encoding.  Meant for development, benchmarks and
+  offline deployments; needs ``pip install rdflib``.
+
+``run_sparql_table`` returns the same results as a columnar ``SparqlTable``
+(see ``result_table.py``): the HTTP backend asks for
+``text/tab-separated-values`` and decodes the response while it streams in,
+the local backend fills the columns straight from rdflib's rows.
+
+With several worker processes, ``SHARED_CACHE`` adds a second tier behind
+the in-memory cache: a SQLite file every process reads and writes (see
+``shared_cache.py``), so a result fetched by one worker serves the others.
+``clear_cache`` empties both tiers for every process; the other processes
+notice on their next ``sync_shared_cache`` (called before each request) and
+then drop their in-memory results and rerun the ``on_cache_clear``
+listeners that reload label index, snapshot and so on.
+
+HTTP requests connect with a short timeout (``SPARQL_CONNECT_TIMEOUT``) and
+are retried ``SPARQL_RETRIES`` times with jittered backoff when the endpoint
+refused or dropped the connection or answered 429/502/503/504.  Each
+endpoint has a circuit breaker (see ``circuit_breaker.py``): while it is
+open, queries fail at once instead of waiting for Fuseki.
+"""
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from circuit_breaker import CircuitBreaker, retry_delay
+from instrumentation import INSTRUMENTATION, annotate_http, in_context, register_gauges, sparql_span
+from result_cache import TTLCache, normalize_query
+from result_table import SparqlTable, iter_lines, parse_tsv, table_from_json, table_from_rdflib
+from shared_cache import get_shared_cache
+
+FUSEKI_ENDPOINT = os.getenv("FUSEKI_ENDPOINT", "http://147.102.6.178:3030/enovation/sparql")
+
+SPARQL_BACKEND = os.getenv("SPARQL_BACKEND", "http")
+ONTOLOGY_FILE = os.getenv("ONTOLOGY_FILE", "")
+# rdflib format name; empty: guessed from the file extension
+ONTOLOGY_FORMAT = os.getenv("ONTOLOGY_FORMAT", "")
+
+SPARQL_TIMEOUT = float(os.getenv("SPARQL_TIMEOUT", "60"))
+SPARQL_CONNECT_TIMEOUT = float(os.getenv("SPARQL_CONNECT_TIMEOUT", "3"))
+SPARQL_RETRIES = int(os.getenv("SPARQL_RETRIES", "2"))
+SPARQL_MAX_WORKERS = int(os.getenv("SPARQL_MAX_WORKERS", "8"))
+SPARQL_MAX_IN_FLIGHT = int(os.getenv("SPARQL_MAX_IN_FLIGHT", "8"))
+SPARQL_QUEUE_TIMEOUT = float(os.getenv("SPARQL_QUEUE_TIMEOUT", "5"))
+
+SPARQL_CACHE_SIZE = int(os.getenv("SPARQL_CACHE_SIZE", "512"))
+SPARQL_CACHE_TTL = float(os.getenv("SPARQL_CACHE_TTL", "300"))
+SPARQL_CACHE_STAMPEDE = os.getenv("SPARQL_CACHE_STAMPEDE", "1") == "1"
+
+_result_cache = TTLCache(SPARQL_CACHE_SIZE, SPARQL_CACHE_TTL, stampede_protection=SPARQL_CACHE_STAMPEDE)
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(SPARQL_MAX_IN_FLIGHT, SPARQL_MAX_WORKERS))
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+
+_executor = ThreadPoolExecutor(max_workers=SPARQL_MAX_WORKERS, thread_name_prefix="sparql")
+
+_slots_lock = threading.Lock()
+_slots: Dict[str, threading.BoundedSemaphore] = {}
+
+
+def _endpoint_slots(endpoint: str) -> threading.BoundedSemaphore:
+    with _slots_lock:
+        sem = _slots.get(endpoint)
+        if sem is None:
+            sem = _slots[endpoint] = threading.BoundedSemaphore(SPARQL_MAX_IN_FLIGHT)
+        return sem
+
+
+# Answers worth retrying: the endpoint is overloaded or restarting
+_RETRY_STATUSES = frozenset((429, 502, 503, 504))
+
+
+def _endpoint_failure(e: Exception) -> bool:
+    """True for errors that say the endpoint is unhealthy (not e.g. a 400 for a bad query)."""
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    # a truncated or garbled body (JSON / TSV that does not decode) counts against the endpoint too
+    return isinstance(e, (requests.exceptions.RequestException, ValueError))
+
+
+class HttpBackend:
+    """SPARQL protocol over the shared pooled session."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.name = endpoint
+        self.breaker = CircuitBreaker(endpoint)
+
+    def _get(
+        self, query: str, headers: Dict[str, str], stream: bool = False
+    ) -> Optional[Tuple[requests.Response, threading.BoundedSemaphore]]:
+        """
+        GET the query, retrying connection errors and ``_RETRY_STATUSES``;
+        raises ``RequestException`` once the retries are used up.  Read
+        timeouts are not retried: the query already used its time.
+
+        Each attempt holds one of the endpoint's in-flight slots, the backoff
+        between attempts does not, so retries against a degrading endpoint
+        do not starve other queries of slots.  Returns the response with its
+        slot still held (the caller releases it once the body is read), or
+        None if the circuit is open or no slot frees up in time.
+        """
+        attempt = 0
+        while True:
+            slots = self._acquire()
+            if slots is None:
+                return None
+            try:
+                resp = _session.get(
+                    self.endpoint,
+                    params={"query": query},
+                    headers=headers,
+                    timeout=(SPARQL_CONNECT_TIMEOUT, SPARQL_TIMEOUT),
+                    stream=stream,
+                )
+                if resp.status_code not in _RETRY_STATUSES or attempt >= SPARQL_RETRIES:
+                    try:
+                        resp.raise_for_status()
+                    except requests.exceptions.HTTPError:
+                        resp.close()
+                        raise
+                    return resp, slots
+                resp.close()
+                reason = f"HTTP {resp.status_code}"
+            except requests.exceptions.ConnectionError as e:
+                slots.release()
+                if attempt >= SPARQL_RETRIES:
+                    raise
+                reason = type(e).__name__
+            except BaseException:
+                slots.release()
+                raise
+            else:
+                slots.release()
+            delay = retry_delay(attempt)
+            attempt += 1
+            print(f"[run_sparql] {reason} from {self.endpoint}, retry {attempt}/{SPARQL_RETRIES} in {delay:.2f}s")
+            time.sleep(delay)
+
+    def _failed(self, e: Exception) -> None:
+        print(f"[run_sparql] ERROR: {e}")
+        if _endpoint_failure(e):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _acquire(self) -> Optional[threading.BoundedSemaphore]:
+        """The endpoint's in-flight slot, or None if the circuit is open or no slot frees up in time."""
+        if not self.breaker.allow():
+            print(f"[run_sparql] ERROR: circuit open for {self.endpoint}, not querying")
+            return None
+        slots = _endpoint_slots(self.endpoint)
+        if not slots.acquire(timeout=SPARQL_QUEUE_TIMEOUT):
+            print(f"[run_sparql] ERROR: no free slot for {self.endpoint} after {SPARQL_QUEUE_TIMEOUT}s")
+            return None
+        return slots
+
+    def fetch(self, query: str) -> Dict[str, Any]:
+        headers = {"Accept": "application/sparql-results+json"}
+        slots = None
+        try:
+            got = self._get(query, headers)
+            if got is None:
+                return {}
+            resp, slots = got
+            if not INSTRUMENTATION:
+                data = resp.json()
+            else:
+                started = time.perf_counter()
+                data = resp.json()
+                annotate_http(len(resp.content), time.perf_counter() - started)
+            self.breaker.record_success()
+            return data
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self._failed(e)
+            return {}
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def fetch_table(self, query: str, int_vars: Sequence[str] = ()) -> SparqlTable:
+        headers = {"Accept": "text/tab-separated-values, application/sparql-results+json;q=0.5"}
+        resp = slots = None
+        try:
+            got = self._get(query, headers, stream=True)
+            if got is None:
+                return SparqlTable.failed()
+            resp, slots = got
+            started = time.perf_counter()
+            if "tab-separated-values" not in resp.headers.get("Content-Type", ""):
+                # endpoint without TSV output: decode the JSON it sent instead
+                table = table_from_json(resp.json(), int_vars)
+                size = len(resp.content)
+            else:
+                size = 0
+
+                def chunks():
+                    nonlocal size
+                    for chunk in resp.iter_content(65536):
+                        size += len(chunk)
+                        yield chunk
+
+                table = parse_tsv(iter_lines(chunks()), int_vars)
+            if INSTRUMENTATION:
+                annotate_http(size, time.perf_counter() - started)
+            self.breaker.record_success()
+            return table
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self._failed(e)
+            return SparqlTable.failed()
+        finally:
+            if resp is not None:
+                resp.close()
+            if slots is not None:
+                slots.release()
+
+
+class LocalBackend:
+    """
+    An ontology file queried in-process with rdflib.
+
+    The graph is parsed on first use.  rdflib's query parser is not
+    thread-safe, so queries are evaluated one at a time.
+    """
+
+    def __init__(self, path: str, fmt: str = ""):
+        self.path = path
+        self.format = fmt or None
+        self.name = "local:" + os.path.abspath(path) if path else "local:"
+        self._graph = None
+        self._load_lock = threading.Lock()
+        self._query_lock = threading.Lock()
+
+    def graph(self):
+        if self._graph is None:
+            with self._load_lock:
+                if self._graph is None:
+                    self._graph = self._load()
+        return self._graph
+
+    def _load(self):
+        try:
+            import rdflib
+        except ImportError:
+            print("[LocalBackend] ERROR: SPARQL_BACKEND=local needs rdflib (pip install rdflib)")
+            return None
+        if not self.path or not os.path.exists(self.path):
+            print(f"[LocalBackend] ERROR: ONTOLOGY_FILE not found: {self.path!r}")
+            return None
+        g = rdflib.Graph()
+        g.parse(self.path, format=self.format)
+        print(f"[LocalBackend] loaded {len(g)} triples from {self.path}")
+        return g
+
+    def reload(self) -> bool:
+        """Parse the file again (e.g. after it was edited); keeps the old graph on failure."""
+        try:
+            g = self._load()
+        except Exception as e:
+            print(f"[LocalBackend] ERROR: could not parse {self.path}: {e}")
+            return False
+        if g is None:
+            return False
+        with self._load_lock:
+            self._graph = g
+        return True
+
+    def fetch(self, query: str) -> Dict[str, Any]:
+        g = self.graph()
+        if g is None:
+            return {}
+        try:
+            with self._query_lock:
+                result = g.query(query)
+                names = [str(v) for v in result.vars or []]
+                bindings = []
+                for row in result:
+                    b = {}
+                    for name, term in zip(names, row):
+                        if term is not None:
+                            b[name] = _term_json(term)
+                    bindings.append(b)
+        except Exception as e:
+            print(f"[LocalBackend] ERROR: {e}")
+            return {}
+        return {"head": {"vars": names}, "results": {"bindings": bindings}}
+
+    def fetch_table(self, query: str, int_vars: Sequence[str] = ()) -> SparqlTable:
+        g = self.graph()
+        if g is None:
+            return SparqlTable.failed()
+        try:
+            with self._query_lock:
+                return table_from_rdflib(g.query(query), int_vars)
+        except Exception as e:
+            print(f"[LocalBackend] ERROR: {e}")
+            return SparqlTable.failed()
+
+
+def _term_json(term) -> Dict[str, str]:
+    """rdflib term -> sparql-results+json term."""
+    from rdflib import BNode, Literal
+
+    if isinstance(term, Literal):
+        out = {"type": "literal", "value": str(term)}
+        if term.language:
+            out["xml:lang"] = term.language
+        elif term.datatype is not None:
+            out["datatype"] = str(term.datatype)
+        return out
+    if isinstance(term, BNode):
+        return {"type": "bnode", "value": str(term)}
+    return {"type": "uri", "value": str(term)}
+
+
+_backends_lock = threading.Lock()
+_backends: Dict[str, Any] = {}
+
+
+def get_backend(endpoint: Optional[str] = None):
+    """The backend for an explicit endpoint URL, or the configured default one."""
+    if endpoint is None and SPARQL_BACKEND == "local":
+        key = "local"
+    else:
+        key = endpoint or FUSEKI_ENDPOINT
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            if key == "local":
+                backend = LocalBackend(ONTOLOGY_FILE, ONTOLOGY_FORMAT)
+            else:
+                backend = HttpBackend(key)
+            _backends[key] = backend
+        return backend
+
+
+def run_sparql(
+    query: str, endpoint: Optional[str] = None, cache: bool = True, name: Optional[str] = None, shared: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    Run one SELECT query.  ``name`` identifies the query template in traces
+    and metrics (see ``instrumentation.py``); it does not affect the result.
+    ``shared`` (default: same as ``cache``) reads and stores the result in
+    the cross-process cache, if one is configured.
+    """
+    backend = get_backend(endpoint)
+    cached = cache and SPARQL_CACHE_SIZE > 0
+    shared = (cache if shared is None else shared) and _shared_cache() is not None
+    if not INSTRUMENTATION:
+        return _fetch(backend, query, cached, shared=shared)
+    with sparql_span(name, cached or shared) as span:
+        data = _fetch(backend, query, cached, span, shared=shared)
+        span.result(data)
+    return data
+
+
+def run_sparql_table(
+    query: str,
+    endpoint: Optional[str] = None,
+    cache: bool = True,
+    name: Optional[str] = None,
+    int_vars: Sequence[str] = (),
+    shared: Optional[bool] = None,
+) -> SparqlTable:
+    """
+    ``run_sparql`` returning a ``SparqlTable``; the variables in ``int_vars``
+    are decoded as ints.  A failed query gives an empty, falsy table.
+    """
+    backend = get_backend(endpoint)
+    cached = cache and SPARQL_CACHE_SIZE > 0
+    shared = (cache if shared is None else shared) and _shared_cache() is not None
+    int_vars = tuple(int_vars)
+    if not INSTRUMENTATION:
+        return _fetch(backend, query, cached, int_vars=int_vars, shared=shared)
+    with sparql_span(name, cached or shared) as span:
+        table = _fetch(backend, query, cached, span, int_vars, shared)
+        span.result(table)
+    return table
+
+
+def _fetch(backend, query: str, cached: bool, span=None, int_vars: Optional[Tuple[str, ...]] = None, shared: bool = False):
+    """JSON result, or a ``SparqlTable`` when ``int_vars`` is given (possibly empty)."""
+    if int_vars is None:
+        fetch = backend.fetch
+        key = (backend.name, normalize_query(query))
+    else:
+        fetch = lambda q: backend.fetch_table(q, int_vars)
+        key = ("table", backend.name, int_vars, normalize_query(query))
+    store = _shared_cache() if shared else None
+    if not cached and store is None:
+        return fetch(query)
+
+    def compute():
+        if span is not None:
+            span.fetched()
+        return fetch(query)
+
+    # Failed queries come back as {} / a failed table and are not cached
+    if store is not None:
+        compute_local = compute
+        compute = lambda: store.get_or_compute(key, compute_local, cacheable=bool, wait_timeout=SPARQL_TIMEOUT)
+    if not cached:
+        return compute()
+    return _result_cache.get_or_compute(key, compute, cacheable=bool, wait_timeout=SPARQL_TIMEOUT)
+
+
+QueryNames = Union[str, Sequence[str], None]
+
+
+def _query_names(name: QueryNames, count: int) -> List[Optional[str]]:
+    """One template name per query: ``name`` repeated, or the given list."""
+    if name is None or isinstance(name, str):
+        return [name] * count
+    return list(name)
+
+
+def _runner(as_table: bool, int_vars: Sequence[str]):
+    """``(run, failed)``: the per-query function for the pool and its failed result."""
+    if not as_table:
+        return run_sparql, dict
+    int_vars = tuple(int_vars)
+    return (lambda q, endpoint, name=None: run_sparql_table(q, endpoint, name=name, int_vars=int_vars)), SparqlTable.failed
+
+
+def run_sparql_many(
+    queries: List[str],
+    timeout: Optional[float] = None,
+    endpoint: Optional[str] = None,
+    name: QueryNames = None,
+    as_table: bool = False,
+    int_vars: Sequence[str] = (),
+) -> List[Any]:
+    """
+    Run independent queries concurrently and return their results in order.
+
+    Queries still pending when ``timeout`` (default ``SPARQL_TIMEOUT``) runs
+    out are cancelled and reported as ``{}``, like a failed ``run_sparql``.
+    ``name`` is one template name for all queries or one per query.  With
+    ``as_table`` the results are ``SparqlTable``s (see ``run_sparql_table``).
+    """
+    if not queries:
+        return []
+    names = _query_names(name, len(queries))
+    run, failed = _runner(as_table, int_vars)
+    if len(queries) == 1:
+        return [run(queries[0], endpoint, name=names[0])]
+
+    futures = [_executor.submit(in_context(run), q, endpoint, name=n) for q, n in zip(queries, names)]
+    done, not_done = wait(futures, timeout=SPARQL_TIMEOUT if timeout is None else timeout)
+    for f in not_done:
+        f.cancel()
+    if not_done:
+        print(f"[run_sparql_many] WARNING: {len(not_done)} of {len(futures)} queries timed out")
+    return [f.result() if f in done else failed() for f in futures]
+
+
+def iter_sparql_completed(
+    queries: List[str],
+    timeout: Optional[float] = None,
+    endpoint: Optional[str] = None,
+    name: QueryNames = None,
+    as_table: bool = False,
+    int_vars: Sequence[str] = (),
+) -> Iterator[Tuple[int, Any]]:
+    """
+    Run queries concurrently and yield ``(index, result)`` as each one finishes.
+
+    Same deadline and cancellation rules as ``run_sparql_many``: queries that
+    have not finished in time are cancelled and yielded last as ``{}`` (or a
+    failed table with ``as_table``).
+    """
+    names = _query_names(name, len(queries))
+    run, failed = _runner(as_table, int_vars)
+    futures = {_executor.submit(in_context(run), q, endpoint, name=names[i]): i for i, q in enumerate(queries)}
+    pending = set(futures)
+    try:
+        for f in as_completed(futures, timeout=SPARQL_TIMEOUT if timeout is None else timeout):
+            pending.discard(f)
+            yield futures[f], f.result()
+    except FuturesTimeout:
+        print(f"[iter_sparql_completed] WARNING: {len(pending)} of {len(futures)} queries timed out")
+        for f in pending:
+            f.cancel()
+        for f in sorted(pending, key=futures.get):
+            yield futures[f], failed()
+    finally:
+        # consumer stopped early (e.g. client disconnected): drop what is still queued
+        for f in pending:
+            f.cancel()
+
+
+def cache_stats() -> Dict[str, Any]:
+    return _result_cache.stats()
+
+
+_clear_listeners: List[Callable[[], None]] = []
+_shared_lock = threading.Lock()
+_shared_generation: Optional[int] = None
+
+
+def on_cache_clear(fn: Callable[[], None]) -> Callable[[], None]:
+    """Call ``fn`` whenever the result cache is cleared, in this or (with ``SHARED_CACHE``) another process."""
+    _clear_listeners.append(fn)
+    return fn
+
+
+def _notify_clear() -> None:
+    for fn in list(_clear_listeners):
+        try:
+            fn()
+        except Exception as e:
+            print(f"[sparql_client] ERROR in cache clear listener {getattr(fn, '__qualname__', fn)}: {e}")
+
+
+def _shared_cache():
+    """The cross-process cache, remembering its generation when first opened."""
+    global _shared_generation
+    store = get_shared_cache()
+    if store is not None and _shared_generation is None:
+        with _shared_lock:
+            if _shared_generation is None:
+                _shared_generation = store.generation()
+    return store
+
+
+def sync_shared_cache() -> bool:
+    """
+    Pick up a ``clear_cache`` made by another process: drop the in-memory
+    results and reload the derived caches in the background.  Returns True
+    if there was one.  Cheap (one SQLite read); a no-op without ``SHARED_CACHE``.
+    """
+    global _shared_generation
+    store = _shared_cache()
+    if store is None:
+        return False
+    try:
+        generation = store.generation()
+    except Exception as e:
+        print(f"[sparql_client] ERROR reading shared cache generation: {e}")
+        return False
+    with _shared_lock:
+        if generation == _shared_generation:
+            return False
+        _shared_generation = generation
+    _result_cache.clear()
+    threading.Thread(target=_notify_clear, name="cache-reload", daemon=True).start()
+    return True
+
+
+def clear_cache() -> None:
+    """Forget every cached result, in every process sharing ``SHARED_CACHE``."""
+    global _shared_generation
+    store = _shared_cache()
+    if store is not None:
+        generation = store.clear()
+        with _shared_lock:
+            _shared_generation = generation
+    _result_cache.clear()
+    _notify_clear()
+
+
+def shared_cache_stats() -> Dict[str, Any]:
+    store = get_shared_cache()
+    return store.stats() if store is not None else {}
+
+
+register_gauges("sparql_result_cache", cache_stats)
+register_gauges("shared_cache", shared_cache_stats)
+
+
+def breaker_stats() -> Dict[str, Any]:
+    """Circuit breakers of the HTTP endpoints, summed (usually there is one)."""
+    with _backends_lock:
+        breakers = [b.breaker for b in _backends.values() if isinstance(b, HttpBackend)]
+    totals = {"open": 0, "consecutive_failures": 0, "trips": 0, "rejected": 0}
+    for breaker in breakers:
+        for key, value in breaker.stats().items():
+            totals[key] += value
+    return totals
+
+
+register_gauges("sparql_breaker", breaker_stats)
+
+
+@atexit.register
+def _shutdown_executor():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,45 @@
+"""
+The modules of enovation_app import each other as top-level modules
+(``from sparql_client import ...``), the way app.py is run; make that work
+under pytest too.
+"""
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "benchmarks"))
+
+
+@pytest.fixture(scope="session")
+def synthetic_graph(tmp_path_factory):
+    """
+    A small synthetic ontology (benchmarks/synthetic_ontology.py) served by the
+    in-process rdflib backend, so the SPARQL paths run without Fuseki.
+    """
+    pytest.importorskip("rdflib")
+    import sparql_client
+    from synthetic_ontology import write_turtle
+
+    path = str(tmp_path_factory.mktemp("graph") / "synthetic.ttl")
+    write_turtle(path, centres=12, technologies=6, scenarios=4, fanout=2, seed=3)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(sparql_client, "SPARQL_BACKEND", "local")
+        mp.setattr(sparql_client, "ONTOLOGY_FILE", path)
+        mp.setattr(sparql_client, "_backends", {})
+        sparql_client.clear_cache()
+        yield path
+        sparql_client.clear_cache()
+
+
+@pytest.fixture(scope="session")
+def synthetic_pairs(synthetic_graph):
+    """Every (technology URI, scenario URI) pair the UI offers on the synthetic graph."""
+    from enovation_recommender import get_option_labels, get_uri_for_label
+
+    techs, scens = get_option_labels()
+    pairs = [(get_uri_for_label(t), get_uri_for_label(s)) for t in techs for s in scens]
+    assert pairs and all(t and s for t, s in pairs)
+    return pairs
@@ -0,0 +1,68 @@
+import change_tracking
+from change_tracking import (
+    EN,
+    RDF_TYPE,
+    RDFS_LABEL,
+    TRAINING_CENTRE_LABEL,
+    DatasetState,
+    changed_keys,
+    load_dataset_state,
+    plan_changes,
+)
+
+CENTRE_CLASS = EN + "TrainingCentre"
+
+
+def _state(*extra):
+    return DatasetState([
+        (CENTRE_CLASS, RDFS_LABEL, TRAINING_CENTRE_LABEL),
+        (EN + "centre1", RDF_TYPE, CENTRE_CLASS),
+        (EN + "centre1", EN + "providesTrainingCourse", EN + "course1"),
+        (EN + "course1", EN + "trainsOnTechnology", EN + "tech1"),
+        (EN + "scen1", EN + "isBasedOnIncident", EN + "inc1"),
+        *extra,
+    ])
+
+
+def _plan(old, new, old_centres=()):
+    changed = changed_keys(old.digests(), new.digests())
+    return plan_changes(changed, new, [EN + "tech1", EN + "tech2"], [EN + "scen1"], old_centres)
+
+
+def test_course_change_maps_to_its_centre():
+    old = _state()
+    new = DatasetState([(s, p, EN + "tech2" if o == EN + "tech1" else o) for s, preds in old.out.items() for p, objs in preds.items() for o in objs])
+    plan = _plan(old, new)
+    assert not plan.full_rebuild
+    assert plan.centres == {EN + "centre1"}
+    assert not plan.techs and not plan.scenarios
+
+
+def test_centre_class_label_change_rebuilds_everything():
+    old = _state()
+    new = DatasetState([t for t in (
+        (s, p, o) for s, preds in old.out.items() for p, objs in preds.items() for o in objs
+    ) if t[1] != RDFS_LABEL] + [(CENTRE_CLASS, RDFS_LABEL, '"Training center"@en')])
+    assert _plan(old, new, old_centres=[EN + "centre1"]).full_rebuild
+
+
+def _bindings(restriction_value):
+    uri = lambda v: {"type": "uri", "value": v}
+    return {"results": {"bindings": [
+        {"s": uri(EN + "course1"), "p": uri(EN + "trainsOnTechnology"), "o": {"type": "bnode", "value": "b0"},
+         "bp": uri("http://www.w3.org/2002/07/owl#someValuesFrom"), "bo": uri(restriction_value)},
+        {"s": uri(EN + "course1"), "p": uri(EN + "trainsOnTechnology"), "o": uri(EN + "tech1")},
+    ]}}
+
+
+def test_blank_nodes_are_hashed_by_content(monkeypatch):
+    monkeypatch.setattr(change_tracking, "run_sparql", lambda *a, **k: _bindings(EN + "tech1"))
+    before = load_dataset_state().digests()
+    monkeypatch.setattr(change_tracking, "run_sparql", lambda *a, **k: _bindings(EN + "tech2"))
+    after = load_dataset_state().digests()
+    assert changed_keys(before, after) == {(EN + "course1", EN + "trainsOnTechnology")}
+
+
+def test_failed_query_gives_no_state(monkeypatch):
+    monkeypatch.setattr(change_tracking, "run_sparql", lambda *a, **k: {})
+    assert load_dataset_state() is None
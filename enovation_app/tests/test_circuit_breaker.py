@@ -0,0 +1,158 @@
+import itertools
+
+import requests
+
+import circuit_breaker
+import sparql_client
+from circuit_breaker import CircuitBreaker, retry_delay
+from sparql_client import HttpBackend
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_half_opens_and_closes(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    breaker = CircuitBreaker("test", failures=3, reset_after=30)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.stats() == {"open": 1, "consecutive_failures": 3, "trips": 1, "rejected": 1}
+
+    clock.now += 30
+    assert breaker.allow() and breaker.state == "half_open"
+    # only one trial request while half-open
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert breaker.stats()["trips"] == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("test", failures=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_retry_delay_is_bounded_by_the_backoff():
+    for attempt in range(4):
+        assert all(0 <= retry_delay(attempt, base=0.1) <= 0.1 * 2 ** attempt for _ in range(50))
+
+
+class _Response:
+    def __init__(self, status, body=b'{"results": {"bindings": []}}', content_type="application/sparql-results+json"):
+        self.status_code = status
+        self.content = body
+        self.headers = {"Content-Type": content_type}
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"HTTP {self.status_code}", response=self)
+
+    def json(self):
+        import json
+
+        return json.loads(self.content)
+
+    def iter_content(self, size):
+        for i in range(0, len(self.content), size):
+            yield self.content[i:i + size]
+
+    def close(self):
+        self.closed = True
+
+
+class _Session:
+    def __init__(self, outcomes):
+        self.outcomes = iter(outcomes)
+        self.calls = 0
+
+    def get(self, *args, **kwargs):
+        self.calls += 1
+        outcome = next(self.outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome if isinstance(outcome, _Response) else _Response(outcome)
+
+
+_endpoints = itertools.count()
+
+
+def _backend(monkeypatch, outcomes, retries=2):
+    session = _Session(outcomes)
+    monkeypatch.setattr(sparql_client, "_session", session)
+    monkeypatch.setattr(sparql_client, "SPARQL_RETRIES", retries)
+    backend = HttpBackend(f"http://sparql.test/{next(_endpoints)}")
+    slots = sparql_client._endpoint_slots(backend.endpoint)
+    free_during_backoff = []
+
+    def delay(attempt):
+        free_during_backoff.append(slots._value)
+        return 0.0
+
+    monkeypatch.setattr(sparql_client, "retry_delay", delay)
+    return backend, session, slots, free_during_backoff
+
+
+def test_retries_release_the_slot_while_backing_off(monkeypatch):
+    backend, session, slots, free = _backend(monkeypatch, [503, requests.exceptions.ConnectionError(), 200])
+    assert backend.fetch("SELECT * {}") == {"results": {"bindings": []}}
+    assert session.calls == 3
+    assert free == [sparql_client.SPARQL_MAX_IN_FLIGHT] * 2
+    assert slots._value == sparql_client.SPARQL_MAX_IN_FLIGHT
+    assert backend.breaker.failures == 0
+
+
+def test_exhausted_retries_count_as_one_failure(monkeypatch):
+    backend, session, slots, _ = _backend(monkeypatch, [503, 503, 503])
+    assert backend.fetch("SELECT * {}") == {}
+    assert session.calls == 3
+    assert backend.breaker.failures == 1
+    assert slots._value == sparql_client.SPARQL_MAX_IN_FLIGHT
+
+
+def test_bad_queries_and_read_timeouts_are_not_retried(monkeypatch):
+    backend, session, _, _ = _backend(monkeypatch, [400])
+    assert not backend.fetch_table("SELECT * {}").ok
+    assert session.calls == 1 and backend.breaker.failures == 0
+
+    backend, session, _, _ = _backend(monkeypatch, [requests.exceptions.ReadTimeout()])
+    assert backend.fetch("SELECT * {}") == {}
+    assert session.calls == 1 and backend.breaker.failures == 1
+
+
+def test_open_circuit_skips_the_endpoint(monkeypatch):
+    backend, session, _, _ = _backend(monkeypatch, [], retries=0)
+    backend.breaker = CircuitBreaker(backend.endpoint, failures=1, reset_after=60)
+    backend.breaker.record_failure()
+    assert backend.fetch("SELECT * {}") == {}
+    assert session.calls == 0
+
+
+def test_undecodable_bodies_count_as_endpoint_failures(monkeypatch):
+    backend, _, slots, _ = _backend(monkeypatch, [_Response(200, b'{"results": {"bind')], retries=0)
+    assert backend.fetch("SELECT * {}") == {}
+    assert backend.breaker.failures == 1
+
+    # cut inside a two-byte character
+    truncated = _Response(200, b'?l\n"\xce\x9a\xce', content_type="text/tab-separated-values; charset=utf-8")
+    backend, _, slots, _ = _backend(monkeypatch, [truncated], retries=0)
+    assert not backend.fetch_table("SELECT * {}").ok
+    assert backend.breaker.failures == 1 and truncated.closed
+    assert slots._value == sparql_client.SPARQL_MAX_IN_FLIGHT
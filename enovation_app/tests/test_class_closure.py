@@ -0,0 +1,49 @@
+from class_closure import SubClassClosure
+
+
+def test_closure_is_reflexive_and_transitive():
+    closure = SubClassClosure([("b", "a"), ("c", "b"), ("d", "a")])
+    assert closure.is_subclass("c", "a")
+    assert closure.is_subclass("a", "a")
+    assert not closure.is_subclass("a", "c")
+    assert not closure.is_subclass("c", "d")
+    assert closure.ancestors("c") == {"a", "b", "c"}
+    assert closure.descendants("a") == {"a", "b", "c", "d"}
+    # unknown classes are only their own ancestor / descendant
+    assert closure.ancestors("x") == {"x"}
+    assert closure.is_subclass("x", "x") and not closure.is_subclass("x", "a")
+
+
+def test_cycles_are_collapsed():
+    closure = SubClassClosure([("a", "b"), ("b", "c"), ("c", "a"), ("d", "c"), ("c", "top")])
+    for cls in "abc":
+        assert closure.ancestors(cls) == {"a", "b", "c", "top"}
+    assert closure.descendants("top") == {"a", "b", "c", "d", "top"}
+    assert closure.is_subclass("d", "a")
+
+
+def test_blank_nodes_keep_a_prefix():
+    closure = SubClassClosure.from_bindings([
+        {"s": {"type": "uri", "value": "http://x/B"}, "o": {"type": "uri", "value": "http://x/A"}},
+        {"s": {"type": "uri", "value": "http://x/B"}, "o": {"type": "bnode", "value": "r1"}},
+    ])
+    assert closure.ancestors("http://x/B") == {"http://x/A", "http://x/B", "_:r1"}
+
+
+def test_closure_matches_property_path(synthetic_graph):
+    from class_closure import get_closure
+    from sparql_client import run_sparql_table
+
+    closure = get_closure()
+    table = run_sparql_table(
+        "PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#> "
+        "SELECT ?s ?o WHERE { ?s rdfs:subClassOf* ?o . FILTER(isIRI(?s) && isIRI(?o)) }",
+        cache=False,
+    )
+    # zero-length paths pair every node of the graph with itself; compare proper superclasses
+    expected = {(s, o) for s, o in zip(table.column("s"), table.column("o")) if s != o}
+    assert expected
+    for sub, sup in expected:
+        assert closure.is_subclass(sub, sup)
+    names = [n for n in closure.names if not n.startswith("_:")]
+    assert {(s, o) for s in names for o in closure.ancestors(s) if o != s and not o.startswith("_:")} == expected
@@ -0,0 +1,20 @@
+import enovation_recommender as rec
+
+
+def _details(tech, scen):
+    items = rec._bare_items(rec.get_recommendations_for_uris(tech, scen))
+    assert rec.attach_details(tech, scen, items)
+    return {item["center_uri"]: (item["explanations_simple"], item["graph_paths"]) for item in items}
+
+
+def test_combined_query_matches_separate_templates(synthetic_pairs, monkeypatch):
+    compared = 0
+    for tech, scen in synthetic_pairs:
+        monkeypatch.setattr(rec, "COMBINED_DETAILS_QUERY", True)
+        combined = _details(tech, scen)
+        monkeypatch.setattr(rec, "COMBINED_DETAILS_QUERY", False)
+        separate = _details(tech, scen)
+        assert combined == separate, (tech, scen)
+        compared += sum(1 for explanations, paths in combined.values() if explanations or paths)
+    # the synthetic graph does have details to compare
+    assert compared
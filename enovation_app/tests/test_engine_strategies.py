@@ -0,0 +1,16 @@
+import pytest
+
+import class_closure
+from enovation_recommender import check_engine_parity, engine_rows
+
+
+@pytest.mark.parametrize("subclass_index", [False, True])
+def test_strategies_agree_with_single(synthetic_pairs, monkeypatch, subclass_index):
+    monkeypatch.setattr(class_closure, "SUBCLASS_INDEX", subclass_index)
+    # every technology and every scenario once; all pairs take too long under rdflib
+    techs = list(dict.fromkeys(t for t, _ in synthetic_pairs))
+    scens = list(dict.fromkeys(s for _, s in synthetic_pairs))
+    pairs = [(t, scens[i % len(scens)]) for i, t in enumerate(techs)] + [(techs[0], s) for s in scens[1:]]
+    assert any(engine_rows(tech, scen, strategy="single") for tech, scen in pairs)
+    problems = [p for tech, scen in pairs for p in check_engine_parity(tech, scen)]
+    assert problems == []
@@ -0,0 +1,46 @@
+import json
+import threading
+
+from feedback_writer import FeedbackWriter, iter_records, log_files
+
+
+def _records(path):
+    return list(iter_records(log_files(path)))
+
+
+def test_batched_records_reach_disk_in_order(tmp_path):
+    path = tmp_path / "feedback.jsonl"
+    writer = FeedbackWriter(path, batch_size=10, flush_interval=0.05, max_bytes=0)
+    threads = [threading.Thread(target=lambda i=i: [writer.submit({"t": i, "n": n}) for n in range(50)]) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert writer.flush(5)
+    records = _records(path)
+    assert len(records) == 200
+    for i in range(4):
+        assert [r["n"] for r in records if r["t"] == i] == list(range(50))
+    writer.close()
+
+
+def test_rotation_keeps_backups(tmp_path):
+    path = tmp_path / "feedback.jsonl"
+    writer = FeedbackWriter(path, batch_size=1, flush_interval=0.01, max_bytes=200, backups=2, compress=True)
+    for n in range(60):
+        writer.submit({"n": n, "pad": "x" * 40})
+    writer.close()
+    assert sorted(p.name for p in tmp_path.glob("feedback.jsonl.*") if not p.name.endswith(".lock")) == [
+        "feedback.jsonl.1.gz", "feedback.jsonl.2.gz",
+    ]
+    numbers = [r["n"] for r in _records(path)]
+    assert numbers == sorted(numbers) and numbers[-1] == 59
+
+
+def test_zero_backups_never_drops_the_log(tmp_path):
+    path = tmp_path / "feedback.jsonl"
+    writer = FeedbackWriter(path, batch_size=1, flush_interval=0.01, max_bytes=100, backups=0)
+    for n in range(20):
+        writer.submit({"n": n, "pad": "x" * 40})
+    writer.close()
+    assert [json.loads(line)["n"] for line in path.read_text().splitlines()] == list(range(20))
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+import label_index
+from label_index import LabelIndex
+
+
+def _first_containing(pairs, needle):
+    seen = set()
+    for uri, label in pairs:
+        low = label.lower()
+        if (uri, low) in seen:
+            continue
+        seen.add((uri, low))
+        if needle in low:
+            return uri
+    return None
+
+
+def test_lookup_order():
+    index = LabelIndex()
+    index.build([
+        ("u:a", "Decontamination Training"),
+        ("u:b", "Radiation detection (field)"),
+        ("u:c", "Training centre"),
+    ])
+    assert index.lookup("training centre") == "u:c"
+    # part before "(" first, then the whole label
+    assert index.lookup("Radiation detection (lab)") == "u:b"
+    assert index.lookup("training") == "u:a"
+    assert index.lookup("nothing like it") is None
+    assert index.lookup("") is None
+
+
+def test_substring_match_returns_earliest_label():
+    rng = random.Random(7)
+    words = ["alpha", "beta", "gamma", "decontamination", "training", "centre", "radiation"]
+    pairs = [(f"u:{i % 400}", " ".join(rng.choice(words) for _ in range(rng.randint(1, 4)))) for i in range(500)]
+    index = LabelIndex()
+    index.build(pairs)
+    for needle in ["a", "ta", "amma tr", "entre", "n", "ion ra", "xyz"]:
+        assert index.lookup(needle) == _first_containing(pairs, needle), needle
+
+
+def test_labels_of_and_rebuild():
+    index = LabelIndex()
+    index.build([("u:a", "Alpha", "en"), ("u:a", "Άλφα", "el")])
+    assert index.labels_of("u:a") == [("Alpha", "en"), ("Άλφα", "el")]
+    index.build([("u:b", "Beta")])
+    assert index.lookup("alpha") is None
+    assert index.lookup("beta") == "u:b"
+    assert index.labels_of("u:a") == []
+
+
+@pytest.mark.parametrize("key_chars", [1, 3, label_index._KEY_CHARS])
+def test_suffix_array_matches_a_substring_sort(monkeypatch, key_chars):
+    # small chunks force the tie refinement through several rounds
+    monkeypatch.setattr(label_index, "_KEY_CHARS", key_chars)
+    rng = random.Random(11)
+    # short alphabet: many repeats, shared prefixes and duplicate labels
+    labels = ["".join(rng.choice("ab c") for _ in range(rng.randint(0, 40))) for _ in range(300)]
+    index = LabelIndex()
+    index.build([(f"u:{i}", label) for i, label in enumerate(labels)])
+    text, sa = index._index.text, list(index._index.suffixes)
+    keys = [text[p:text.index("\x00", p)] for p in sa]
+    assert keys == sorted(keys)
+    assert sorted(sa) == [p for p in range(len(text)) if text[p] != "\x00"]
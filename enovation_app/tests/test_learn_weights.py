@@ -0,0 +1,84 @@
+import gzip
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import learn_weights
+from learn_weights import NORM_KEYS, accumulate, fit_weights, iter_rows, write_profile
+from feedback_writer import iter_records, log_files
+import scoring_profiles
+from scoring_profiles import ProfileRegistry, get_profile, weights_to_profile
+
+TRUE_WEIGHTS = np.array([0.4, 0.0, 0.25, 0.0, 0.2, 0.15, 0.0, 0.0])
+
+
+def _records(n, seed=0):
+    """Ratings generated from TRUE_WEIGHTS, snapped to the three rating levels."""
+    rng = np.random.default_rng(seed)
+    for x in rng.random((n, len(NORM_KEYS))):
+        score = float(x @ TRUE_WEIGHTS)
+        rating = "good" if score > 0.6 else "bad" if score < 0.4 else "neutral"
+        yield {"rating": rating, "scores": dict(zip(NORM_KEYS, x.tolist()))}
+
+
+def _exact_stats(n, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.random((n, len(NORM_KEYS)))
+    y = 0.1 + 0.8 * X @ TRUE_WEIGHTS
+    stats = learn_weights.FeedbackStats()
+    stats.add(X, y)
+    return stats
+
+
+def test_chunked_statistics_match_one_pass():
+    records = list(_records(1000))
+    one = accumulate(iter_rows(records), chunk_size=10**6)
+    chunked = accumulate(iter_rows(records), chunk_size=7)
+    assert chunked.n == one.n == 1000
+    for attr in ("sx", "xtx", "xty"):
+        np.testing.assert_allclose(getattr(chunked, attr), getattr(one, attr), rtol=1e-12)
+    assert chunked.sy == pytest.approx(one.sy, rel=1e-12)
+    assert chunked.syy == pytest.approx(one.syy, rel=1e-12)
+
+
+def test_fit_recovers_known_non_negative_weights():
+    prior = np.full(len(NORM_KEYS), 1.0 / len(NORM_KEYS))
+    w = fit_weights(_exact_stats(5000), prior, ridge=0.0)
+    assert (w >= 0).all() and w.sum() == pytest.approx(1.0)
+    np.testing.assert_allclose(w, TRUE_WEIGHTS, atol=1e-4)
+
+
+def test_ridge_pulls_towards_the_prior():
+    prior = np.full(len(NORM_KEYS), 1.0 / len(NORM_KEYS))
+    free = fit_weights(_exact_stats(5000), prior, ridge=0.0)
+    shrunk = fit_weights(_exact_stats(5000), prior, ridge=10.0)
+    assert np.abs(shrunk - prior).sum() < np.abs(free - prior).sum()
+
+
+def test_rotated_and_compressed_logs_are_read(tmp_path):
+    path = tmp_path / "feedback.jsonl"
+    records = list(_records(30))
+    lines = [json.dumps(r) + "\n" for r in records]
+    with gzip.open(f"{path}.2.gz", "wt", encoding="utf-8") as f:
+        f.writelines(lines[:10])
+    (tmp_path / "feedback.jsonl.1").write_text("".join(lines[10:20]), encoding="utf-8")
+    path.write_text("".join(lines[20:]) + "not json\n", encoding="utf-8")
+    assert [f.name for f in log_files(path)] == ["feedback.jsonl.2.gz", "feedback.jsonl.1", "feedback.jsonl"]
+    assert list(iter_records(log_files(path))) == records
+
+
+def test_written_profile_loads_and_backups_are_not_listed(tmp_path, monkeypatch):
+    out = tmp_path / "learned.json"
+    for version in (1, 2):
+        profile = weights_to_profile(TRUE_WEIGHTS.tolist())
+        profile.update({"name": "learned", "version": version})
+        write_profile(out, profile)
+    registry = ProfileRegistry(tmp_path)
+    monkeypatch.setattr(scoring_profiles, "PROFILES", registry)
+    assert registry.names() == ["learned"]
+    assert (tmp_path / "learned.json.v1").exists()
+    loaded = get_profile("learned")
+    assert loaded.version == 2
+    np.testing.assert_allclose(loaded.criterion_weights(), TRUE_WEIGHTS, atol=1e-9)
@@ -0,0 +1,20 @@
+from local_engine import check_parity, get_snapshot
+
+
+def test_snapshot_matches_sparql_engine(synthetic_pairs):
+    assert get_snapshot() is not None
+    problems = [p for tech, scen in synthetic_pairs for p in check_parity(tech, scen)]
+    assert problems == []
+
+
+def test_parity_detects_a_difference(synthetic_pairs, monkeypatch):
+    snap = get_snapshot()
+    tech, scen = synthetic_pairs[0]
+    original = snap.counts
+
+    def off_by_one(*args):
+        counts = original(*args)
+        return {k: v + 1 for k, v in counts.items()}
+
+    monkeypatch.setattr(snap, "counts", off_by_one)
+    assert check_parity(tech, scen)
@@ -0,0 +1,65 @@
+import base64
+import json
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client(synthetic_graph):
+    from app import app
+
+    return app.test_client()
+
+
+@pytest.fixture(scope="module")
+def labels(synthetic_pairs):
+    from enovation_recommender import get_option_labels
+
+    techs, scens = get_option_labels()
+    return techs[0], scens[0]
+
+
+def _centres(results):
+    return [r["center_uri"] for r in results]
+
+
+def test_pages_concatenate_to_the_full_ranking(client, labels):
+    tech, scen = labels
+    full = client.get("/api/recommend", query_string={"tech": tech, "scen": scen, "top_k": "all"}).get_json()["results"]
+    assert len(full) > 3
+
+    page = client.get("/api/recommend", query_string={"tech": tech, "scen": scen, "limit": 3}).get_json()
+    seen = list(page["results"])
+    assert page["total"] == len(full) and page["offset"] == 0
+    while page["next_cursor"]:
+        page = client.get("/api/recommend", query_string={"cursor": page["next_cursor"]}).get_json()
+        assert len(page["results"]) <= 3
+        seen += page["results"]
+    assert _centres(seen) == _centres(full)
+    assert all(r.get("explanations_simple") is not None for r in seen)
+
+    offset = client.get("/api/recommend", query_string={"tech": tech, "scen": scen, "limit": 2, "offset": 2}).get_json()
+    assert _centres(offset["results"]) == _centres(full[2:4])
+
+
+def _cursor(**state):
+    return base64.urlsafe_b64encode(json.dumps(state).encode("utf-8")).decode("ascii")
+
+
+def test_invalid_cursors_and_limits_are_rejected(client, labels):
+    tech, scen = labels
+    bad = [
+        {"cursor": "not base64 json"},
+        {"cursor": _cursor(tech=tech, scen=scen)},
+        {"cursor": _cursor(tech=tech, scen=scen, profile=None, offset=-1, limit=3, ranking=None)},
+        {"tech": tech, "scen": scen, "limit": 0},
+        {"tech": tech, "scen": scen, "limit": "x"},
+    ]
+    for args in bad:
+        assert client.get("/api/recommend", query_string=args).status_code == 400, args
+
+
+def test_cursor_of_a_changed_ranking_is_refused(client, labels):
+    tech, scen = labels
+    stale = _cursor(tech=tech, scen=scen, profile=None, offset=3, limit=3, ranking="0" * 16)
+    assert client.get("/api/recommend", query_string={"cursor": stale}).status_code == 409
@@ -0,0 +1,177 @@
+import time
+
+import pytest
+
+import enovation_recommender as rec
+from result_cache import StaleWhileRevalidate
+from result_table import SparqlTable
+
+DETAIL_QUERIES = ("details_batch", "explain_batch")
+
+
+@pytest.fixture
+def labels(synthetic_pairs, monkeypatch):
+    techs, scens = rec.get_option_labels()
+    # several chunks per pair, so one of them can fail on its own
+    monkeypatch.setattr(rec, "BATCH_CHUNK_SIZE", 4)
+    return techs[0], scens[0]
+
+
+@pytest.fixture
+def payloads(monkeypatch):
+    """An empty payload cache whose entries turn stale at once."""
+    cache = StaleWhileRevalidate(64, 0.0, 3600)
+    monkeypatch.setattr(rec, "_payloads", cache)
+    return cache
+
+
+@pytest.fixture
+def fresh_payloads(monkeypatch):
+    """An empty payload cache whose entries stay fresh."""
+    cache = StaleWhileRevalidate(64, 3600, 3600)
+    monkeypatch.setattr(rec, "_payloads", cache)
+    return cache
+
+
+def _break_details(monkeypatch, first_only):
+    """Details queries fail the way a timed-out one does: the first of each batch, or all of them."""
+    real_many, real_iter = rec.run_sparql_many, rec.iter_sparql_completed
+
+    def failed(kwargs):
+        return SparqlTable.failed() if kwargs.get("as_table") else {}
+
+    def run_many(queries, *args, **kwargs):
+        results = real_many(queries, *args, **kwargs)
+        name = kwargs.get("name")
+        if (name[0] if isinstance(name, list) else name) in DETAIL_QUERIES:
+            for i in range(1 if first_only else len(results)):
+                results[i] = failed(kwargs)
+        return results
+
+    def iterate(queries, *args, **kwargs):
+        # the stream only sends details queries through iter_sparql_completed
+        for i, result in real_iter(queries, *args, **kwargs):
+            yield i, failed(kwargs) if i == 0 or not first_only else result
+
+    monkeypatch.setattr(rec, "run_sparql_many", run_many)
+    monkeypatch.setattr(rec, "iter_sparql_completed", iterate)
+
+
+@pytest.fixture
+def flaky_details(monkeypatch):
+    _break_details(monkeypatch, first_only=True)
+
+
+def _wait_for_refreshes(cache, count):
+    deadline = time.monotonic() + 30
+    while cache.stats()["refreshes"] < count:
+        assert time.monotonic() < deadline, "background refresh did not finish"
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("combined", [True, False])
+def test_failed_details_query_is_reported(labels, flaky_details, monkeypatch, combined):
+    monkeypatch.setattr(rec, "COMBINED_DETAILS_QUERY", combined)
+    items, complete = rec._build_ui_payload(*labels)
+    assert not complete
+    missing = [item for item in items if not item["details_loaded"]]
+    # only the centres of the failed chunk are left for the UI to load on demand
+    assert 0 < len(missing) < len(items)
+    assert all(item["explanations_simple"] == [] and item["graph_paths"] == [] for item in missing)
+
+
+def test_complete_payload(labels):
+    items, complete = rec._build_ui_payload(*labels)
+    assert complete and items
+    assert all(item["details_loaded"] for item in items)
+
+
+def test_payload_with_failed_details_is_not_cached(labels, payloads, flaky_details):
+    items, stale = rec.build_ui_payload_swr(*labels)
+    assert not stale and items
+    assert payloads.stats()["size"] == 0
+
+
+def test_failed_refresh_keeps_the_last_complete_payload(labels, payloads, monkeypatch):
+    good, _ = rec.build_ui_payload_swr(*labels)
+    _break_details(monkeypatch, first_only=False)
+
+    items, stale = rec.build_ui_payload_swr(*labels)
+    assert stale and items is good
+    _wait_for_refreshes(payloads, 1)
+    assert payloads.stats()["refresh_failures"] == 1
+    items, stale = rec.build_ui_payload_swr(*labels)
+    assert items is good
+
+
+def _not_recomputed(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("payload recomputed")
+
+    monkeypatch.setattr(rec, "_build_ui_payload", fail)
+    monkeypatch.setattr(rec, "_build_ui_payload_batch", fail)
+
+
+@pytest.mark.parametrize("combined", [True, False])
+def test_streamed_payload_is_kept_for_the_next_request(labels, fresh_payloads, monkeypatch, combined):
+    monkeypatch.setattr(rec, "COMBINED_DETAILS_QUERY", combined)
+    messages = list(rec.stream_ui_payload(*labels, top_k=3))
+    assert [m["type"] for m in messages[:1] + messages[-1:]] == ["ranking", "done"] and len(messages) > 2
+    expected = rec.build_ui_payload(*labels, top_k=3)
+
+    _not_recomputed(monkeypatch)
+    items, stale = rec.build_ui_payload_swr(*labels, top_k=3)
+    assert not stale and items == expected
+    # a later stream sends the kept payload whole
+    assert list(rec.stream_ui_payload(*labels, top_k=3)) == [
+        {"type": "ranking", "results": items, "top_k": 3},
+        {"type": "done"},
+    ]
+
+
+def test_stream_skips_failed_batches_and_keeps_nothing(labels, fresh_payloads, flaky_details):
+    messages = list(rec.stream_ui_payload(*labels))
+    loaded = {u for m in messages if m["type"] == "explanations" for u in m["results"]}
+    assert 0 < len(loaded) < len(messages[0]["results"])
+    assert fresh_payloads.stats()["size"] == 0
+
+
+def test_stream_serves_a_stale_payload(labels, payloads):
+    items, _ = rec.build_ui_payload_swr(*labels)
+    ranking, done = rec.stream_ui_payload(*labels)
+    assert ranking["stale"] and ranking["results"] is items and done == {"type": "done"}
+
+
+def test_batch_shares_payloads_with_single_requests(labels, fresh_payloads, monkeypatch):
+    techs, scens = rec.get_option_labels()
+    other = (techs[1], scens[1])
+    single, _ = rec.build_ui_payload_swr(*labels)
+    computed = []
+    real = rec._build_ui_payload_batch
+
+    def batch(label_pairs, *args):
+        computed.extend(label_pairs)
+        return real(label_pairs, *args)
+
+    monkeypatch.setattr(rec, "_build_ui_payload_batch", batch)
+    out = rec.build_ui_payload_batch_swr([labels, other, labels])
+    assert computed == [other]
+    assert out[labels] == (single, False)
+    assert out[other][0] == rec.build_ui_payload(*other) and out[other][0]
+
+    # the batch stored its payload for the single requests too
+    _not_recomputed(monkeypatch)
+    items, stale = rec.build_ui_payload_swr(*other)
+    assert items is out[other][0] and not stale
+
+
+def test_pages_are_served_stale(labels, payloads):
+    from app import app
+
+    client = app.test_client()
+    query = {"tech": labels[0], "scen": labels[1], "limit": 3}
+    first = client.get("/api/recommend", query_string=query).get_json()
+    assert "stale" not in first
+    second = client.get("/api/recommend", query_string=query).get_json()
+    assert second.pop("stale") is True
+    assert second == first
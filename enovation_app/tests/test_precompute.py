@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+import precompute
+import sparql_client
+from change_tracking import DatasetState, dataset_checksum
+from precompute import RecommendationStore, ontology_fingerprint
+
+EN = "http://www.semanticweb.org/eNOVATION-ontology#"
+
+
+def test_fingerprint_follows_content_not_counts():
+    before = DatasetState([("c1", EN + "trainsOnTechnology", "t1"), ("c2", EN + "trainsOnTechnology", "t2")])
+    after = DatasetState([("c1", EN + "trainsOnTechnology", "t2"), ("c2", EN + "trainsOnTechnology", "t2")])
+    same = DatasetState([("c2", EN + "trainsOnTechnology", "t2"), ("c1", EN + "trainsOnTechnology", "t1")])
+    assert ontology_fingerprint(before) != ontology_fingerprint(after)
+    assert ontology_fingerprint(before) == ontology_fingerprint(same)
+
+
+TURTLE = """
+@prefix en: <http://www.semanticweb.org/eNOVATION-ontology#> .
+@prefix owl: <http://www.w3.org/2002/07/owl#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+en:Centre rdfs:label "Training centre"@en ;
+    rdfs:subClassOf [ a owl:Restriction ; owl:onProperty en:usesTechnology ; owl:someValuesFrom en:%s ] .
+en:c1 a en:Centre ; rdfs:label "%s" ; en:usesTechnology en:t1 ; rdfs:comment "%s" .
+"""
+
+
+@pytest.fixture
+def checksum_of(tmp_path, monkeypatch):
+    """``dataset_checksum`` of TURTLE filled in with the given values, on the local backend."""
+    monkeypatch.setattr(sparql_client, "SPARQL_BACKEND", "local")
+
+    def checksum(restriction, label, comment="untracked"):
+        path = tmp_path / f"{restriction}-{label}-{comment}.ttl"
+        path.write_text(TURTLE % (restriction, label, comment), encoding="utf-8")
+        monkeypatch.setattr(sparql_client, "ONTOLOGY_FILE", str(path))
+        monkeypatch.setattr(sparql_client, "_backends", {})
+        return dataset_checksum()
+
+    return checksum
+
+
+def test_checksum_follows_the_tracked_content(checksum_of):
+    pytest.importorskip("rdflib")
+    base = checksum_of("t1", "Alpha")
+    assert base is not None and base.startswith("7:")
+    assert checksum_of("t1", "Alpha") == base
+    # same counts and lengths, different content
+    assert checksum_of("t1", "Alphb") != base
+    assert checksum_of("t2", "Alpha") != base
+    # rdfs:comment is not read by the recommender
+    assert checksum_of("t1", "Alpha", comment="edited") == base
+
+
+def test_freshness_is_checked_off_the_request_thread(tmp_path, monkeypatch):
+    store = RecommendationStore(str(tmp_path / "store.sqlite"))
+    store.set_meta("checksum", "abc")
+    release = threading.Event()
+
+    def slow_checksum():
+        release.wait(5)
+        return "abc"
+
+    monkeypatch.setattr(precompute, "_store", store)
+    monkeypatch.setattr(precompute, "_fresh_state", {"checked_at": float("-inf"), "fresh": None, "checking": False})
+    monkeypatch.setattr(precompute, "dataset_checksum", slow_checksum)
+
+    started = time.monotonic()
+    assert precompute.store_is_fresh() is False
+    assert precompute.store_is_fresh() is False
+    assert time.monotonic() - started < 1
+    release.set()
+    deadline = time.monotonic() + 5
+    while not precompute.store_is_fresh() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert precompute.store_is_fresh() is True
+
+    monkeypatch.setattr(precompute, "dataset_checksum", lambda: "changed")
+    assert precompute.check_store_freshness() is False
+    # an unreachable endpoint keeps the last verdict
+    monkeypatch.setattr(precompute, "dataset_checksum", lambda: None)
+    assert precompute.check_store_freshness() is False
@@ -0,0 +1,54 @@
+import pytest
+
+import enovation_recommender as rec
+
+
+@pytest.fixture(scope="module")
+def label_pairs(synthetic_pairs):
+    techs, scens = rec.get_option_labels()
+    return [(t, s) for t in techs for s in scens]
+
+
+@pytest.fixture(scope="module")
+def client(synthetic_graph):
+    from app import app
+
+    return app.test_client()
+
+
+def test_shared_values_batch_matches_single_pairs(label_pairs):
+    batch = rec._build_ui_payload_batch(label_pairs)
+    assert batch == {pair: rec._build_ui_payload(*pair) for pair in label_pairs}
+    assert any(items for items, _ in batch.values())
+
+
+def test_batch_endpoint_deduplicates_and_keeps_order(client, label_pairs):
+    (t1, s1), (t2, s2) = label_pairs[0], label_pairs[5]
+    pairs = [{"tech": t1, "scen": s1}, {"tech": t2, "scen": s2}, {"tech": t1, "scen": s1}, {"tech": "Unknown", "scen": s1}]
+    resp = client.post("/api/recommend/batch", json={"pairs": pairs, "top_k": 2})
+    assert resp.status_code == 200
+    results = resp.get_json()["results"]
+    assert [(r["tech"], r["scen"]) for r in results] == [(p["tech"], p["scen"]) for p in pairs]
+    assert results[0]["results"] == results[2]["results"]
+    assert results[3]["results"] == []
+    single = client.get("/api/recommend", query_string={"tech": t2, "scen": s2, "top_k": 2}).get_json()
+    assert results[1]["results"] == single["results"]
+
+
+@pytest.mark.parametrize("body", [
+    "not json",
+    {},
+    {"pairs": []},
+    {"pairs": [{"tech": "T"}]},
+    {"pairs": ["T"]},
+    {"pairs": [{"tech": "T", "scen": "S"}], "top_k": "many"},
+    {"pairs": [{"tech": "T", "scen": "S"}], "profile": "no-such-profile"},
+    {"pairs": [{"tech": "T", "scen": "S"}] * (rec.RECOMMEND_BATCH_MAX_PAIRS + 1)},
+])
+def test_batch_endpoint_rejects_bad_bodies(client, body):
+    if isinstance(body, str):
+        resp = client.post("/api/recommend/batch", data=body, content_type="application/json")
+    else:
+        resp = client.post("/api/recommend/batch", json=body)
+    assert resp.status_code == 400
+    assert "error" in resp.get_json()
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from result_cache import StaleWhileRevalidate, TTLCache, normalize_query
+
+
+def test_normalize_query_keeps_literals_and_iris():
+    query = 'SELECT ?s  # trailing comment\nWHERE {\n  ?s ?p "a  # not a comment" .\n  ?s ?q <http://x/#frag> }'
+    assert normalize_query(query) == 'SELECT ?s WHERE { ?s ?p "a  # not a comment" . ?s ?q <http://x/#frag> }'
+    assert normalize_query("SELECT  ?s\n\tWHERE {}") == normalize_query("SELECT ?s WHERE {}")
+
+
+def test_lru_eviction_and_expiry():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    cache.set("short", 4, ttl=-1)
+    assert cache.get("short") is None
+
+
+def test_get_or_compute_skips_uncacheable_values():
+    cache = TTLCache(max_entries=10, ttl=60)
+    assert cache.get_or_compute("k", lambda: {}, cacheable=bool) == {}
+    assert cache.get("k") is None
+    assert cache.get_or_compute("k", lambda: {"x": 1}, cacheable=bool) == {"x": 1}
+    assert cache.get("k") == {"x": 1}
+
+
+def test_concurrent_misses_compute_once():
+    cache = TTLCache(max_entries=10, ttl=60)
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+
+
+def _wait_for_refreshes(cache, count):
+    deadline = time.monotonic() + 5
+    while cache.stats()["refreshes"] < count:
+        assert time.monotonic() < deadline, "background refresh did not finish"
+        time.sleep(0.01)
+
+
+def test_get_many_computes_missing_keys_together_and_refreshes_stale_ones():
+    cache = StaleWhileRevalidate(max_entries=10, fresh_ttl=0.0, stale_ttl=60)
+    calls = []
+
+    def compute_many(keys):
+        calls.append(sorted(keys))
+        return {key: key.upper() for key in keys}
+
+    assert cache.get_many(["a", "b"], compute_many) == {"a": ("A", False), "b": ("B", False)}
+    # fresh_ttl=0: "a" and "b" are served stale and refreshed in one background call
+    assert cache.get_many(["a", "b", "c"], compute_many) == {"a": ("A", True), "b": ("B", True), "c": ("C", False)}
+    _wait_for_refreshes(cache, 2)
+    assert sorted(calls) == [["a", "b"], ["a", "b"], ["c"]]
+    assert cache.stats()["refresh_failures"] == 0
+
+
+def test_peek_does_not_compute_and_put_skips_unusable_values():
+    cache = StaleWhileRevalidate(max_entries=10, fresh_ttl=60, stale_ttl=60)
+    assert cache.peek("k", lambda: 1 / 0) is None
+    cache.put("k", [])
+    assert cache.peek("k", lambda: 1 / 0) is None
+    cache.put("k", [1])
+    assert cache.peek("k", lambda: 1 / 0) == ([1], False)
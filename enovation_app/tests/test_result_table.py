@@ -0,0 +1,80 @@
+from result_table import iter_lines, parse_term, parse_tsv, table_from_json
+
+XSD_INT = "http://www.w3.org/2001/XMLSchema#integer"
+
+
+def _tsv(*lines):
+    return parse_tsv(iter_lines([("\n".join(lines) + "\n").encode("utf-8")]), int_vars=("n",))
+
+
+def _same(a, b):
+    assert (a.vars, a.columns, a.langs) == (b.vars, b.columns, b.langs)
+
+
+def test_escapes_in_literals_and_iris():
+    assert parse_term(r'"a\tb\nc \"q\" \\ é\U0001F600"') == ('a\tb\nc "q" \\ é\U0001F600', "")
+    assert parse_term(r"<http://x/é>") == ("http://x/é", "")
+    table = _tsv("?s\t?l", '<http://x/a>\t"tab\\there"@en')
+    assert table.column("l") == ["tab\there"]
+    assert table.lang("l") == ["en"]
+
+
+def test_language_tags_from_a_later_row_are_backfilled():
+    table = _tsv("?l", '"plain"', '"typed"^^<http://www.w3.org/2001/XMLSchema#string>', '"Κέντρο"@el', '"again"')
+    assert table.column("l") == ["plain", "typed", "Κέντρο", "again"]
+    assert table.lang("l") == ["", "", "el", ""]
+    assert "l" in table.langs
+
+
+def test_unbound_values():
+    table = _tsv("?a\t?b", "\t<http://x/b>", "<http://x/a>\t", "<http://x/c>")
+    assert table.column("a") == [None, "http://x/a", "http://x/c"]
+    assert table.column("b") == ["http://x/b", None, None]
+
+
+def test_single_column_blank_line_is_an_unbound_row():
+    table = _tsv("?a", "<http://x/a>", "", "_:b0")
+    assert table.column("a") == ["http://x/a", None, "b0"]
+    assert len(table) == 3
+
+
+def test_int_vars_accept_typed_and_abbreviated_literals():
+    table = _tsv("?c\t?n", f'<http://x/a>\t"3"^^<{XSD_INT}>', "<http://x/b>\t4", "<http://x/c>\t", '<http://x/d>\t"x"')
+    assert table.column("n") == [3, 4, 0, 0]
+
+
+def test_multibyte_characters_split_across_chunks():
+    data = '?l\n"Εκπαιδευτικό κέντρο"@el\n"ok"\n'.encode("utf-8")
+    # every possible split point, including inside a two-byte character
+    for cut in range(1, len(data)):
+        lines = list(iter_lines([data[:cut], b"", data[cut:]]))
+        assert lines == ["?l", '"Εκπαιδευτικό κέντρο"@el', '"ok"']
+    table = parse_tsv(iter_lines([data[i:i + 3] for i in range(0, len(data), 3)]))
+    assert table.column("l") == ["Εκπαιδευτικό κέντρο", "ok"]
+
+
+def test_json_and_tsv_give_the_same_table():
+    json_result = {
+        "head": {"vars": ["s", "label", "n", "o"]},
+        "results": {"bindings": [
+            {
+                "s": {"type": "uri", "value": "http://x/a"},
+                "label": {"type": "literal", "value": "A\tb", "xml:lang": "en"},
+                "n": {"type": "literal", "value": "3", "datatype": XSD_INT},
+                "o": {"type": "bnode", "value": "b1"},
+            },
+            {
+                "s": {"type": "uri", "value": "http://x/é"},
+                "n": {"type": "literal", "value": "7", "datatype": XSD_INT},
+                "o": {"type": "literal", "value": "line\nbreak"},
+            },
+        ]},
+    }
+    tsv = _tsv(
+        "?s\t?label\t?n\t?o",
+        f'<http://x/a>\t"A\\tb"@en\t"3"^^<{XSD_INT}>\t_:b1',
+        '<http://x/\\u00E9>\t\t7\t"line\\nbreak"',
+    )
+    _same(tsv, table_from_json(json_result, int_vars=("n",)))
+    assert tsv.column("n") == [3, 7]
+    assert tsv.lang("label") == ["en", ""]
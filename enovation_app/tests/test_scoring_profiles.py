@@ -0,0 +1,116 @@
+import json
+import os
+import random
+
+import pytest
+
+import scoring_profiles
+from scoring_profiles import SCORE_KEYS, ProfileError, ProfileRegistry, ScoringProfile, weights_to_profile
+
+
+def _items(n, seed=1):
+    rng = random.Random(seed)
+    return [{"center_uri": f"c{i}", "scores": {k: rng.randint(0, 6) for k in SCORE_KEYS}} for i in range(n)]
+
+
+def _reference(items):
+    """The original hand-written AHP model."""
+    maxima = {k: max(item["scores"][k] for item in items) for k in SCORE_KEYS}
+    out = []
+    for item in items:
+        n = {k: item["scores"][k] / maxima[k] if maxima[k] else 0.0 for k in SCORE_KEYS}
+        core = ((n["tech_use_count"] + n["tech_train_count"]) / 2 + (n["incident_count"] + n["threat_cap_count"]) / 2) / 2
+        op = 0.35 * n["tech_use_count"] + 0.20 * n["tech_train_count"] + 0.25 * n["incident_count"] + 0.20 * n["threat_cap_count"]
+        tr = 0.60 * n["course_count"] + 0.40 * n["discipline_count"]
+        inf = 0.60 * n["facility_count"] + 0.40 * n["network_count"]
+        base = 0.65 * op + 0.15 * tr + 0.20 * inf
+        out.append(min(1.0, base * (0.5 + 0.5 * core ** 0.5) * 1.5))
+    return out
+
+
+def test_builtin_profile_matches_the_original_model():
+    items = _items(20)
+    ScoringProfile("builtin", {}).score(items)
+    for item, expected in zip(items, _reference(items)):
+        assert item["scores"]["final_score_0_1"] == pytest.approx(expected)
+
+
+def test_vectorized_scoring_matches_the_loop(monkeypatch):
+    pytest.importorskip("numpy")
+    profile = ScoringProfile("builtin", {})
+    looped, vectorized = _items(100), _items(100)
+    monkeypatch.setattr(scoring_profiles, "VECTORIZE_MIN_ITEMS", 10 ** 9)
+    profile.score(looped)
+    monkeypatch.setattr(scoring_profiles, "VECTORIZE_MIN_ITEMS", 1)
+    profile.score(vectorized)
+    for a, b in zip(looped, vectorized):
+        assert a["scores"].keys() == b["scores"].keys()
+        for k in a["scores"]:
+            assert a["scores"][k] == pytest.approx(b["scores"][k], rel=0, abs=1e-12)
+
+
+@pytest.mark.parametrize("profile", [
+    ScoringProfile("builtin", {}),
+    ScoringProfile("no_penalty", {"penalty": None, "fields": ["final_score_0_1", "core_score", "operational_fit"]}),
+])
+def test_score_matrix_matches_the_loop(monkeypatch, profile):
+    np = pytest.importorskip("numpy")
+    items = _items(200, seed=7)
+    # a column of zeros takes the max == 0 branch of the normalization
+    for item in items:
+        item["scores"]["network_count"] = 0
+    counts = np.array([[item["scores"][k] for k in SCORE_KEYS] for item in items], dtype=np.float64)
+    columns = profile.score_matrix(counts)
+    monkeypatch.setattr(scoring_profiles, "VECTORIZE_MIN_ITEMS", 10 ** 9)
+    profile.score(items)
+    assert set(columns) == set(items[0]["scores"]) - set(SCORE_KEYS)
+    for name, column in columns.items():
+        assert column.tolist() == pytest.approx([item["scores"][name] for item in items], rel=0, abs=1e-12)
+
+
+def test_top_matches_rank_order_with_ties():
+    profile = ScoringProfile("builtin", {})
+    items = _items(50, seed=3) + [{"center_uri": f"tie{i}", "scores": {k: 6 for k in SCORE_KEYS}} for i in range(3)]
+    ranked = list(items)
+    profile.rank(ranked)
+    assert [i["center_uri"] for i in profile.top(items, 10)] == [i["center_uri"] for i in ranked[:10]]
+
+
+def test_only_requested_fields_are_emitted():
+    profile = ScoringProfile("slim", {"fields": ["final_score_0_10"], "rank_by": "base_score_0_1", "penalty": None})
+    items = _items(3)
+    profile.score(items)
+    assert set(items[0]["scores"]) == set(SCORE_KEYS) | {"final_score_0_10", "base_score_0_1"}
+
+
+def test_invalid_profiles_are_rejected():
+    with pytest.raises(ProfileError):
+        ScoringProfile("bad", {"fields": ["no_such_field"]})
+    with pytest.raises(ProfileError):
+        ScoringProfile("bad", {"clusters": {"operational_fit": {"no_such_count": 1.0}}})
+
+
+def test_weights_to_profile_round_trips():
+    weights = [0.2, 0.1, 0.1, 0.1, 0.1, 0.1, 0.2, 0.1]
+    profile = ScoringProfile("learned", weights_to_profile(weights))
+    assert profile.criterion_weights() == pytest.approx(weights)
+
+
+def test_registry_reloads_changed_files_and_keeps_the_last_good_one(tmp_path):
+    path = tmp_path / "custom.json"
+    path.write_text(json.dumps({"version": 1, "rank_by": "base_score_0_1"}))
+    registry = ProfileRegistry(tmp_path)
+    assert registry.get("custom").version == 1
+
+    path.write_text(json.dumps({"version": 2, "rank_by": "base_score_0_1"}))
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10 ** 9))
+    assert registry.get("custom").version == 2
+
+    path.write_text("{ not json")
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10 ** 9))
+    assert registry.get("custom").version == 2
+
+    with pytest.raises(KeyError):
+        registry.get("missing")
+    with pytest.raises(KeyError):
+        registry.get("../custom")
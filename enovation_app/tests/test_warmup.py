@@ -0,0 +1,55 @@
+import pytest
+
+import enovation_recommender
+import warmup
+from label_index import LABEL_INDEX
+from warmup import WarmupState, run_warmup
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """Warm-up against an endpoint that answers nothing."""
+    monkeypatch.setattr(LABEL_INDEX, "refresh", lambda: False)
+    monkeypatch.setattr(enovation_recommender, "get_option_labels", lambda: ([], []))
+    monkeypatch.setattr(warmup, "hot_pairs", lambda limit: [])
+
+
+def test_failed_required_steps_leave_the_process_not_ready(offline):
+    state = run_warmup(WarmupState())
+    assert state.status == "degraded"
+    assert not state.ready
+    assert state.describe()["steps"]["label_index"] == {"done": True, "failed": True, "progress": None}
+
+
+def test_complete_warmup_is_ready(offline, monkeypatch):
+    monkeypatch.setattr(LABEL_INDEX, "refresh", lambda: True)
+    monkeypatch.setattr(enovation_recommender, "get_option_labels", lambda: (["Tech"], ["Scenario"]))
+    monkeypatch.setattr(enovation_recommender, "get_uri_for_label", lambda label: None)
+    state = run_warmup(WarmupState())
+    # unresolved URIs are reported but do not block readiness
+    assert state.status == "done" and state.ready
+    assert state.errors == ["uris: 2 labels without a URI"]
+
+
+def test_ready_endpoint_retries_a_degraded_warmup(offline, monkeypatch):
+    import app
+
+    state = WarmupState()
+    monkeypatch.setattr(warmup, "STATE", state)
+    monkeypatch.setattr(app, "WARMUP_STATE", state)
+    monkeypatch.setattr(warmup, "WARMUP", "sync")
+    client = app.app.test_client()
+
+    assert client.get("/ready").status_code == 503
+    assert state.status == "degraded" and state.attempts == 1
+    # within WARMUP_RETRY_AFTER: no new attempt
+    assert client.get("/ready").status_code == 503
+    assert state.attempts == 1
+
+    monkeypatch.setattr(warmup, "WARMUP_RETRY_AFTER", 0)
+    monkeypatch.setattr(LABEL_INDEX, "refresh", lambda: True)
+    monkeypatch.setattr(enovation_recommender, "get_option_labels", lambda: (["Tech"], ["Scenario"]))
+    monkeypatch.setattr(enovation_recommender, "get_uri_for_label", lambda label: "urn:x")
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.get_json()["attempts"] == 2
@@ -0,0 +1,227 @@
+"""
+Warm-up at application start.
+
+Before the first user request pays for cold caches, ``start_warmup``:
+
+1. loads the rdfs:label index
+2. fetches the technology and scenario option lists (kept by
+   ``get_option_labels`` for ``OPTIONS_CACHE_TTL`` seconds)
+3. resolves the URI of every option label
+4. computes the ``WARMUP_TOP_PAIRS`` technology/scenario pairs asked about
+   most often in the feedback log (rotated files included), so their engine
+   and details queries are in the result cache; pairs the precomputed store
+   already answers are skipped (its freshness is checked first)
+
+``WARMUP`` selects how: ``background`` (default) runs it in a daemon thread
+so the server starts listening at once, ``sync`` blocks until it is done,
+``off`` skips it.  ``/ready`` reports the progress and answers 503 until the
+warm-up has finished, so a load balancer only routes traffic to warm
+processes; under a WSGI server that never runs ``app.py`` as a script, the
+first ``/ready`` probe starts it.  A failing step is recorded and the
+warm-up carries on, but unless the label index and the option lists
+(``REQUIRED_STEPS``) loaded it ends ``degraded``: ``/ready`` keeps answering
+503 and a later probe runs the warm-up again, at most every
+``WARMUP_RETRY_AFTER`` seconds.
+"""
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+WARMUP = os.getenv("WARMUP", "background")
+WARMUP_TOP_PAIRS = int(os.getenv("WARMUP_TOP_PAIRS", "20"))
+WARMUP_RETRY_AFTER = float(os.getenv("WARMUP_RETRY_AFTER", "30"))
+
+STEPS = ["label_index", "options", "uris", "pairs"]
+# Without these the process would only answer from cold caches (or not at all)
+REQUIRED_STEPS = ["label_index", "options"]
+
+
+class WarmupState:
+    """Progress of the warm-up, read by ``/ready``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = "pending"
+        self.step: Optional[str] = None
+        self.done_steps: List[str] = []
+        self.failed_steps: List[str] = []
+        self.errors: List[str] = []
+        self.progress: Dict[str, Tuple[int, int]] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.attempts = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("done", "skipped")
+
+    def begin(self, step: str, total: Optional[int] = None) -> None:
+        """Enter ``step``; ``total`` is the number of items it will ``advance`` through, if counted."""
+        with self._lock:
+            self.step = step
+            if total is not None:
+                self.progress[step] = (0, total)
+
+    def advance(self, step: str) -> None:
+        with self._lock:
+            done, total = self.progress.get(step, (0, 0))
+            self.progress[step] = (done + 1, total)
+
+    def end(self, step: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.done_steps.append(step)
+            if error:
+                self.failed_steps.append(step)
+                self.errors.append(f"{step}: {error}")
+
+    def restart(self) -> None:
+        """Forget the progress of a previous attempt."""
+        with self._lock:
+            self.step = None
+            self.done_steps = []
+            self.failed_steps = []
+            self.errors = []
+            self.progress = {}
+            self.finished_at = None
+
+    def finish(self) -> None:
+        """``done``, or ``degraded`` if a required step failed or never ran."""
+        with self._lock:
+            self.step = None
+            self.finished_at = time.monotonic()
+            complete = all(s in self.done_steps and s not in self.failed_steps for s in REQUIRED_STEPS)
+            self.status = "done" if complete else "degraded"
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = None
+            if self.started_at is not None:
+                elapsed = round((self.finished_at or time.monotonic()) - self.started_at, 3)
+            return {
+                "ready": self.ready,
+                "status": self.status,
+                "step": self.step,
+                "steps": {
+                    s: {
+                        "done": s in self.done_steps,
+                        "failed": s in self.failed_steps,
+                        "progress": list(self.progress[s]) if s in self.progress else None,
+                    }
+                    for s in STEPS
+                },
+                "errors": list(self.errors),
+                "attempts": self.attempts,
+                "elapsed_seconds": elapsed,
+            }
+
+
+STATE = WarmupState()
+_start_lock = threading.Lock()
+
+
+def hot_pairs(limit: int) -> List[Tuple[str, str]]:
+    """The ``limit`` (tech, scenario) label pairs with the most feedback records, most frequent first."""
+    from feedback_writer import FEEDBACK_FILE, iter_records, log_files
+
+    counts: Counter = Counter()
+    for record in iter_records(log_files(FEEDBACK_FILE)):
+        tech, scen = record.get("tech"), record.get("scenario")
+        if isinstance(tech, str) and isinstance(scen, str) and tech and scen:
+            counts[(tech, scen)] += 1
+    return [pair for pair, _ in counts.most_common(limit)]
+
+
+def run_warmup(state: WarmupState = STATE) -> WarmupState:
+    from enovation_recommender import DETAILS_PREFETCH_TOP_K, build_ui_payload, get_option_labels, get_uri_for_label
+    from label_index import LABEL_INDEX
+    from precompute import check_store_freshness, get_precomputed
+
+    state.status = "running"
+    state.restart()
+    state.attempts += 1
+    state.started_at = time.monotonic()
+
+    state.begin("label_index")
+    loaded = LABEL_INDEX.refresh()
+    state.end("label_index", None if loaded else "label index could not be loaded")
+
+    state.begin("options")
+    tech_labels: List[str] = []
+    scen_labels: List[str] = []
+    try:
+        tech_labels, scen_labels = get_option_labels()
+        state.end("options", None if tech_labels or scen_labels else "option queries returned nothing")
+    except Exception as e:
+        state.end("options", str(e))
+
+    labels = list(dict.fromkeys(tech_labels + scen_labels))
+    state.begin("uris", len(labels))
+    missing = 0
+    for label in labels:
+        if not get_uri_for_label(label):
+            missing += 1
+        state.advance("uris")
+    state.end("uris", f"{missing} labels without a URI" if missing else None)
+
+    pairs: List[Tuple[str, str]] = []
+    try:
+        offered_t, offered_s = set(tech_labels), set(scen_labels)
+        # labels no longer offered by the UI are not worth computing
+        pairs = [(t, s) for t, s in hot_pairs(WARMUP_TOP_PAIRS) if t in offered_t and s in offered_s]
+    except OSError as e:
+        state.errors.append(f"pairs: cannot read feedback log: {e}")
+    state.begin("pairs", len(pairs))
+    if pairs:
+        check_store_freshness()
+    failed = 0
+    for tech, scen in pairs:
+        try:
+            if get_precomputed(tech, scen) is None:
+                build_ui_payload(tech, scen, top_k=DETAILS_PREFETCH_TOP_K)
+        except Exception as e:
+            failed += 1
+            print(f"[warmup] ERROR computing {tech!r} × {scen!r}: {e}")
+        state.advance("pairs")
+    state.end("pairs", f"{failed} pairs failed" if failed else None)
+
+    state.finish()
+    print(
+        f"[warmup] {state.status} in {state.finished_at - state.started_at:.1f}s: {len(labels)} option labels, "
+        f"{len(pairs)} hot pairs" + (f", errors: {'; '.join(state.errors)}" if state.errors else "")
+    )
+    return state
+
+
+def start_warmup(mode: Optional[str] = None) -> WarmupState:
+    """
+    Start the warm-up once per process, as configured by ``WARMUP`` (or
+    ``mode``); again after a ``degraded`` one, once ``WARMUP_RETRY_AFTER``
+    seconds have passed.
+    """
+    mode = mode or WARMUP
+    with _start_lock:
+        if STATE.status == "degraded":
+            if time.monotonic() - (STATE.finished_at or 0.0) < WARMUP_RETRY_AFTER:
+                return STATE
+        elif STATE.status != "pending":
+            return STATE
+        if mode == "off":
+            STATE.status = "skipped"
+            return STATE
+        STATE.status = "running"
+    if mode == "sync":
+        run_warmup(STATE)
+    else:
+        threading.Thread(target=_run_safely, name="warmup", daemon=True).start()
+    return STATE
+
+
+def _run_safely() -> None:
+    try:
+        run_warmup(STATE)
+    except Exception as e:
+        print(f"[warmup] ERROR: {e}")
+        STATE.errors.append(str(e))
+        STATE.finish()
@@ -0,0 +1,13 @@
+"""
+WSGI entry point for production serving, e.g.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Each worker process imports this module once and starts its own warm-up
+(``WARMUP``); with ``SHARED_CACHE`` the workers after the first one find
+most warm-up queries already answered in the shared cache.
+"""
+from app import app
+from warmup import start_warmup
+
+start_warmup()